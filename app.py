@@ -1,19 +1,25 @@
 from flask import Flask, request, jsonify
 from cell_loader import load_cells
+from dispatcher import CellDispatcher
 import os
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
 import psycopg2
+from db_pool import ConnectionPool
+from auth_cache import ApiKeyCache
+from last_login import LastLoginTracker
+from usage_logger import UsageLogger
+from fingerprint import Fingerprinter
+from binary_ingest import BinaryIngestError, is_binary, parse_flask_request
+from stream_server import StreamServer
 from datetime import datetime, timedelta
-import hashlib
-import shutil
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-import threading
 import redis
 import jwt
 from functools import wraps
+import atexit
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -28,8 +34,12 @@ limiter = Limiter(
     default_limits=["200 per day", "50 per hour"]
 )
 
+# Shared per-worker connection pool; handlers borrow with `with get_db() as conn:`
+db_pool = ConnectionPool(os.getenv('DATABASE_URL'))
+atexit.register(db_pool.close_all)
+
 def get_db():
-    return psycopg2.connect(os.getenv('DATABASE_URL'))
+    return db_pool.connection()
 
 # Database setup
 def init_db():
@@ -57,6 +67,10 @@ def init_db():
                     execution_time FLOAT
                 )
             """)
+            # One usage row covers a whole batch of inputs
+            cur.execute("""
+                ALTER TABLE cell_usage ADD COLUMN IF NOT EXISTS batch_size INTEGER DEFAULT 1
+            """)
         
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS user_sessions (
@@ -70,7 +84,6 @@ def init_db():
             """)
         
             conn.commit()
-        conn.close()
 
 # JWT Authentication
 def generate_jwt(user_id):
@@ -89,36 +102,77 @@ def verify_jwt(token):
     except jwt.InvalidTokenError:
         raise ValueError("Invalid token")
 
+# API key resolution, cached per worker so hot calls skip the database
+api_key_cache = ApiKeyCache(redis_url=os.getenv('REDIS_URL'))
+
+# users.last_login is written behind in batches instead of once per request
+last_login_tracker = LastLoginTracker(get_db)
+atexit.register(last_login_tracker.shutdown)
+
+# cell_usage / user_sessions rows are queued and written in batches
+usage_logger = UsageLogger(get_db)
+atexit.register(usage_logger.shutdown)
+fingerprinter = Fingerprinter()
+
+def resolve_api_key(api_key):
+    """Returns the identity dict for `api_key`, or None if the key is unknown"""
+    identity = api_key_cache.get(api_key)
+    if identity is not None:
+        return identity
+
+    generation = api_key_cache.generation()
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, username FROM users WHERE api_key = %s
+            """, (api_key,))
+            user = cur.fetchone()
+            if not user:
+                return None
+
+    identity = {
+        'user_id': user[0],
+        'username': user[1],
+        'permissions': ['cells:execute'],
+        'expires_at': None
+    }
+    api_key_cache.put(api_key, identity, generation=generation)
+    return identity
+
 # Authentication decorators
 def require_api_key(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         api_key = request.headers.get('X-API-Key')
-        print(f"Verifying API key: {api_key}")
         if not api_key:
             return jsonify({"error": "API key required"}), 401
-            
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT id, username FROM users WHERE api_key = %s
-                """, (api_key,))
-                user = cur.fetchone()
-                print(f"Verifying User: {user}")
-                if not user:
-                    return jsonify({"error": "Invalid API key"}), 401
-                
-                cur.execute("""
-                    UPDATE users SET last_login = NOW() WHERE id = %s
-                """, (user[0],))
-                conn.commit()
-                
-                request.user_id = user[0]
-                request.username = user[1]
-                print(f"Verified")
+
+        identity = resolve_api_key(api_key)
+        if identity is None:
+            return jsonify({"error": "Invalid API key"}), 401
+
+        last_login_tracker.touch(identity['user_id'])
+        request.user_id = identity['user_id']
+        request.username = identity['username']
         return f(*args, **kwargs)
     return decorated_function
 
+def require_internal(f):
+    """
+    Operational endpoints: loopback callers, or anyone presenting
+    METRICS_TOKEN in X-Metrics-Token when that is configured
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = os.getenv('METRICS_TOKEN')
+        supplied = request.headers.get('X-Metrics-Token')
+        if token and supplied and secrets.compare_digest(token, supplied):
+            return f(*args, **kwargs)
+        if request.remote_addr in ('127.0.0.1', '::1'):
+            return f(*args, **kwargs)
+        return jsonify({"error": "Forbidden"}), 403
+    return decorated_function
+
 # CORS Configuration
 CORS(app, resources={
     r"/ai-api": {
@@ -128,7 +182,8 @@ CORS(app, resources={
             "http://localhost:*"
         ],
         "methods": ["POST", "OPTIONS", "GET"],
-        "allow_headers": ["Content-Type", "X-API-Key", "X-Session-Id", "X-Request-Id"],
+        "allow_headers": ["Content-Type", "X-API-Key", "X-Session-Id", "X-Request-Id",
+                          "X-Cells", "X-Image-Shape", "X-Image-Dtype", "X-Image-Field", "X-Cell-Data"],
         "supports_credentials": True
     },
     r"/register": {
@@ -160,15 +215,36 @@ CORS(app, resources={
 CELLS_DIR = os.path.join(os.path.dirname(__file__), "cells")
 ai_cells = load_cells(CELLS_DIR)
 
-# User isolation lock
-user_locks = threading.Lock()
-user_lock_dict = {}
+# Cell execution; locking follows each cell's CONCURRENCY policy
+dispatcher = CellDispatcher(ai_cells, logger=app.logger)
+atexit.register(dispatcher.shutdown)
 
-def get_user_lock(user_id):
-    with user_locks:
-        if user_id not in user_lock_dict:
-            user_lock_dict[user_id] = threading.Lock()
-        return user_lock_dict[user_id]
+# WebSocket endpoint for high-rate callers: authenticate once, then stream invocations
+stream_server = StreamServer(
+    dispatcher,
+    resolve_api_key,
+    usage_logger=usage_logger,
+    fingerprinter=fingerprinter,
+    last_login_tracker=last_login_tracker,
+    logger=app.logger,
+    api_key_cache=api_key_cache
+)
+atexit.register(stream_server.shutdown)
+
+def start_stream_server():
+    """
+    Starts the stream server in this process unless it is the debug
+    reloader's watcher, which serves nothing (the child it spawns runs this
+    module again with WERKZEUG_RUN_MAIN set). Set STREAM_PORT=0 to disable.
+    """
+    if __name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return
+    stream_server.start()
+
+# At import for gunicorn workers, `flask run` and `python app.py`; before each
+# request for workers forked from a preloaded app (a no-op once running)
+start_stream_server()
+app.before_request(start_stream_server)
 
 # Core API Endpoint
 @app.route('/ai-api', methods=['POST'])
@@ -176,78 +252,38 @@ def get_user_lock(user_id):
 @require_api_key
 def handle_request():
     try:
-        request_data = request.json
         user_id = request.user_id
         session_id = request.headers.get('X-Session-Id', secrets.token_hex(16))
-        cell_names = request_data.get("cells", [])
-        input_data = request_data.get("data", {})
+        if is_binary(request.mimetype):
+            # Images uploaded as bytes reach the cells as NumPy arrays
+            try:
+                cell_names, input_data = parse_flask_request(request)
+            except BinaryIngestError as e:
+                return jsonify({"error": str(e)}), 400
+        else:
+            request_data = request.json
+            cell_names = request_data.get("cells", [])
+            input_data = request_data.get("data", {})
         
         # Validate input
         if not cell_names or not isinstance(cell_names, list):
             return jsonify({"error": "Invalid cells parameter"}), 400
         
-        # Get user-specific lock
-        user_lock = get_user_lock(user_id)
-        
-        results = {}
-        execution_times = {}
-        
-        with user_lock:
-            for cell_name in cell_names:
-                if cell_name not in ai_cells:
-                    continue
-                    
-                try:
-                    work_dir = f"/tmp/cell_{user_id}_{session_id}"
-                    os.makedirs(work_dir, exist_ok=True)
-                    
-                    cell_input = input_data.get(cell_name, {})
-                    cell_input['_user_context'] = {
-                        'user_id': user_id,
-                        'session_id': session_id,
-                        'timestamp': datetime.utcnow().isoformat()
-                    }
-                    
-                    start_time = datetime.utcnow()
-                    results[cell_name] = ai_cells[cell_name](cell_input)
-                    exec_time = (datetime.utcnow() - start_time).total_seconds()
-                    execution_times[cell_name] = exec_time
-                    
-                except Exception as e:
-                    app.logger.error(f"Cell {cell_name} error for user {user_id}: {str(e)}")
-                    results[cell_name] = {"error": str(e)}
-                finally:
-                    shutil.rmtree(work_dir, ignore_errors=True)
+        results, execution_times, batch_sizes = dispatcher.run(cell_names, input_data, user_id, session_id)
         
-        # Log usage
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                for cell_name, exec_time in execution_times.items():
-                    input_hash = hashlib.sha256(
-                        str(input_data.get(cell_name, {})).encode()
-                    ).hexdigest()
-                    
-                    cur.execute("""
-                        INSERT INTO cell_usage 
-                        (user_id, cell_name, input_hash, session_id, execution_time)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, (user_id, cell_name, input_hash, session_id, exec_time))
-                
-                # Update session activity
-                cur.execute("""
-                    INSERT INTO user_sessions 
-                    (session_id, user_id, ip_address, user_agent, last_active)
-                    VALUES (%s, %s, %s, %s, NOW())
-                    ON CONFLICT (session_id) 
-                    DO UPDATE SET last_active = NOW()
-                """, (
-                    session_id,
-                    user_id,
-                    request.remote_addr,
-                    request.headers.get('User-Agent')
-                ))
-                
-                conn.commit()
+        # Log usage; written in batches by a background thread, which
+        # also computes the input fingerprints from the raw body
+        fingerprint = fingerprinter.for_request(request.get_data(cache=True), execution_times)
+        usage_logger.log_request(
+            user_id,
+            session_id,
+            request.remote_addr,
+            request.headers.get('User-Agent'),
+            [
+                (cell_name, fingerprint.cell(cell_name), exec_time, batch_sizes.get(cell_name, 1))
+                for cell_name, exec_time in execution_times.items()
+            ]
+        )
         
         return jsonify({
             "success": True,
@@ -337,6 +373,9 @@ def login():
                     (new_api_key, user[0])
                 )
                 conn.commit()
+
+        # The previous key stops working in every worker immediately
+        api_key_cache.invalidate_user(user[0])
         
         return jsonify({
             "success": True,
@@ -376,7 +415,9 @@ def list_cells():
     return jsonify({
         "success": True,
         "available_cells": list(ai_cells.keys()),
-        "count": len(ai_cells)
+        "count": len(ai_cells),
+        "cells": ai_cells.status(),
+        "load_failures": ai_cells.failures
     })
 
 @app.route('/ping', methods=['GET'])
@@ -388,6 +429,19 @@ def ping():
         "cells_loaded": len(ai_cells)
     }))
 
+@app.route('/metrics', methods=['GET'])
+@limiter.limit("10000 per minute")
+@require_internal
+def metrics():
+    return jsonify({
+        "db_pool": db_pool.stats(),
+        "api_key_cache": api_key_cache.stats(),
+        "last_login": last_login_tracker.stats(),
+        "usage_logger": usage_logger.stats(),
+        "stream": stream_server.stats(),
+        "dispatcher": dispatcher.stats()
+    })
+
 @app.route('/usage', methods=['GET'])
 @require_api_key
 @limiter.limit("10000 per minute")
@@ -401,14 +455,15 @@ def get_usage():
                 # Get user's cell usage stats
                 cur.execute("""
                     SELECT cell_name, COUNT(*) as count, 
-                    AVG(execution_time) as avg_time 
+                    AVG(execution_time) as avg_time,
+                    SUM(COALESCE(batch_size, 1)) as inputs
                     FROM cell_usage 
                     WHERE user_id = %s
                     GROUP BY cell_name
                     ORDER BY count DESC
                 """, (request.user_id,))
                 usage_stats = [
-                    {"cell": row[0], "count": row[1], "avg_time": row[2]} 
+                    {"cell": row[0], "count": row[1], "avg_time": row[2], "inputs": row[3]} 
                     for row in cur.fetchall()
                 ]
                 
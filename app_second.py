@@ -1,17 +1,21 @@
 from flask import Flask, request, jsonify
 from cell_loader import load_cells
+from dispatcher import CellDispatcher
 import os
 from flask_cors import CORS
 import secrets
-import psycopg2
+from db_pool import ConnectionPool
+from auth_cache import ApiKeyCache
+from last_login import LastLoginTracker
+from usage_logger import UsageLogger
+from fingerprint import Fingerprinter
+from binary_ingest import BinaryIngestError, is_binary, parse_flask_request
+from stream_server import StreamServer
 from datetime import datetime, timedelta
-import hashlib
-import shutil
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-import threading
-import jwt
 from functools import wraps
+import atexit
 import requests
 import json
 
@@ -39,8 +43,12 @@ limiter = Limiter(
     default_limits=["200 per day", "50 per hour"]
 )
 
+# Shared per-worker connection pool; handlers borrow with `with get_db() as conn:`
+db_pool = ConnectionPool(os.getenv('DATABASE_URL'))
+atexit.register(db_pool.close_all)
+
 def get_db():
-    return psycopg2.connect(os.getenv('DATABASE_URL'))
+    return db_pool.connection()
 
 # Database setup with Pi Network integration
 def init_db():
@@ -74,6 +82,10 @@ def init_db():
                     execution_time FLOAT
                 )
             """)
+            # One usage row covers a whole batch of inputs
+            cur.execute("""
+                ALTER TABLE cell_usage ADD COLUMN IF NOT EXISTS batch_size INTEGER DEFAULT 1
+            """)
         
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS user_sessions (
@@ -100,7 +112,6 @@ def init_db():
             """)
         
             conn.commit()
-        conn.close()
 
 # Pi Network OAuth functions
 def get_pi_auth_url(state):
@@ -155,6 +166,65 @@ def get_pi_user_info(access_token):
         app.logger.error(f"User info error: {str(e)}")
         return None
 
+# API key resolution, cached per worker so hot calls skip the database
+api_key_cache = ApiKeyCache(redis_url=os.getenv('REDIS_URL'))
+
+# users.last_login is written behind in batches instead of once per request
+last_login_tracker = LastLoginTracker(get_db)
+atexit.register(last_login_tracker.shutdown)
+
+# cell_usage / user_sessions rows are queued and written in batches
+usage_logger = UsageLogger(get_db)
+atexit.register(usage_logger.shutdown)
+fingerprinter = Fingerprinter()
+
+def resolve_api_key(api_key):
+    """Returns the identity dict for `api_key`, or None if the key is unknown, inactive or expired"""
+    identity = api_key_cache.get(api_key)
+    if identity is not None:
+        return identity
+
+    generation = api_key_cache.generation()
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            # Check both users table (legacy) and api_keys table
+            cur.execute("""
+                SELECT u.id, u.username, u.pi_user_id, ak.permissions, ak.expires_at,
+                       EXTRACT(EPOCH FROM (ak.expires_at - NOW()))
+                FROM api_keys ak
+                JOIN users u ON ak.user_id = u.id
+                WHERE ak.api_key = %s AND ak.is_active = TRUE
+                AND (ak.expires_at IS NULL OR ak.expires_at > NOW())
+            """, (api_key,))
+            api_key_info = cur.fetchone()
+
+            if not api_key_info:
+                # Fallback to legacy user api_key
+                cur.execute("""
+                    SELECT id, username, pi_user_id FROM users 
+                    WHERE api_key = %s AND is_active = TRUE
+                """, (api_key,))
+                user = cur.fetchone()
+                if not user:
+                    return None
+
+                api_key_info = (user[0], user[1], user[2], '["cells:execute"]', None, None)
+
+    permissions = api_key_info[3]
+    if isinstance(permissions, str):  # JSONB arrives decoded, the legacy fallback doesn't
+        permissions = json.loads(permissions)
+
+    identity = {
+        'user_id': api_key_info[0],
+        'username': api_key_info[1],
+        'pi_user_id': api_key_info[2],
+        'permissions': permissions or ["cells:execute"],
+        'expires_at': api_key_info[4].isoformat() if api_key_info[4] else None
+    }
+    expires_in = float(api_key_info[5]) if api_key_info[5] is not None else None
+    api_key_cache.put(api_key, identity, generation=generation, expires_in=expires_in)
+    return identity
+
 # Authentication decorators
 def require_api_key(f):
     @wraps(f)
@@ -162,43 +232,35 @@ def require_api_key(f):
         api_key = request.headers.get('X-API-Key')
         if not api_key:
             return jsonify({"error": "API key required"}), 401
-            
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                # Check both users table (legacy) and api_keys table
-                cur.execute("""
-                    SELECT u.id, u.username, u.pi_user_id, ak.permissions, ak.expires_at
-                    FROM api_keys ak
-                    JOIN users u ON ak.user_id = u.id
-                    WHERE ak.api_key = %s AND ak.is_active = TRUE
-                    AND (ak.expires_at IS NULL OR ak.expires_at > NOW())
-                """, (api_key,))
-                api_key_info = cur.fetchone()
-                
-                if not api_key_info:
-                    # Fallback to legacy user api_key
-                    cur.execute("""
-                        SELECT id, username, pi_user_id FROM users 
-                        WHERE api_key = %s AND is_active = TRUE
-                    """, (api_key,))
-                    user = cur.fetchone()
-                    if not user:
-                        return jsonify({"error": "Invalid API key"}), 401
-                    
-                    api_key_info = (user[0], user[1], user[2], '["cells:execute"]', None)
-                
-                request.user_id = api_key_info[0]
-                request.username = api_key_info[1]
-                request.pi_user_id = api_key_info[2]
-                request.permissions = json.loads(api_key_info[3]) if api_key_info[3] else ["cells:execute"]
-                
-                # Update last login
-                cur.execute("UPDATE users SET last_login = NOW() WHERE id = %s", (request.user_id,))
-                conn.commit()
-                
+
+        identity = resolve_api_key(api_key)
+        if identity is None:
+            return jsonify({"error": "Invalid API key"}), 401
+
+        last_login_tracker.touch(identity['user_id'])
+        request.user_id = identity['user_id']
+        request.username = identity['username']
+        request.pi_user_id = identity['pi_user_id']
+        request.permissions = identity['permissions']
         return f(*args, **kwargs)
     return decorated_function
 
+def require_internal(f):
+    """
+    Operational endpoints: loopback callers, or anyone presenting
+    METRICS_TOKEN in X-Metrics-Token when that is configured
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = os.getenv('METRICS_TOKEN')
+        supplied = request.headers.get('X-Metrics-Token')
+        if token and supplied and secrets.compare_digest(token, supplied):
+            return f(*args, **kwargs)
+        if request.remote_addr in ('127.0.0.1', '::1'):
+            return f(*args, **kwargs)
+        return jsonify({"error": "Forbidden"}), 403
+    return decorated_function
+
 # CORS Configuration
 CORS(app, resources={
     r"/.*": {
@@ -209,7 +271,8 @@ CORS(app, resources={
             "http://127.0.0.1:*"
         ],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "X-API-Key", "X-Session-Id", "X-Request-Id"],
+        "allow_headers": ["Content-Type", "X-API-Key", "X-Session-Id", "X-Request-Id",
+                          "X-Cells", "X-Image-Shape", "X-Image-Dtype", "X-Image-Field", "X-Cell-Data"],
         "supports_credentials": True
     }
 })
@@ -218,15 +281,36 @@ CORS(app, resources={
 CELLS_DIR = os.path.join(os.path.dirname(__file__), "cells")
 ai_cells = load_cells(CELLS_DIR)
 
-# User isolation lock
-user_locks = threading.Lock()
-user_lock_dict = {}
+# Cell execution; locking follows each cell's CONCURRENCY policy
+dispatcher = CellDispatcher(ai_cells, logger=app.logger)
+atexit.register(dispatcher.shutdown)
+
+# WebSocket endpoint for high-rate callers: authenticate once, then stream invocations
+stream_server = StreamServer(
+    dispatcher,
+    resolve_api_key,
+    usage_logger=usage_logger,
+    fingerprinter=fingerprinter,
+    last_login_tracker=last_login_tracker,
+    logger=app.logger,
+    api_key_cache=api_key_cache
+)
+atexit.register(stream_server.shutdown)
 
-def get_user_lock(user_id):
-    with user_locks:
-        if user_id not in user_lock_dict:
-            user_lock_dict[user_id] = threading.Lock()
-        return user_lock_dict[user_id]
+def start_stream_server():
+    """
+    Starts the stream server in this process unless it is the debug
+    reloader's watcher, which serves nothing (the child it spawns runs this
+    module again with WERKZEUG_RUN_MAIN set). Set STREAM_PORT=0 to disable.
+    """
+    if __name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return
+    stream_server.start()
+
+# At import for gunicorn workers, `flask run` and `python app_second.py`; before
+# each request for workers forked from a preloaded app (a no-op once running)
+start_stream_server()
+app.before_request(start_stream_server)
 
 # Pi Network Authentication Endpoints
 @app.route('/auth/pi/url', methods=['GET'])
@@ -418,6 +502,9 @@ def revoke_api_key(key_prefix):
                     return jsonify({"error": "API key not found"}), 404
                 
                 conn.commit()
+
+        # Revoked keys must stop working in every worker, not just after the cache TTL
+        api_key_cache.invalidate_user(request.user_id)
         
         return jsonify({"success": True, "message": "API key revoked"})
     except Exception as e:
@@ -433,72 +520,38 @@ def handle_request():
         if 'cells:execute' not in request.permissions:
             return jsonify({"error": "Insufficient permissions"}), 403
             
-        request_data = request.json
         user_id = request.user_id
         session_id = request.headers.get('X-Session-Id', secrets.token_hex(16))
-        cell_names = request_data.get("cells", [])
-        input_data = request_data.get("data", {})
+        if is_binary(request.mimetype):
+            # Images uploaded as bytes reach the cells as NumPy arrays
+            try:
+                cell_names, input_data = parse_flask_request(request)
+            except BinaryIngestError as e:
+                return jsonify({"error": str(e)}), 400
+        else:
+            request_data = request.json
+            cell_names = request_data.get("cells", [])
+            input_data = request_data.get("data", {})
         
         # Validate input
         if not cell_names or not isinstance(cell_names, list):
             return jsonify({"error": "Invalid cells parameter"}), 400
         
-        # Get user-specific lock
-        user_lock = get_user_lock(user_id)
+        results, execution_times, batch_sizes = dispatcher.run(cell_names, input_data, user_id, session_id)
         
-        results = {}
-        execution_times = {}
-        
-        with user_lock:
-            for cell_name in cell_names:
-                if cell_name not in ai_cells:
-                    continue
-                    
-                try:
-                    work_dir = f"/tmp/cell_{user_id}_{session_id}"
-                    os.makedirs(work_dir, exist_ok=True)
-                    
-                    cell_input = input_data.get(cell_name, {})
-                    cell_input['_user_context'] = {
-                        'user_id': user_id,
-                        'session_id': session_id,
-                        'timestamp': datetime.utcnow().isoformat()
-                    }
-                    
-                    start_time = datetime.utcnow()
-                    results[cell_name] = ai_cells[cell_name](cell_input)
-                    exec_time = (datetime.utcnow() - start_time).total_seconds()
-                    execution_times[cell_name] = exec_time
-                    
-                except Exception as e:
-                    app.logger.error(f"Cell {cell_name} error for user {user_id}: {str(e)}")
-                    results[cell_name] = {"error": str(e)}
-                finally:
-                    shutil.rmtree(work_dir, ignore_errors=True)
-        
-        # Log usage
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                for cell_name, exec_time in execution_times.items():
-                    input_hash = hashlib.sha256(
-                        str(input_data.get(cell_name, {})).encode()
-                    ).hexdigest()
-                    
-                    cur.execute("""
-                        INSERT INTO cell_usage 
-                        (user_id, cell_name, input_hash, session_id, execution_time)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, (user_id, cell_name, input_hash, session_id, exec_time))
-                
-                cur.execute("""
-                    INSERT INTO user_sessions 
-                    (session_id, user_id, ip_address, user_agent, last_active)
-                    VALUES (%s, %s, %s, %s, NOW())
-                    ON CONFLICT (session_id) 
-                    DO UPDATE SET last_active = NOW()
-                """, (session_id, user_id, request.remote_addr, request.headers.get('User-Agent')))
-                
-                conn.commit()
+        # Log usage; written in batches by a background thread, which
+        # also computes the input fingerprints from the raw body
+        fingerprint = fingerprinter.for_request(request.get_data(cache=True), execution_times)
+        usage_logger.log_request(
+            user_id,
+            session_id,
+            request.remote_addr,
+            request.headers.get('User-Agent'),
+            [
+                (cell_name, fingerprint.cell(cell_name), exec_time, batch_sizes.get(cell_name, 1))
+                for cell_name, exec_time in execution_times.items()
+            ]
+        )
         
         return jsonify({
             "success": True,
@@ -525,7 +578,9 @@ def list_cells():
     return jsonify({
         "success": True,
         "available_cells": list(ai_cells.keys()),
-        "count": len(ai_cells)
+        "count": len(ai_cells),
+        "cells": ai_cells.status(),
+        "load_failures": ai_cells.failures
     })
 
 @app.route('/ping', methods=['GET'])
@@ -538,6 +593,19 @@ def ping():
         "version": "2.0.0"
     })
 
+@app.route('/metrics', methods=['GET'])
+@limiter.limit("10000 per minute")
+@require_internal
+def metrics():
+    return jsonify({
+        "db_pool": db_pool.stats(),
+        "api_key_cache": api_key_cache.stats(),
+        "last_login": last_login_tracker.stats(),
+        "usage_logger": usage_logger.stats(),
+        "stream": stream_server.stats(),
+        "dispatcher": dispatcher.stats()
+    })
+
 @app.route('/usage', methods=['GET'])
 @require_api_key
 @limiter.limit("10000 per minute")
@@ -548,14 +616,15 @@ def get_usage():
                 # Get user's cell usage stats
                 cur.execute("""
                     SELECT cell_name, COUNT(*) as count, 
-                    AVG(execution_time) as avg_time 
+                    AVG(execution_time) as avg_time,
+                    SUM(COALESCE(batch_size, 1)) as inputs
                     FROM cell_usage 
                     WHERE user_id = %s
                     GROUP BY cell_name
                     ORDER BY count DESC
                 """, (request.user_id,))
                 usage_stats = [
-                    {"cell": row[0], "count": row[1], "avg_time": row[2]} 
+                    {"cell": row[0], "count": row[1], "avg_time": row[2], "inputs": row[3]} 
                     for row in cur.fetchall()
                 ]
                 
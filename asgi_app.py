@@ -0,0 +1,364 @@
+"""
+Async serving mode: the /ai-api, /list-cells, /usage and /ping contract of
+app.py on FastAPI + uvicorn.
+
+Request-path database access (API key lookups, /usage) goes through an
+asyncpg pool, so waiting on Postgres never holds a thread. Cells still run
+synchronously, on a thread pool, through the same CellDispatcher as the
+Flask app. The usage logger and last-login tracker already write from
+background threads and keep their psycopg2 pool.
+
+Run with `python asgi_app.py` (PORT, default 8000). Idle keep-alive
+connections cost a socket and a small protocol object each, so one process
+can hold many thousands of them; ASGI_KEEP_ALIVE sets how long they may stay
+idle. The schema is created by app.py's init_db().
+"""
+import os
+import json
+import uuid
+import decimal
+import secrets
+import asyncio
+import logging
+import resource
+from datetime import date, datetime, timezone
+from email.utils import format_datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncpg
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.middleware.cors import CORSMiddleware
+
+from cell_loader import load_cells
+from dispatcher import CellDispatcher
+from db_pool import ConnectionPool, default_pool_size
+from auth_cache import ApiKeyCache
+from last_login import LastLoginTracker
+from usage_logger import UsageLogger
+from fingerprint import Fingerprinter
+from binary_ingest import BinaryIngestError, is_binary, from_body, from_multipart
+
+DATABASE_URL = os.getenv('DATABASE_URL')
+SYNC_POOL_SIZE = 2  # psycopg2 connections for the background writers
+
+
+def _http_date(value):
+    # Same rendering as Flask's jsonify, so both servers return identical JSON
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+def _json_default(value):
+    # The types Flask's JSON provider knows beyond plain JSON
+    if isinstance(value, datetime):
+        return _http_date(value)
+    if isinstance(value, date):
+        return _http_date(datetime(value.year, value.month, value.day))
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FlaskJSONResponse(JSONResponse):
+    """
+    JSON encoded the way Flask's jsonify does it. Starlette refuses NaN and
+    Infinity (a 500); jsonify writes them as bare NaN/Infinity tokens, and
+    cells do return them, so the two servers must agree.
+    """
+
+    def render(self, content):
+        return (json.dumps(content, default=_json_default, separators=(",", ":"), sort_keys=True) + "\n").encode('utf-8')
+
+
+logger = logging.getLogger('uvicorn.error')
+
+app = FastAPI(title="Robotics AI Cells", default_response_class=FlaskJSONResponse)
+
+# Same origins and headers as the Flask CORS configuration for /ai-api
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["https://aemiliotis.github.io"],
+    allow_origin_regex=r"http://localhost(:\d+)?",
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type", "X-API-Key", "X-Session-Id", "X-Request-Id",
+                   "X-Cells", "X-Image-Shape", "X-Image-Dtype", "X-Image-Field", "X-Cell-Data"],
+    expose_headers=["X-New-Token"],
+    allow_credentials=True
+)
+
+# Background writers keep a small synchronous pool of their own; the asyncpg
+# pool gets the rest of this worker's share of DB_MAX_CONNECTIONS
+db_pool = ConnectionPool(DATABASE_URL, max_size=SYNC_POOL_SIZE)
+
+def get_db():
+    return db_pool.connection()
+
+api_key_cache = ApiKeyCache(redis_url=os.getenv('REDIS_URL'))
+last_login_tracker = LastLoginTracker(get_db)
+usage_logger = UsageLogger(get_db)
+fingerprinter = Fingerprinter()
+
+# Load AI cells
+CELLS_DIR = os.path.join(os.path.dirname(__file__), "cells")
+ai_cells = load_cells(CELLS_DIR)
+dispatcher = CellDispatcher(ai_cells, logger=logger)
+
+# Cells are synchronous and often CPU-bound; they never run on the event loop
+cell_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ASGI_CELL_WORKERS', min(32, (os.cpu_count() or 1) * 4))),
+    thread_name_prefix='asgi-cell'
+)
+
+# Created on startup, inside the server's event loop
+adb = None
+
+def async_pool_size():
+    """This worker's connection budget minus what the psycopg2 pool may hold"""
+    return max(1, default_pool_size() - SYNC_POOL_SIZE)
+
+
+@app.on_event("startup")
+async def startup():
+    global adb
+    max_size = async_pool_size()
+    adb = await asyncpg.create_pool(
+        DATABASE_URL,
+        min_size=min(int(os.getenv('ASGI_DB_POOL_MIN', 1)), max_size),
+        max_size=max_size
+    )
+
+@app.on_event("shutdown")
+async def shutdown():
+    if adb is not None:
+        await adb.close()
+    dispatcher.shutdown()
+    usage_logger.shutdown()
+    last_login_tracker.shutdown()
+    db_pool.close_all()
+    cell_executor.shutdown(wait=False)
+
+
+def _error(status, message, **extra):
+    return FlaskJSONResponse({"error": message, **extra}, status_code=status)
+
+def _internal(request):
+    """
+    Operational endpoints: loopback callers, or anyone presenting
+    METRICS_TOKEN in X-Metrics-Token when that is configured
+    """
+    token = os.getenv('METRICS_TOKEN')
+    supplied = request.headers.get('X-Metrics-Token')
+    if token and supplied and secrets.compare_digest(token, supplied):
+        return True
+    return request.client is not None and request.client.host in ('127.0.0.1', '::1')
+
+async def resolve_api_key(api_key):
+    """Returns the identity dict for `api_key`, or None if the key is unknown"""
+    identity = api_key_cache.get(api_key)
+    if identity is not None:
+        return identity
+
+    generation = api_key_cache.generation()
+    async with adb.acquire() as conn:
+        user = await conn.fetchrow("SELECT id, username FROM users WHERE api_key = $1", api_key)
+    if not user:
+        return None
+
+    identity = {
+        'user_id': user['id'],
+        'username': user['username'],
+        'permissions': ['cells:execute'],
+        'expires_at': None
+    }
+    api_key_cache.put(api_key, identity, generation=generation)
+    return identity
+
+async def _authenticate(request):
+    """(identity, None) or (None, error response)"""
+    api_key = request.headers.get('X-API-Key')
+    if not api_key:
+        return None, _error(401, "API key required")
+    identity = await resolve_api_key(api_key)
+    if identity is None:
+        return None, _error(401, "Invalid API key")
+    last_login_tracker.touch(identity['user_id'])
+    return identity, None
+
+async def _read_cells_request(request, body):
+    """(cell_names, input_data) for a JSON or binary /ai-api request"""
+    mimetype = request.headers.get('Content-Type', '').split(';')[0].strip().lower()
+    if not is_binary(mimetype):
+        request_data = await request.json()
+        return request_data.get("cells", []), request_data.get("data", {})
+    # Images are decoded off the event loop: JPEG/PNG decoding is CPU work
+    loop = asyncio.get_running_loop()
+    if mimetype == 'multipart/form-data':
+        try:
+            form = await request.form()
+        except Exception as e:
+            raise BinaryIngestError(f"Malformed multipart body: {getattr(e, 'detail', None) or str(e)}")
+        files = {}
+        for name, part in form.multi_items():
+            if hasattr(part, 'read'):
+                files[name] = (await part.read(), getattr(part, 'headers', None) or {}, part.content_type)
+        return await loop.run_in_executor(cell_executor, from_multipart, form.get('request'), files)
+    return await loop.run_in_executor(cell_executor, from_body, body, request.headers, mimetype)
+
+
+# Core API Endpoint
+@app.post('/ai-api')
+async def handle_request(request: Request):
+    identity, failure = await _authenticate(request)
+    if failure is not None:
+        return failure
+    user_id = identity['user_id']
+    try:
+        session_id = request.headers.get('X-Session-Id', secrets.token_hex(16))
+        body = await request.body()
+        try:
+            cell_names, input_data = await _read_cells_request(request, body)
+        except BinaryIngestError as e:
+            return _error(400, str(e))
+
+        # Validate input
+        if not cell_names or not isinstance(cell_names, list):
+            return _error(400, "Invalid cells parameter")
+
+        loop = asyncio.get_running_loop()
+        results, execution_times, batch_sizes = await loop.run_in_executor(
+            cell_executor, dispatcher.run, cell_names, input_data, user_id, session_id
+        )
+
+        fingerprint = fingerprinter.for_request(body, execution_times)
+        usage_logger.log_request(
+            user_id,
+            session_id,
+            request.client.host if request.client else None,
+            request.headers.get('User-Agent'),
+            [
+                (cell_name, fingerprint.cell(cell_name), exec_time, batch_sizes.get(cell_name, 1))
+                for cell_name, exec_time in execution_times.items()
+            ]
+        )
+
+        return FlaskJSONResponse({
+            "success": True,
+            "results": results,
+            "metadata": {
+                "user_id": user_id,
+                "session_id": session_id,
+                "cell_count": len(results)
+            }
+        })
+
+    except Exception as e:
+        logger.error(f"API Error for user {user_id}: {str(e)}")
+        return FlaskJSONResponse({
+            "success": False,
+            "error": "Internal server error",
+            "message": str(e)
+        }, status_code=500)
+
+@app.get('/list-cells')
+async def list_cells():
+    return FlaskJSONResponse({
+        "success": True,
+        "available_cells": list(ai_cells.keys()),
+        "count": len(ai_cells),
+        "cells": ai_cells.status(),
+        "load_failures": ai_cells.failures
+    })
+
+@app.get('/ping')
+async def ping():
+    return FlaskJSONResponse({
+        "status": "alive",
+        "timestamp": datetime.utcnow().isoformat(),
+        "cells_loaded": len(ai_cells)
+    }, headers={"Access-Control-Allow-Origin": "*"})
+
+@app.get('/metrics')
+async def metrics(request: Request):
+    if not _internal(request):
+        return _error(403, "Forbidden")
+    return FlaskJSONResponse({
+        "db_pool": db_pool.stats(),
+        "async_db_pool": {
+            "size": adb.get_size() if adb is not None else 0,
+            "idle": adb.get_idle_size() if adb is not None else 0,
+            "max_size": adb.get_max_size() if adb is not None else 0
+        },
+        "api_key_cache": api_key_cache.stats(),
+        "last_login": last_login_tracker.stats(),
+        "usage_logger": usage_logger.stats(),
+        "dispatcher": dispatcher.stats()
+    })
+
+@app.get('/usage')
+async def get_usage(request: Request):
+    identity, failure = await _authenticate(request)
+    if failure is not None:
+        return failure
+    try:
+        async with adb.acquire() as conn:
+            # Get user's cell usage stats
+            rows = await conn.fetch("""
+                SELECT cell_name, COUNT(*) as count,
+                AVG(execution_time) as avg_time,
+                SUM(COALESCE(batch_size, 1)) as inputs
+                FROM cell_usage
+                WHERE user_id = $1
+                GROUP BY cell_name
+                ORDER BY count DESC
+            """, identity['user_id'])
+            usage_stats = [
+                {"cell": row[0], "count": row[1], "avg_time": row[2], "inputs": row[3]}
+                for row in rows
+            ]
+
+            # Get session info
+            rows = await conn.fetch("""
+                SELECT session_id, created_at, last_active
+                FROM user_sessions
+                WHERE user_id = $1
+                ORDER BY last_active DESC
+                LIMIT 5
+            """, identity['user_id'])
+            sessions = [
+                {"session_id": row[0], "created": _http_date(row[1]), "last_active": _http_date(row[2])}
+                for row in rows
+            ]
+
+        return FlaskJSONResponse({
+            "success": True,
+            "usage": usage_stats,
+            "recent_sessions": sessions
+        })
+    except Exception as e:
+        return _error(500, str(e))
+
+
+def _raise_open_file_limit():
+    # Every idle robot connection holds a file descriptor
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+if __name__ == '__main__':
+    _raise_open_file_limit()
+    uvicorn.run(
+        app,
+        host='0.0.0.0',
+        port=int(os.getenv('PORT', 8000)),
+        timeout_keep_alive=int(os.getenv('ASGI_KEEP_ALIVE', 300)),
+        backlog=int(os.getenv('ASGI_BACKLOG', 4096)),
+        access_log=False
+    )
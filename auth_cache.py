@@ -0,0 +1,158 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # Cross-worker invalidation is optional
+    redis = None
+
+INVALIDATION_CHANNEL = 'api-key-invalidations'
+
+
+class ApiKeyCache:
+    """
+    Bounded LRU + TTL cache of resolved API keys.
+
+    Entries map sha256(api_key) -> identity dict (user_id, username,
+    permissions, expires_at, ...). Raw keys are never kept in memory.
+
+    Invalidation is per user: rotating or revoking any key of a user drops
+    all of that user's entries. When REDIS_URL is configured the invalidation
+    is published so every gunicorn worker drops its copy too; without Redis
+    other workers converge after at most `ttl` seconds.
+    """
+
+    def __init__(self, max_entries=None, ttl=None, redis_url=None):
+        self.max_entries = int(max_entries or os.getenv('API_KEY_CACHE_SIZE', 10000))
+        self.ttl = float(ttl if ttl is not None else os.getenv('API_KEY_CACHE_TTL', 60))
+        self.redis_url = redis_url
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # digest -> (identity, expires)
+        self._by_user = {}  # user_id -> {digest}
+        self._generation = 0
+        self._redis = None
+        self._subscriber_pid = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _digest(api_key):
+        return hashlib.sha256(api_key.encode()).hexdigest()
+
+    def generation(self):
+        """Snapshot to pass to put(); a put racing an invalidation is dropped"""
+        return self._generation
+
+    def get(self, api_key):
+        self._ensure_subscriber()
+        digest = self._digest(api_key)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            identity, expires = entry
+            if time.monotonic() >= expires:
+                self._remove(digest)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return identity
+
+    def put(self, api_key, identity, generation=None, expires_in=None):
+        """
+        Cache a resolved identity. `expires_in` (seconds until the key itself
+        expires) caps the entry lifetime below the cache TTL.
+        """
+        if self.ttl <= 0:
+            return
+        lifetime = self.ttl if expires_in is None else min(self.ttl, expires_in)
+        if lifetime <= 0:
+            return
+
+        digest = self._digest(api_key)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._remove(digest)
+            self._entries[digest] = (identity, time.monotonic() + lifetime)
+            self._by_user.setdefault(identity['user_id'], set()).add(digest)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, digest):
+        entry = self._entries.pop(digest, None)
+        if entry is None:
+            return
+        user_id = entry[0]['user_id']
+        digests = self._by_user.get(user_id)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_user[user_id]
+
+    def invalidate_user(self, user_id, broadcast=True):
+        """Drop every cached key of `user_id` in this worker and, if possible, all others"""
+        self._invalidate_local(user_id)
+        if broadcast and self._get_redis() is not None:
+            try:
+                self._redis.publish(INVALIDATION_CHANNEL, str(user_id))
+            except Exception as e:
+                print(f"API key invalidation broadcast failed: {str(e)}")
+
+    def _invalidate_local(self, user_id):
+        with self._lock:
+            self._generation += 1
+            for digest in list(self._by_user.get(user_id, ())):
+                self._remove(digest)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_user.clear()
+
+    # Cross-worker invalidation
+    def _get_redis(self):
+        if not self.redis_url or redis is None:
+            return None
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def _ensure_subscriber(self):
+        # Started lazily so every forked worker gets its own listener thread
+        if self._subscriber_pid == os.getpid() or self._get_redis() is None:
+            return
+        with self._lock:
+            if self._subscriber_pid == os.getpid():
+                return
+            self._subscriber_pid = os.getpid()
+            self._redis = None  # never share the parent's socket
+        threading.Thread(target=self._listen, name='api-key-invalidations', daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    user_id = message['data'].decode()
+                    self._invalidate_local(int(user_id) if user_id.isdigit() else user_id)
+            except Exception as e:
+                # Messages may have been missed while disconnected
+                print(f"API key invalidation listener error: {str(e)}")
+                self.clear()
+                time.sleep(1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,169 @@
+import os
+import json
+import math
+import numpy as np
+
+# Raw buffers may use these element types; multi-byte types are little-endian by default
+DTYPES = ('uint8', 'int8', 'uint16', 'int16', 'uint32', 'int32', 'float32', 'float64')
+ENCODINGS = ('raw', 'jpeg', 'png')
+_MAGIC = {b'\xff\xd8\xff': 'jpeg', b'\x89PNG\r\n\x1a\n': 'png'}
+_MIMETYPES = {'image/jpeg': 'jpeg', 'image/jpg': 'jpeg', 'image/png': 'png'}
+MAX_IMAGE_BYTES = int(os.getenv('BINARY_MAX_IMAGE_BYTES', 256 * 1024 * 1024))
+
+
+class BinaryIngestError(ValueError):
+    """The binary upload is malformed; reported to the client as a 400"""
+
+
+def is_binary(mimetype):
+    return mimetype in ('application/octet-stream', 'multipart/form-data') or mimetype in _MIMETYPES
+
+
+def _sniff(buffer):
+    head = bytes(buffer[:8])
+    for magic, encoding in _MAGIC.items():
+        if head.startswith(magic):
+            return encoding
+    return None
+
+def _parse_shape(shape):
+    if isinstance(shape, str):
+        shape = [part for part in shape.replace('x', ',').split(',') if part.strip()]
+    try:
+        shape = tuple(int(dim) for dim in shape)
+    except (TypeError, ValueError):
+        raise BinaryIngestError(f"Invalid image shape {shape!r}")
+    if not shape or any(dim <= 0 for dim in shape):
+        raise BinaryIngestError(f"Invalid image shape {shape!r}")
+    return shape
+
+def decode_image(buffer, shape=None, dtype=None, encoding=None):
+    """
+    NumPy array for an uploaded buffer.
+
+    Raw pixel data needs `shape` (e.g. "480,640,3") and is returned as a
+    read-only np.frombuffer view over `buffer`, without copying. JPEG/PNG
+    data (given as `encoding` or recognised by its magic bytes) is decoded
+    with cv2.imdecode into RGB(A) order.
+    """
+    encoding = encoding or (None if shape is not None else _sniff(buffer))
+    if encoding in ('jpeg', 'png'):
+        import cv2
+        image = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise BinaryIngestError(f"Could not decode {encoding} image")
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA if image.shape[2] == 4 else cv2.COLOR_BGR2RGB)
+        return image
+    if encoding not in (None, 'raw'):
+        raise BinaryIngestError(f"Unknown image encoding '{encoding}', expected one of {ENCODINGS}")
+
+    if shape is None:
+        raise BinaryIngestError("Raw image data needs a shape (X-Image-Shape)")
+    shape = _parse_shape(shape)
+    dtype = dtype or 'uint8'
+    if dtype not in DTYPES:
+        raise BinaryIngestError(f"Unsupported dtype '{dtype}', expected one of {DTYPES}")
+    dtype = np.dtype(dtype).newbyteorder('<')
+    # Python ints: np.prod would wrap around for absurd shapes and could
+    # then match the buffer length
+    expected = math.prod(shape) * dtype.itemsize
+    if expected > MAX_IMAGE_BYTES:
+        raise BinaryIngestError(f"Image shape {shape} of {dtype.name} exceeds {MAX_IMAGE_BYTES} bytes")
+    if len(buffer) != expected:
+        raise BinaryIngestError(f"Image buffer has {len(buffer)} bytes, shape {shape} of {dtype.name} needs {expected}")
+    return np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+
+def _json_header(headers, name, default):
+    value = headers.get(name)
+    if not value:
+        return default
+    try:
+        return json.loads(value)
+    except ValueError:
+        raise BinaryIngestError(f"{name} is not valid JSON")
+
+def from_body(body, headers, mimetype=None):
+    """
+    A bare body (application/octet-stream, image/jpeg or image/png) holding
+    one image. Headers:
+      X-Cells        - comma-separated cell names (required)
+      X-Image-Shape  - "height,width[,channels]" for raw pixel data
+      X-Image-Dtype  - element type of raw data, default uint8
+      X-Image-Field  - input key the image is passed as, default "image"
+      X-Cell-Data    - optional JSON {"cell": {...}} with the other inputs
+    Returns (cell_names, input_data) like a JSON /ai-api request.
+    """
+    cell_names = [name.strip() for name in (headers.get('X-Cells') or '').split(',') if name.strip()]
+    if not cell_names:
+        raise BinaryIngestError("Binary uploads need an X-Cells header")
+    image = decode_image(
+        body,
+        shape=headers.get('X-Image-Shape'),
+        dtype=headers.get('X-Image-Dtype'),
+        encoding=_MIMETYPES.get(mimetype)
+    )
+    field = headers.get('X-Image-Field') or 'image'
+    cell_data = _json_header(headers, 'X-Cell-Data', {})
+    if not isinstance(cell_data, dict):
+        raise BinaryIngestError("X-Cell-Data must be a JSON object of per-cell inputs")
+    input_data = {}
+    for cell_name in cell_names:
+        # One dict per cell (each gets its own _user_context); the array is shared
+        cell_input = cell_data.get(cell_name) or {}
+        if not isinstance(cell_input, dict):
+            raise BinaryIngestError(f"X-Cell-Data for '{cell_name}' must be a JSON object")
+        cell_input = dict(cell_input)
+        cell_input[field] = image
+        input_data[cell_name] = cell_input
+    return cell_names, input_data
+
+
+def from_multipart(request_json, files):
+    """
+    multipart/form-data: a "request" field with the usual JSON body, in which
+    {"$file": "<part name>", "shape": ..., "dtype": ..., "encoding": ...}
+    objects stand for uploaded parts. `files` maps part name to
+    (bytes, part headers, mimetype). Returns (cell_names, input_data).
+    """
+    try:
+        request_data = json.loads(request_json or '{}')
+    except ValueError:
+        raise BinaryIngestError("The 'request' field is not valid JSON")
+    if not isinstance(request_data, dict):
+        raise BinaryIngestError("The 'request' field must be a JSON object")
+
+    def resolve(value):
+        if isinstance(value, dict):
+            if '$file' in value:
+                part = files.get(value['$file'])
+                if part is None:
+                    raise BinaryIngestError(f"No uploaded part named '{value['$file']}'")
+                buffer, part_headers, mimetype = part
+                return decode_image(
+                    buffer,
+                    shape=value.get('shape', part_headers.get('X-Image-Shape')),
+                    dtype=value.get('dtype', part_headers.get('X-Image-Dtype')),
+                    encoding=value.get('encoding', _MIMETYPES.get(mimetype))
+                )
+            return {key: resolve(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [resolve(item) for item in value]
+        return value
+
+    return request_data.get("cells", []), resolve(request_data.get("data", {}))
+
+
+def parse_flask_request(request):
+    """(cell_names, input_data) for a binary Flask request"""
+    if request.mimetype == 'multipart/form-data':
+        # Cache the raw body first: the form is then parsed from the cached
+        # bytes and the usage fingerprint still sees the whole upload
+        request.get_data(cache=True)
+        files = {
+            name: (storage.read(), storage.headers, storage.mimetype)
+            for name, storage in request.files.items()
+        }
+        return from_multipart(request.form.get('request'), files)
+    return from_body(request.get_data(cache=True), request.headers, request.mimetype)
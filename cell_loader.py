@@ -1,45 +1,245 @@
+import ast
 import importlib.util
 import os
-from typing import Dict, Callable
+import threading
+import time
+from typing import Dict, Callable, Iterable, Optional
 import sys
 
-def load_cells(cells_dir: str) -> Dict[str, Callable]:
+from concurrency import POLICIES, DEFAULT_POLICY
+
+EXECUTORS = ('thread', 'process')
+# Module-level flags read from the cell source, before (or without) importing it
+FLAGS = ('USES_SCRATCH', 'CONCURRENCY', 'EXECUTOR', 'MICRO_BATCH')
+
+
+class CellRegistry(dict):
+    """
+    { "cell_name": cell_function } plus per-cell capabilities declared by
+    module-level flags in the cell file:
+
+        USES_SCRATCH = True   # cell wants a per-request scratch directory
+        CONCURRENCY = 'stateless' | 'session' | 'global'
+        EXECUTOR = 'thread' | 'process'  # 'process' runs in the warm worker pool
+        MICRO_BATCH = True    # concurrent single inputs are batched (needs process_batch)
+
+    Cells may also define process_batch(list_of_inputs) -> list_of_results
+    to handle many inputs in one call; run_batch() falls back to looping
+    over process() for cells that don't.
+
+    `load_info` holds per-cell import status, time and memory; cells that
+    could not be registered or imported are listed in `failures`.
+    """
+
+    def __init__(self, cells_dir=None):
+        super().__init__()
+        self.cells_dir = cells_dir
+        self.capabilities = {}
+        self.batch = {}
+        self.load_info = {}
+        self.failures = {}
+
+    def run_batch(self, cell_name, items):
+        batch_fn = self.batch.get(cell_name)
+        if batch_fn is not None:
+            return batch_fn(items)
+
+        results = []
+        for item in items:
+            try:
+                results.append(self[cell_name](item))
+            except Exception as e:
+                results.append({"error": str(e)})
+        return results
+
+    def warm_up(self, names):
+        """Import the given lazy cells now instead of on their first call"""
+        for cell_name in names:
+            cell = self.get(cell_name)
+            if isinstance(cell, LazyCell):
+                try:
+                    cell.module()
+                except Exception:
+                    pass  # Recorded in failures
+
+    def status(self):
+        return {
+            cell_name: dict(self.load_info.get(cell_name, {}), **self.capabilities.get(cell_name, {}))
+            for cell_name in self
+        }
+
+
+class LazyCell:
+    """
+    Stand-in for a cell's process(): imports the module on the first call.
+    A failed import is recorded on the registry and raised to each caller.
+    """
+
+    def __init__(self, registry, cell_name, module_path):
+        self.registry = registry
+        self.cell_name = cell_name
+        self.module_path = module_path
+        self._module = None
+        self._error = None
+        self._lock = threading.Lock()
+
+    def module(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None and self._error is None:
+                    try:
+                        self._module = _import_cell(self.registry, self.cell_name, self.module_path)
+                    except Exception as e:
+                        self._error = e
+                if self._error is not None:
+                    raise RuntimeError(f"Cell {self.cell_name} failed to load: {str(self._error)}")
+        return self._module
+
+    def __call__(self, input_data):
+        return self.module().process(input_data)
+
+    def process_batch(self, inputs):
+        return self.module().process_batch(inputs)
+
+
+def _capabilities(flags, functions, warnings) -> Dict:
+    concurrency = flags.get('CONCURRENCY', DEFAULT_POLICY)
+    if concurrency not in POLICIES:
+        warnings.append(f"Unknown CONCURRENCY '{concurrency}', using '{DEFAULT_POLICY}'")
+        concurrency = DEFAULT_POLICY
+    executor = flags.get('EXECUTOR', 'thread')
+    if executor not in EXECUTORS:
+        warnings.append(f"Unknown EXECUTOR '{executor}', using 'thread'")
+        executor = 'thread'
+    return {
+        'scratch': bool(flags.get('USES_SCRATCH', False)),
+        'concurrency': concurrency,
+        'executor': executor,
+        'batch': 'process_batch' in functions,
+        'micro_batch': bool(flags.get('MICRO_BATCH', False)),
+    }
+
+
+def _static_metadata(module_path):
+    """Top-level FLAGS assignments and function names, read with ast (nothing is executed)"""
+    with open(module_path, 'rb') as f:
+        tree = ast.parse(f.read(), filename=module_path)
+    flags = {}
+    functions = set()
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions.add(node.name)
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id in FLAGS:
+                    try:
+                        flags[target.id] = ast.literal_eval(node.value)
+                    except ValueError:
+                        pass  # Not a literal: treated as undeclared
+    return flags, functions
+
+
+def _module_metadata(module):
+    flags = {name: getattr(module, name) for name in FLAGS if hasattr(module, name)}
+    functions = {name for name in ('process', 'process_batch') if callable(getattr(module, name, None))}
+    return flags, functions
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource  # Peak rather than current RSS where /proc is missing
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _import_cell(registry, cell_name, module_path):
+    info = registry.load_info.setdefault(cell_name, {})
+    rss_before = _rss_bytes()
+    start = time.perf_counter()
+    try:
+        # Modern Python 3.5+ module loading
+        spec = importlib.util.spec_from_file_location(
+            f"cells.{cell_name}",
+            module_path
+        )
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[f"cells.{cell_name}"] = module
+        spec.loader.exec_module(module)
+
+        # Verify the module has required process() function
+        if not callable(getattr(module, 'process', None)):
+            raise ImportError(f"{os.path.basename(module_path)} missing process() function")
+    except Exception as e:
+        sys.modules.pop(f"cells.{cell_name}", None)
+        info.update(loaded=False, error=str(e))
+        registry.failures[cell_name] = str(e)
+        raise
+
+    info.update(
+        loaded=True,
+        import_time_ms=round((time.perf_counter() - start) * 1000, 2),
+        rss_delta_kb=max(0, _rss_bytes() - rss_before) // 1024
+    )
+    return module
+
+
+def load_cells(cells_dir: str, names: Optional[Iterable[str]] = None,
+               lazy: Optional[bool] = None, warmup: Optional[Iterable[str]] = None) -> Dict[str, Callable]:
     """
     Dynamically loads all Python files in cells/ as AI modules
-    Returns: { "cell_name": cell_function }
+    (only `names` when given)
+
+    In lazy mode (CELL_LAZY_LOAD, on by default) cells are registered from
+    their source alone and imported on first use; `warmup` (or
+    CELL_WARMUP, comma-separated or '*') lists cells to import right away.
+    Returns: CellRegistry { "cell_name": cell_function }
     """
-    cells = {}
-    
+    cells = CellRegistry(cells_dir)
+    wanted = set(names) if names is not None else None
+    if lazy is None:
+        lazy = os.getenv('CELL_LAZY_LOAD', 'true').lower() not in ('0', 'false', 'no')
+
     # Ensure cells directory exists
     if not os.path.exists(cells_dir):
         return cells
-        
-    for filename in os.listdir(cells_dir):
+
+    for filename in sorted(os.listdir(cells_dir)):
         # Skip non-Python files and hidden files
         if not filename.endswith('.py') or filename.startswith('_'):
             continue
-            
+
         cell_name = filename[:-3]  # Remove .py extension
+        if wanted is not None and cell_name not in wanted:
+            continue
         module_path = os.path.join(cells_dir, filename)
-        
+
         try:
-            # Modern Python 3.5+ module loading
-            spec = importlib.util.spec_from_file_location(
-                f"cells.{cell_name}",
-                module_path
-            )
-            module = importlib.util.module_from_spec(spec)
-            sys.modules[f"cells.{cell_name}"] = module
-            spec.loader.exec_module(module)
-            
-            # Verify the module has required process() function
-            if hasattr(module, 'process'):
-                cells[cell_name] = module.process
+            if lazy:
+                flags, functions = _static_metadata(module_path)
+                if 'process' not in functions:
+                    raise ImportError(f"{filename} missing process() function")
+                cell = LazyCell(cells, cell_name, module_path)
+                cells.load_info[cell_name] = {"loaded": False}
+                process_fn, batch_fn = cell, cell.process_batch
             else:
-                print(f"Warning: {filename} missing process() function")
-                
+                module = _import_cell(cells, cell_name, module_path)
+                flags, functions = _module_metadata(module)
+                process_fn, batch_fn = module.process, getattr(module, 'process_batch', None)
         except Exception as e:
-            print(f"Failed to load {filename}: {str(e)}")
+            cells.failures[cell_name] = str(e)
             continue
-            
+
+        warnings = []
+        cells[cell_name] = process_fn
+        cells.capabilities[cell_name] = _capabilities(flags, functions, warnings)
+        if cells.capabilities[cell_name]['batch']:
+            cells.batch[cell_name] = batch_fn
+        if warnings:
+            cells.load_info[cell_name]['warnings'] = warnings
+
+    if warmup is None:
+        warmup = [name.strip() for name in os.getenv('CELL_WARMUP', '').split(',') if name.strip()]
+    cells.warm_up(list(cells) if '*' in warmup else warmup)
     return cells
@@ -0,0 +1,243 @@
+import os
+import sys
+import time
+import queue
+import pickle
+import select
+import struct
+import threading
+import subprocess
+
+_HEADER = struct.Struct('>I')  # frame length prefix
+
+
+class CellPoolError(Exception):
+    """A pooled cell call failed for reasons outside the cell itself"""
+
+
+def _read_exact(stream, size, deadline=None):
+    fd = stream.fileno()
+    chunks = []
+    while size:
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise TimeoutError("Cell worker did not answer in time")
+        chunk = os.read(fd, size)
+        if not chunk:
+            raise EOFError("Cell worker exited")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _send(stream, message):
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(_HEADER.pack(len(payload)) + payload)
+    stream.flush()
+
+
+def _receive(stream, deadline=None):
+    size, = _HEADER.unpack(_read_exact(stream, _HEADER.size, deadline))
+    return pickle.loads(_read_exact(stream, size, deadline))
+
+
+class _Worker:
+    """One pre-started interpreter that has already loaded its cells"""
+
+    def __init__(self, cells_dir, cell_names, startup_timeout):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--worker', cells_dir, ','.join(cell_names)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        self.calls = 0
+        self.started_at = time.time()
+        try:
+            status, loaded = _receive(self.process.stdout, time.monotonic() + startup_timeout)
+        except Exception:
+            self.kill()
+            raise
+        self.loaded = loaded
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def call(self, cell_name, cell_input, batch, timeout):
+        _send(self.process.stdin, (cell_name, cell_input, batch))
+        status, payload = _receive(self.process.stdout, time.monotonic() + timeout)
+        self.calls += 1
+        if status == 'error':
+            raise RuntimeError(payload)
+        return payload
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    def stop(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=1)
+        except Exception:
+            self.process.kill()
+
+
+class CellProcessPool:
+    """
+    Pool of warm worker processes for CPU-bound, pure-Python cells.
+
+    Each worker is a separate interpreter that ran cell_loader.load_cells
+    for the routed cells at startup, so per-call cost is one pickle round
+    trip over a pipe. Workers that die, time out or reach `max_calls` are
+    replaced. The pool starts lazily in each web worker process.
+    """
+
+    def __init__(self, cells_dir, cell_names, size=None, call_timeout=None,
+                 startup_timeout=None, max_calls=None):
+        self.cells_dir = cells_dir
+        self.cell_names = sorted(cell_names)
+        self.size = int(size or os.getenv('CELL_POOL_SIZE', os.cpu_count() or 1))
+        self.call_timeout = float(call_timeout or os.getenv('CELL_POOL_CALL_TIMEOUT', 30))
+        self.startup_timeout = float(startup_timeout or os.getenv('CELL_POOL_STARTUP_TIMEOUT', 120))
+        self.max_calls = int(max_calls or os.getenv('CELL_POOL_MAX_CALLS', 0))  # 0 = never recycle
+        self._lock = threading.Lock()
+        self._pid = None
+        self._idle = None
+        self._workers = []
+        self.restarts = 0
+        self.restart_failures = 0
+        self.failures = 0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            workers = []
+            try:
+                for _ in range(self.size):
+                    workers.append(_Worker(self.cells_dir, self.cell_names, self.startup_timeout))
+            except Exception as e:
+                # Don't leave the ones that did start running; the next call tries again
+                for worker in workers:
+                    worker.kill()
+                raise CellPoolError(f"Cell workers failed to start: {str(e)}")
+            self._idle = queue.Queue()
+            self._workers = workers
+            for worker in workers:
+                self._idle.put(worker)
+            self._pid = os.getpid()
+
+    def call(self, cell_name, cell_input, batch=False):
+        """Runs one input, or a list of inputs when `batch` is set"""
+        self._ensure_started()
+        try:
+            worker = self._idle.get(timeout=self.call_timeout)
+        except queue.Empty:
+            raise CellPoolError(f"No cell worker free after {self.call_timeout}s")
+
+        if not worker.alive():
+            worker = self._replace(worker)
+        try:
+            result = worker.call(cell_name, cell_input, batch, self.call_timeout)
+        except RuntimeError:
+            # The cell raised; the worker itself is fine
+            self._release(worker)
+            raise
+        except Exception as e:
+            self.failures += 1
+            try:
+                self._idle.put(self._replace(worker))
+            except CellPoolError:
+                pass  # The slot is back in the pool; its restart is retried on use
+            raise CellPoolError(f"Cell worker failed running {cell_name}: {str(e)}")
+        self._release(worker)
+        return result
+
+    def _release(self, worker):
+        if self.max_calls and worker.calls >= self.max_calls:
+            try:
+                worker = self._replace(worker)
+            except CellPoolError:
+                return  # Already back in the pool, as above
+        self._idle.put(worker)
+
+    def _replace(self, worker):
+        """
+        Swaps `worker` for a freshly started one. If the new worker fails to
+        start, the dead one goes back into the idle queue so the pool keeps
+        its size, and the next call that picks it up retries the restart.
+        """
+        worker.kill()
+        try:
+            replacement = _Worker(self.cells_dir, self.cell_names, self.startup_timeout)
+        except Exception as e:
+            with self._lock:
+                self.restart_failures += 1
+            self._idle.put(worker)
+            raise CellPoolError(f"Cell worker failed to restart: {str(e)}")
+        with self._lock:
+            self._workers[self._workers.index(worker)] = replacement
+            self.restarts += 1
+        return replacement
+
+    def shutdown(self):
+        if self._pid != os.getpid():
+            return
+        for worker in self._workers:
+            worker.stop()
+
+    def stats(self):
+        with self._lock:
+            workers = [
+                {"pid": w.process.pid, "alive": w.alive(), "calls": w.calls,
+                 "uptime_s": round(time.time() - w.started_at, 1)}
+                for w in self._workers
+            ]
+        return {
+            "cells": self.cell_names,
+            "size": self.size,
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "restarts": self.restarts,
+            "restart_failures": self.restart_failures,
+            "failures": self.failures,
+            "workers": workers
+        }
+
+
+def _worker_main(cells_dir, cell_names):
+    # Keep the protocol on a private copy of stdout; anything cells print goes to stderr
+    proto_out = os.fdopen(os.dup(1), 'wb')
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    proto_in = sys.stdin.buffer
+
+    from cell_loader import load_cells
+    cells = load_cells(cells_dir, names=cell_names, lazy=False)
+    _send(proto_out, ('ready', list(cells)))
+
+    while True:
+        try:
+            cell_name, cell_input, batch = _receive(proto_in)
+        except EOFError:
+            return
+        try:
+            if batch:
+                result = cells.run_batch(cell_name, cell_input)
+            else:
+                result = cells[cell_name](cell_input)
+            _send(proto_out, ('ok', result))
+        except Exception as e:
+            _send(proto_out, ('error', str(e)))
+
+
+if __name__ == '__main__' and sys.argv[1:2] == ['--worker']:
+    _worker_main(sys.argv[2], [name for name in sys.argv[3].split(',') if name])
@@ -1,4 +1,66 @@
 import math
+import numpy as np
+
+CONCURRENCY = 'stateless'
+
+_BASE_OFFSET = 0.5  # Horizontal shoulder offset from the base axis
+_HALF_PI = math.pi / 2
+
+def solve_batch(targets):
+    """
+    Vectorized 3DOF IK for an (N, 3) array of [x, y, z] targets.
+
+    Returns (joints, valid):
+    - joints: (N, 3) array of [theta1, theta2, theta3]
+    - valid: (N,) bool mask, False where the target sits on the x=y=0
+      singularity or a joint angle exceeds the ±π limits
+    """
+    targets = np.asarray(targets, dtype=np.float64)
+    if targets.ndim == 1 and targets.size in (0, 3):
+        targets = targets.reshape(-1, 3)  # a single target, or none
+    if targets.ndim != 2 or targets.shape[1] != 3:
+        raise ValueError(f"targets must be [x, y, z] rows, got shape {targets.shape}")
+    x, y, z = targets[:, 0], targets[:, 1], targets[:, 2]
+
+    joints = np.empty_like(targets)
+    joints[:, 0] = np.arctan2(y, x)  # Base rotation
+    joints[:, 1] = np.arctan2(np.hypot(x, y) - _BASE_OFFSET, z)  # Shoulder angle
+    joints[:, 2] = _HALF_PI - joints[:, 1]  # Elbow angle (fixed relative to shoulder)
+
+    singular = (x == 0) & (y == 0)
+    within_limits = np.all(np.abs(joints) <= math.pi, axis=1)
+    return joints, ~singular & within_limits
+
+def _parse_target(input_data):
+    """Accepts {'target': [x, y, z]} or {'target_x': x, 'target_y': y, 'target_z': z}"""
+    if 'target' in input_data:
+        # Direct API call format
+        x, y, z = map(float, input_data['target'][:3])
+    else:
+        # Web interface format (target_x, target_y, target_z)
+        x = float(input_data.get('target_x', 0))
+        y = float(input_data.get('target_y', 0))
+        z = float(input_data.get('target_z', 0))
+    return x, y, z
+
+def _row_result(x, y, joints, valid):
+    if valid:
+        return {
+            'joints': joints,
+            'mode': 'fast_approx',
+            'success': True
+        }
+    # Safety check - prevent division by zero in atan2 calculations
+    if x == 0 and y == 0:
+        return {
+            'error': 'Target directly above base (x=0, y=0) causes singularity',
+            'success': False
+        }
+    return {
+        'error': 'Calculated joint angles exceed ±π limits',
+        'joints': joints,
+        'success': False
+    }
 
 def process(input_data):
     """
@@ -6,25 +68,29 @@ def process(input_data):
     Accepts either:
     - {'target': [x, y, z]} (direct API calls)
     - {'target_x': x, 'target_y': y, 'target_z': z} (web interface format)
+    - {'targets': [[x, y, z], ...]} (trajectory, solved in one vectorized pass)
     
     Returns: {'joints': [theta1, theta2, theta3], 'mode': 'fast_approx'}
+    or for 'targets': {'joints': [[...], ...], 'valid': [...], 'mode': 'vectorized'}
     """
-    
+    if 'targets' in input_data:
+        try:
+            joints, valid = solve_batch(input_data['targets'])
+        except (ValueError, TypeError) as e:
+            return {
+                'error': f'Invalid targets input: {str(e)}',
+                'success': False
+            }
+        return {
+            'joints': joints.tolist(),
+            'valid': valid.tolist(),
+            'mode': 'vectorized',
+            'success': True
+        }
+
     # Input handling - support both formats
     try:
-        if 'target' in input_data:
-            # Direct API call format
-            x, y, z = map(float, input_data['target'][:3])
-        else:
-            # Web interface format (target_x, target_y, target_z)
-            x = float(input_data.get('target_x', 0))
-            y = float(input_data.get('target_y', 0))
-            z = float(input_data.get('target_z', 0))
-            
-        # Validate input coordinates
-        if not all(isinstance(v, (int, float)) for v in (x, y, z)):
-            raise ValueError("All target components must be numeric")
-            
+        x, y, z = _parse_target(input_data)
     except (KeyError, ValueError, TypeError) as e:
         return {
             'error': f'Invalid target input: {str(e)}',
@@ -32,43 +98,37 @@ def process(input_data):
             'success': False
         }
 
-    # Safety check - prevent division by zero in atan2 calculations
-    if x == 0 and y == 0:
-        return {
-            'error': 'Target directly above base (x=0, y=0) causes singularity',
-            'success': False
-        }
-
     try:
-        # 3DOF arm approximation calculations
-        theta1 = math.atan2(y, x)  # Base rotation
-        
-        xy_dist = math.hypot(x, y) - 0.5  # Base offset adjustment
-        theta2 = math.atan2(xy_dist, z)  # Shoulder angle
-        
-        theta3 = math.pi/2 - theta2  # Elbow angle (fixed relative to shoulder)
-        
-        # Joint limit safety check
-        joints = [theta1, theta2, theta3]
-        if not all(-math.pi <= angle <= math.pi for angle in joints):
-            return {
-                'error': 'Calculated joint angles exceed ±π limits',
-                'joints': joints,
-                'success': False
-            }
-            
-        return {
-            'joints': joints,
-            'mode': 'fast_approx',
-            'success': True
-        }
-        
+        joints, valid = solve_batch((x, y, z))
+        return _row_result(x, y, joints[0].tolist(), bool(valid[0]))
     except Exception as e:
         return {
             'error': f'IK calculation failed: {str(e)}',
             'success': False
         }
 
+def process_batch(inputs):
+    """Solves a list of single-target inputs with one solve_batch() call"""
+    results = [None] * len(inputs)
+    targets = []
+    rows = []
+    for i, input_data in enumerate(inputs):
+        try:
+            targets.append(_parse_target(input_data))
+            rows.append(i)
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            results[i] = {
+                'error': f'Invalid target input: {str(e)}',
+                'received_data': input_data,
+                'success': False
+            }
+
+    if targets:
+        joints, valid = solve_batch(targets)
+        for row, (x, y, _), angles, ok in zip(rows, targets, joints.tolist(), valid.tolist()):
+            results[row] = _row_result(x, y, angles, ok)
+    return results
+
 
 # Test cases that work with both input formats
 if __name__ == "__main__":
@@ -93,3 +153,6 @@ if __name__ == "__main__":
         'target_z': 0.8
     }
     print("Error case result:", process(error_format))
+
+    # Trajectory test
+    print("Batch result:", process({'targets': [[0.5, 0.2, 0.8], [0, 0, 1], [1.0, -0.5, 0.3]]}))
@@ -1,3 +1,5 @@
+CONCURRENCY = 'stateless'
+
 def li_ion_degradation_model(cycles, dod, temp):
     """Simplified degradation model (0.1% CPU of full ECMS)"""
     return 0.003 * cycles * (dod/100) * (2 ** ((temp-25)/10))
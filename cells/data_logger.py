@@ -1 +1 @@
-
+CONCURRENCY = 'global'  # a logger keeps shared state; declared ahead of its process()
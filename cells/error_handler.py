@@ -1,3 +1,5 @@
+CONCURRENCY = 'stateless'
+
 _ERROR_DB = {
     0x01: "Motor driver fault - restart driver",
     0x02: "Low voltage - reduce speed by 30%"
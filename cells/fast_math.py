@@ -1,18 +1,135 @@
 import math
 import numpy as np
+from functools import lru_cache
+
+CONCURRENCY = 'stateless'
+
+DEFAULT_RESOLUTION = 0.1  # degrees, 3600 points
+MIN_RESOLUTION = 0.001  # caps a table at 360k entries
+_ATAN_POINTS = 4096  # atan over [0, 1], octant-reduced for atan2
+
+
+def _finite(values, name):
+    # NaN/inf would become garbage table indices
+    values = np.asarray(values, dtype=np.float64)
+    if not np.all(np.isfinite(values)):
+        raise ValueError(f"{name} must be finite numbers")
+    return values
+
+
+class TrigLUT:
+    """
+    NumPy-backed trig lookup tables for a given resolution in degrees.
+
+    Only the sin table is stored; cos reads it shifted by a quarter turn
+    (as fast_math.js does). Every method takes scalars or arrays of angles
+    and optionally interpolates linearly between neighbouring entries.
+    """
+
+    def __init__(self, resolution=DEFAULT_RESOLUTION):
+        if not math.isfinite(resolution) or resolution < MIN_RESOLUTION:
+            raise ValueError(f"resolution must be at least {MIN_RESOLUTION} degrees")
+        size = 360.0 / resolution
+        if abs(size - round(size)) > 1e-9 or round(size) % 4:
+            raise ValueError("resolution must divide 90 degrees evenly")
+        self.resolution = resolution
+        self.size = int(round(size))
+        self.quarter = self.size // 4
+
+        # One guard entry past the end so idx + 1 never needs wrapping
+        steps = np.arange(self.size + 1)
+        self.sin_table = np.sin(steps * (2 * math.pi / self.size))
+        # tan repeats every half turn; poles hold huge finite values
+        half = self.size // 2
+        self.tan_table = np.tan(np.arange(half + 1) * (math.pi / half))
+        self.atan_table = np.arctan(np.append(np.linspace(0.0, 1.0, _ATAN_POINTS + 1), 1.0))
+
+    def _position(self, angles_deg):
+        return np.mod(_finite(angles_deg, "angles"), 360.0) / self.resolution
+
+    @staticmethod
+    def _lookup(table, pos, period, interpolate, offset=0):
+        if interpolate:
+            idx = np.floor(pos).astype(np.intp)
+            frac = pos - idx
+            idx = (idx + offset) % period
+            return table[idx] + frac * (table[idx + 1] - table[idx])
+        idx = (np.rint(pos).astype(np.intp) + offset) % period
+        return table[idx]
+
+    def sin(self, angles_deg, interpolate=False):
+        return self._lookup(self.sin_table, self._position(angles_deg), self.size, interpolate)
+
+    def cos(self, angles_deg, interpolate=False):
+        # cos(a) = sin(a + 90°)
+        return self._lookup(self.sin_table, self._position(angles_deg), self.size, interpolate, self.quarter)
+
+    def tan(self, angles_deg, interpolate=False):
+        half = self.size // 2
+        pos = np.mod(self._position(angles_deg), half)
+        return self._lookup(self.tan_table, pos, half, interpolate)
+
+    def atan2(self, y, x, interpolate=False):
+        """Angle of (x, y) in degrees, in (-180, 180]"""
+        y = _finite(y, "y")
+        x = _finite(x, "x")
+        ax, ay = np.abs(x), np.abs(y)
+        swap = ay > ax
+        num = np.where(swap, ax, ay)
+        den = np.where(swap, ay, ax)
+        ratio = np.divide(num, den, out=np.zeros_like(num), where=den > 0)
+
+        angle = self._lookup(self.atan_table, ratio * _ATAN_POINTS, _ATAN_POINTS + 1, interpolate)
+        angle = np.where(swap, math.pi / 2 - angle, angle)
+        angle = np.where(x < 0, math.pi - angle, angle)
+        angle = np.where(y < 0, -angle, angle)
+        return np.degrees(angle)
+
+
+@lru_cache(maxsize=8)
+def get_lut(resolution=DEFAULT_RESOLUTION):
+    return TrigLUT(resolution)
 
 # Precompute LUT with 0.1° resolution (3600 points)
-_SIN_LUT = [math.sin(math.radians(angle/10)) for angle in range(0, 3600)]
-_COS_LUT = [math.cos(math.radians(angle/10)) for angle in range(0, 3600)]
+get_lut(DEFAULT_RESOLUTION)
+
+
+def _output(values, scalar):
+    return float(values) if scalar else values.tolist()
 
 def process(input_data):
-    """Returns sin/cos with 0.1° precision using precomputed LUTs"""
-    angle_deg = input_data["angle"] % 360.0  # Normalize to [0,360)
-    idx = int(round(angle_deg * 10)) % 3600  # Convert to LUT index
-    
-    return {
-        "sin": _SIN_LUT[idx],
-        "cos": _COS_LUT[idx],
-        "precision_deg": 0.1,
-        "method": "LUT"
-    }
+    """
+    Returns sin/cos with 0.1° precision using precomputed LUTs
+
+    Optional inputs:
+    - "angle" may be a list of angles (or use "angles"), evaluated in one pass
+    - "interpolate": linear interpolation between LUT entries
+    - "resolution": LUT resolution in degrees (must divide 90)
+    - "functions": any of "sin", "cos", "tan" (default sin and cos)
+    - "y"/"x": adds "atan2" in degrees
+    """
+    lut = get_lut(float(input_data.get("resolution", DEFAULT_RESOLUTION)))
+    interpolate = bool(input_data.get("interpolate", False))
+    result = {}
+
+    angles = input_data.get("angles", input_data.get("angle"))
+    if angles is not None:
+        scalar = np.ndim(angles) == 0
+        functions = input_data.get("functions", ("sin", "cos"))
+        if isinstance(functions, str):
+            functions = [functions]  # "sin", not "s", "i", "n"
+        for name in functions:
+            if name not in ("sin", "cos", "tan"):
+                raise ValueError(f"Unknown function '{name}'")
+            result[name] = _output(getattr(lut, name)(angles, interpolate), scalar)
+
+    if "y" in input_data and "x" in input_data:
+        scalar = np.ndim(input_data["y"]) == 0 and np.ndim(input_data["x"]) == 0
+        result["atan2"] = _output(lut.atan2(input_data["y"], input_data["x"], interpolate), scalar)
+
+    if not result:
+        raise KeyError("angle")
+
+    result["precision_deg"] = lut.resolution
+    result["method"] = "LUT+lerp" if interpolate else "LUT"
+    return result
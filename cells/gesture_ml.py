@@ -1,3 +1,5 @@
+CONCURRENCY = 'stateless'
+
 # Edge Impulse model (20KB)
 _GESTURES = ["stop", "move", "rotate"]
 def process(input_data):
@@ -1,3 +1,5 @@
+CONCURRENCY = 'stateless'
+
 _GAIT_PATTERNS = {
     "tripod": [(1,0,1,0,1,0), (0,1,0,1,0,1)],  # Binary leg states
     "wave": [(1,0,0,0,0,0), (0,1,0,0,0,0), ...]
@@ -1,8 +1,232 @@
+import os
+import math
+import time
+import base64
+import struct
+import threading
+import numpy as np
+from collections import OrderedDict
+
+CONCURRENCY = 'session'  # streaming mode keeps the previous scan per (user, session)
+
+DEFAULT_PRECISION = 0.001  # quantization step in scan units (1 mm for metres)
+STREAM_TTL = float(os.getenv('LIDAR_STREAM_TTL', 300))  # seconds idle before a reference scan is dropped
+MAX_STREAMS = int(os.getenv('LIDAR_MAX_STREAMS', 10000))
+
+# magic, frame type, point count, precision
+_HEADER = struct.Struct('>4sBId')
+_MAGIC = b'LDC1'
+KEY_FRAME, INTER_FRAME = 0, 1
+_MAX_VARINT_BYTES = 10  # enough for any uint64
+# Largest |quantized value|: deltas between two of them, zigzagged and
+# shifted for the escape bit, must still fit in a uint64
+_MAX_QUANTIZED = 2**60
+
+
+# Varint / zigzag primitives, vectorized over whole scans
+
+def _zigzag(values):
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+def _unzigzag(values):
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+def _varint_lengths(values):
+    lengths = np.ones(values.shape, dtype=np.intp)
+    for k in range(1, _MAX_VARINT_BYTES):
+        lengths += values >= np.uint64(1 << (7 * k))
+    return lengths
+
+def _varint_encode(values):
+    """LEB128 byte stream for a uint64 array, built column by column"""
+    lengths = _varint_lengths(values)
+    offsets = np.cumsum(lengths) - lengths
+    out = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for k in range(int(lengths.max(initial=0))):
+        has_byte = lengths > k
+        chunk = (values[has_byte] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (lengths[has_byte] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[offsets[has_byte] + k] = (chunk | more).astype(np.uint8)
+    return out.tobytes()
+
+def _varint_decode(data, count):
+    raw = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero((raw & 0x80) == 0)
+    if len(ends) != count or (len(raw) and ends[-1] != len(raw) - 1):
+        raise ValueError("Corrupt stream: varint count does not match header")
+    if not count:
+        return np.zeros(0, dtype=np.uint64)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    # Byte position inside its own varint
+    position = np.arange(len(raw)) - np.repeat(starts, ends - starts + 1)
+    if position.max() >= _MAX_VARINT_BYTES:
+        raise ValueError("Corrupt stream: varint too long")
+    shifted = (raw & 0x7F).astype(np.uint64) << (7 * position).astype(np.uint64)
+    return np.bitwise_or.reduceat(shifted, starts)
+
+
+# Codec
+
+def _quantize(scan, precision):
+    values = np.asarray(scan, dtype=np.float64)
+    if values.ndim != 1:
+        raise ValueError("scan must be a flat list of distances")
+    if not np.isfinite(values).all():
+        raise ValueError("scan contains non-finite distances")
+    with np.errstate(over='ignore'):
+        scaled = np.rint(values / precision)
+    # Checked before the int64 cast, which would wrap silently
+    if not np.isfinite(scaled).all() or np.abs(scaled).max(initial=0.0) >= _MAX_QUANTIZED:
+        raise ValueError(f"scan values exceed the representable range at precision {precision}")
+    return scaled.astype(np.int64)
+
+def _tokens(relative, absolute):
+    """
+    Escape-flagged tokens: low bit 0 = zigzag value relative to the
+    prediction, low bit 1 = zigzag absolute value. Per point, whichever is
+    shorter as a varint wins.
+    """
+    as_delta = _zigzag(relative) << np.uint64(1)
+    as_absolute = (_zigzag(absolute) << np.uint64(1)) | np.uint64(1)
+    escape = _varint_lengths(as_absolute) < _varint_lengths(as_delta)
+    return np.where(escape, as_absolute, as_delta)
+
+def encode(quantized, precision, reference=None):
+    """
+    Byte stream for a quantized scan. With a same-length `reference` scan
+    the points are coded against it (inter frame), otherwise against their
+    predecessor in the same scan (key frame).
+    """
+    if reference is not None and len(reference) == len(quantized):
+        frame = INTER_FRAME
+        relative = quantized - reference
+    else:
+        frame = KEY_FRAME
+        relative = np.diff(quantized, prepend=0)
+    tokens = _tokens(relative, quantized)
+    return _HEADER.pack(_MAGIC, frame, len(quantized), precision) + _varint_encode(tokens)
+
+def decode(data, reference=None):
+    """Inverse of encode(): returns (quantized scan, precision, frame type)"""
+    if len(data) < _HEADER.size:
+        raise ValueError("Corrupt stream: truncated header")
+    magic, frame, count, precision = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError("Not a lidar_compress stream")
+    if frame not in (KEY_FRAME, INTER_FRAME):
+        raise ValueError(f"Corrupt stream: unknown frame type {frame}")
+
+    tokens = _varint_decode(data[_HEADER.size:], count)
+    escape = (tokens & np.uint64(1)).astype(bool)
+    payload = _unzigzag(tokens >> np.uint64(1))
+
+    if frame == INTER_FRAME:
+        if reference is None or len(reference) != count:
+            raise ValueError("Inter frame needs the previous scan of the stream as reference")
+        return np.where(escape, payload, reference + payload), precision, frame
+
+    # Key frame: a running sum of deltas that restarts at every absolute
+    # value. Cumsum the deltas once, then shift each segment by the offset
+    # its leading absolute value implies.
+    deltas = np.where(escape, 0, payload)
+    running = np.cumsum(deltas)
+    segment = np.cumsum(escape)
+    offsets = np.concatenate(([0], (payload - running)[escape]))
+    return running + offsets[segment], precision, frame
+
+
+# Reference scans keyed by (user_id, session_id, direction, stream_id), least recently used first
+_STREAMS = OrderedDict()
+_STREAMS_LOCK = threading.Lock()
+
+def _stream_key(input_data, direction):
+    context = input_data.get('_user_context', {})
+    return (context.get('user_id'), context.get('session_id'), direction,
+            input_data.get('stream_id', 'default'))
+
+def _reference(key):
+    with _STREAMS_LOCK:
+        entry = _STREAMS.get(key)
+        if entry is None or time.monotonic() - entry[1] > STREAM_TTL:
+            return None
+        return entry[0]
+
+def _remember(key, quantized):
+    now = time.monotonic()
+    with _STREAMS_LOCK:
+        _STREAMS.pop(key, None)
+        _STREAMS[key] = (quantized, now)
+        while _STREAMS:
+            oldest_key, (_, last_used) = next(iter(_STREAMS.items()))
+            if len(_STREAMS) <= MAX_STREAMS and now - last_used <= STREAM_TTL:
+                break
+            del _STREAMS[oldest_key]
+
+def _throughput(points, seconds):
+    return round(points / seconds / 1e6, 3) if seconds > 0 else None
+
+def _decompress(input_data):
+    data = base64.b64decode(input_data["decompress"])
+    key = _stream_key(input_data, 'decode')
+    start = time.perf_counter()
+    quantized, precision, frame = decode(data, _reference(key) if input_data.get('stream') else None)
+    elapsed = time.perf_counter() - start
+    if input_data.get('stream'):
+        _remember(key, quantized)
+    return {
+        "scan": (quantized * precision).tolist(),
+        "frame": "inter" if frame == INTER_FRAME else "key",
+        "original_size": len(quantized),
+        "decode_mpoints_s": _throughput(len(quantized), elapsed)
+    }
+
 def process(input_data):
-    # Delta encoding for LIDAR scans
+    """
+    Delta encoding for LIDAR scans
+
+    {"scan": [dist1, dist2, ...]} -> base64 "compressed_scan". Distances are
+    quantized to "precision" (default 0.001) and written as zigzag varints;
+    each point is a delta or, flagged in its low bit, an absolute value.
+    "stream": true codes each scan against the previous scan of the same
+    session/"stream_id" (send "keyframe": true to start over).
+    {"decompress": "<base64>"} decodes; pass "stream": true for streams.
+    "verify" (default true) decodes the result and reports decode speed.
+    """
+    if "decompress" in input_data:
+        return _decompress(input_data)
+
+    precision = float(input_data.get("precision", DEFAULT_PRECISION))
+    if not math.isfinite(precision) or precision <= 0:
+        raise ValueError("precision must be a positive number")
     scan = input_data["scan"]  # [dist1, dist2,...]
-    compressed = [scan[0]]
-    for i in range(1, len(scan)):
-        delta = scan[i] - scan[i-1]
-        compressed.append(delta if abs(delta) < 5 else scan[i])
-    return {"compressed_scan": compressed, "original_size": len(scan)}
+    streaming = bool(input_data.get("stream"))
+    key = _stream_key(input_data, 'encode')
+
+    start = time.perf_counter()
+    quantized = _quantize(scan, precision)
+    reference = _reference(key) if streaming and not input_data.get("keyframe") else None
+    data = encode(quantized, precision, reference)
+    encode_time = time.perf_counter() - start
+    if streaming:
+        _remember(key, quantized)
+
+    raw_bytes = len(quantized) * 4  # as float32 distances
+    result = {
+        "compressed_scan": base64.b64encode(data).decode('ascii'),
+        "encoding": "base64",
+        "frame": "inter" if data[4] == INTER_FRAME else "key",
+        "original_size": len(quantized),
+        "compressed_bytes": len(data),
+        "compression_ratio": round(raw_bytes / len(data), 3),
+        "max_error": float(np.max(np.abs(quantized * precision - np.asarray(scan, dtype=np.float64)), initial=0.0)),
+        "encode_mpoints_s": _throughput(len(quantized), encode_time)
+    }
+
+    if input_data.get("verify", True):
+        start = time.perf_counter()
+        decoded, _, _ = decode(data, reference)
+        result["decode_mpoints_s"] = _throughput(len(quantized), time.perf_counter() - start)
+        if not np.array_equal(decoded, quantized):
+            raise RuntimeError("lidar_compress round trip mismatch")
+    return result
@@ -1,26 +1,120 @@
+import base64
+import struct
+import numpy as np
+
+CONCURRENCY = 'stateless'
+
+# Telemetry fields in packet order: (name, struct code, scale, min, max)
+SCHEMA = (
+    ("temp", "b", 10, -128, 127),          # -12.8°C to 12.7°C
+    ("humidity", "B", 1, 0, 255),          # 0% to 100%
+    ("accel_x", "h", 100, -32768, 32767),  # -327.68 to 327.67 m/s²
+    ("battery", "B", 10, 0, 255),          # 0V to 25.5V
+)
+_ERRORS = {
+    "temp": "Temperature out of range",
+    "humidity": "Humidity out of range",
+    "accel_x": "Acceleration out of range",
+    "battery": "Battery voltage out of range",
+}
+
+# Big-endian, unpadded: 5 bytes per packet either way
+RECORD = struct.Struct('>' + ''.join(code for _, code, _, _, _ in SCHEMA))
+_NUMPY_CODES = {'b': 'i1', 'B': 'u1', 'h': '>i2'}
+RECORD_DTYPE = np.dtype([(name, _NUMPY_CODES[code]) for name, code, _, _, _ in SCHEMA])
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+ENCODINGS = {
+    "base64": (lambda data: base64.b64encode(data).decode('ascii'), base64.b64decode),
+    "hex": (lambda data: data.hex(), bytes.fromhex),
+}
+
+
+def _column(records, name):
+    """Field values as floats; missing or non-numeric values become NaN"""
+    values = [record.get(name) if isinstance(record, dict) else None for record in records]
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        column = np.full(len(values), np.nan)
+        for i, value in enumerate(values):
+            try:
+                column[i] = float(value)
+            except (TypeError, ValueError):
+                pass
+        return column
+
+def pack_records(records):
+    """
+    Packs many telemetry records into one contiguous buffer.
+    Returns (buffer, valid, errors): the buffer holds only the valid records,
+    in order; `valid` flags each input record and `errors` maps the index
+    of each rejected record to the reason.
+    """
+    packed = np.zeros(len(records), dtype=RECORD_DTYPE)
+    valid = np.ones(len(records), dtype=bool)
+    errors = {}
+    for name, _, scale, low, high in SCHEMA:
+        # int() semantics of the single-record path: truncate toward zero
+        scaled = np.trunc(_column(records, name) * scale)
+        missing = np.isnan(scaled)
+        in_range = ~missing & (scaled >= low) & (scaled <= high)
+        for i in np.flatnonzero(valid & ~in_range):
+            errors[int(i)] = f"Missing or invalid {name}" if missing[i] else _ERRORS[name]
+        valid &= in_range
+        packed[name] = np.where(in_range, scaled, 0)
+    return packed[valid].tobytes(), valid, errors
+
+def unpack_records(data):
+    """Inverse of pack_records(): a list of telemetry dicts"""
+    if len(data) % RECORD.size:
+        raise ValueError(f"Buffer length {len(data)} is not a multiple of {RECORD.size}")
+    packed = np.frombuffer(data, dtype=RECORD_DTYPE)
+    columns = [(packed[name] / scale).tolist() for name, _, scale, _, _ in SCHEMA]
+    names = [name for name, _, _, _, _ in SCHEMA]
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+def _pack_one(input_data):
+    fields = []
+    for name, _, scale, low, high in SCHEMA:
+        value = int(input_data[name] * scale)
+        if not low <= value <= high:
+            raise ValueError(_ERRORS[name])
+        fields.append(value)
+    return RECORD.pack(*fields)
+
+def _encoding(input_data):
+    encoding = input_data.get("encoding", "base64")
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}', expected one of {tuple(ENCODINGS)}")
+    return encoding
+
 def process(input_data):
-    # Validate and convert temperature (-12.8°C to 12.7°C)
-    temp_int = int(input_data["temp"] * 10)
-    if not -128 <= temp_int <= 127:
-        raise ValueError("Temperature out of range")
-    temp = temp_int.to_bytes(1, 'big', signed=True)
-    
-    # Validate and convert humidity (0% to 100%)
-    hum_int = int(input_data["humidity"])
-    if not 0 <= hum_int <= 255:
-        raise ValueError("Humidity out of range")
-    hum = hum_int.to_bytes(1, 'big')
-    
-    # Validate and convert acceleration (-327.68 to 327.67 m/s²)
-    accel_int = int(input_data["accel_x"] * 100)
-    if not -32768 <= accel_int <= 32767:
-        raise ValueError("Acceleration out of range")
-    accel = accel_int.to_bytes(2, 'big', signed=True)
-    
-    # Validate and convert battery voltage (0V to 25.5V)
-    bat_int = int(input_data["battery"] * 10)
-    if not 0 <= bat_int <= 255:
-        raise ValueError("Battery voltage out of range")
-    bat = bat_int.to_bytes(1, 'big')
-    
-    return {"lora_packet": temp + hum + accel + bat}
+    """
+    Packs telemetry into 5-byte LoRa packets (temp, humidity, accel_x, battery)
+
+    - one record: {"temp": ..., "humidity": ..., "accel_x": ..., "battery": ...}
+    - many records: {"records": [{...}, ...]} -> one buffer of the valid
+      records plus per-record "valid" flags and "errors"
+    - {"unpack": "<encoded buffer>"} -> the records it holds
+    "encoding" is "base64" (default) or "hex".
+    """
+    encoding = _encoding(input_data)
+    encode, decode = ENCODINGS[encoding]
+
+    if "unpack" in input_data:
+        records = unpack_records(decode(input_data["unpack"]))
+        return {"records": records, "count": len(records)}
+
+    if "records" in input_data:
+        buffer, valid, errors = pack_records(input_data["records"])
+        return {
+            "lora_packets": encode(buffer),
+            "encoding": encoding,
+            "record_size": RECORD.size,
+            "count": int(valid.sum()),
+            "valid": valid.tolist(),
+            "errors": {str(i): reason for i, reason in errors.items()}
+        }
+
+    return {"lora_packet": encode(_pack_one(input_data)), "encoding": encoding}
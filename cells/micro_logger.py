@@ -1,5 +1,7 @@
 import time
 
+CONCURRENCY = 'global'  # _LOG_BUFFER is shared by every caller
+
 _LOG_BUFFER = []
 def process(input_data):
     # Circular buffer with 8 entries
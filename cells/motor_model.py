@@ -1,3 +1,5 @@
+CONCURRENCY = 'stateless'
+
 _MOTOR_PARAMS = {
     "maxon_ec45": {"kt": 0.042, "r": 2.3, "i_no_load": 0.1}
 }
@@ -1,5 +1,7 @@
 import numpy as np
 
+CONCURRENCY = 'stateless'
+
 def bresenham_3d(start, end):
     """Memory-efficient 3D line voxelization"""
     # ... (implementation omitted for brevity)
@@ -1,32 +1,216 @@
+import os
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+
+CONCURRENCY = 'session'  # controller banks live per (user, session)
+
+Q15 = 32768
+DEFAULT_GAINS = (32768, 1638, 6553)  # 1.0, 0.05, 0.2 in Q15
+_INT32_MIN, _INT32_MAX = -2**31, 2**31 - 1
+_INT64_SAFE = 2**62  # int64 multiply-accumulate headroom for three products
+
+CONTROLLER_TTL = float(os.getenv('PID_CONTROLLER_TTL', 300))  # seconds idle before eviction
+MAX_CONTROLLERS = int(os.getenv('PID_MAX_CONTROLLERS', 4096))  # per session
+MAX_SESSIONS = int(os.getenv('PID_MAX_SESSIONS', 10000))
+
+
+def _finite(values, name):
+    # NaN/inf have no Q15 value; they would turn into INT32/INT64 garbage
+    values = np.asarray(values, dtype=np.float64)
+    if not np.all(np.isfinite(values)):
+        raise ValueError(f"{name} must be finite numbers")
+    return values
+
+
+def _to_q15(values, name="values"):
+    q = np.rint(_finite(values, name) * Q15)
+    return np.clip(q, _INT32_MIN, _INT32_MAX).astype(np.int64)
+
+
+class ControllerBank:
+    """
+    Q15 PID state for the controllers of one session.
+
+    State is kept in parallel int64 arrays (one row per controller id), so
+    a call updating many controllers is a handful of NumPy operations.
+    """
+
+    def __init__(self):
+        self.index = {}  # controller id -> row
+        self.ids = []
+        self.gains = np.empty((0, 3), dtype=np.int64)
+        self.integral = np.empty(0, dtype=np.int64)
+        self.last_error = np.empty(0, dtype=np.int64)
+        self.last_used = np.empty(0, dtype=np.float64)
+        self.touched = time.monotonic()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self, controller_ids):
+        new_ids = [cid for cid in dict.fromkeys(controller_ids) if cid not in self.index]
+        if new_ids:
+            if len(self.ids) + len(new_ids) > MAX_CONTROLLERS:
+                raise ValueError(f"Session would exceed {MAX_CONTROLLERS} controllers")
+            for cid in new_ids:
+                self.index[cid] = len(self.ids)
+                self.ids.append(cid)
+            n = len(new_ids)
+            self.gains = np.vstack([self.gains, np.tile(np.array(DEFAULT_GAINS, dtype=np.int64), (n, 1))])
+            self.integral = np.concatenate([self.integral, np.zeros(n, dtype=np.int64)])
+            self.last_error = np.concatenate([self.last_error, np.zeros(n, dtype=np.int64)])
+            self.last_used = np.concatenate([self.last_used, np.full(n, time.monotonic())])
+        return np.fromiter((self.index[cid] for cid in controller_ids), dtype=np.intp, count=len(controller_ids))
+
+    def configure(self, controller_ids, gains):
+        """gains: [kp, ki, kd] floats for all ids, or one triple per id"""
+        gains = _to_q15(np.broadcast_to(np.asarray(gains, dtype=np.float64), (len(controller_ids), 3)))
+        self.gains[self.rows(controller_ids)] = gains
+
+    def reset(self, controller_ids):
+        rows = self.rows(controller_ids)
+        self.integral[rows] = 0
+        self.last_error[rows] = 0
+
+    def step(self, controller_ids, errors):
+        """One control step for each listed controller; returns (outputs, integrals) as floats"""
+        error = _to_q15(errors)
+        if error.shape != (len(controller_ids),):
+            raise ValueError("controllers and errors must have the same length")
+        rows = self.rows(controller_ids)
+
+        # Calculate integral term with anti-windup (32-bit clamping)
+        integral = np.clip(self.integral[rows] + error, _INT32_MIN, _INT32_MAX)
+        derivative = error - self.last_error[rows]
+        gains = self.gains[rows]
+        terms = (error, integral, derivative)
+        if len(rows) and int(np.abs(gains).max()) * max(int(np.abs(t).max()) for t in terms) >= _INT64_SAFE // 3:
+            # Large gains would overflow int64; Python ints give the scalar path's exact result
+            gains = gains.astype(object)
+            terms = tuple(t.astype(object) for t in terms)
+        output = (gains[:, 0] * terms[0] + gains[:, 1] * terms[1] + gains[:, 2] * terms[2]) // Q15
+        output = np.asarray(output / Q15, dtype=np.float64)
+
+        self.integral[rows] = integral
+        self.last_error[rows] = error
+        self.last_used[rows] = time.monotonic()
+        return output, integral / Q15
+
+    def evict_idle(self, ttl):
+        keep = self.last_used >= time.monotonic() - ttl
+        if keep.all():
+            return 0
+        self.ids = [cid for cid, k in zip(self.ids, keep) if k]
+        self.index = {cid: row for row, cid in enumerate(self.ids)}
+        self.gains = self.gains[keep]
+        self.integral = self.integral[keep]
+        self.last_error = self.last_error[keep]
+        self.last_used = self.last_used[keep]
+        return int((~keep).sum())
+
+
+# Controller banks keyed by (user_id, session_id), least recently used first
+_BANKS = OrderedDict()
+_BANKS_LOCK = threading.Lock()
+
+def _bank_for(input_data):
+    context = input_data.get('_user_context', {})
+    key = (context.get('user_id'), context.get('session_id'))
+    now = time.monotonic()
+    with _BANKS_LOCK:
+        bank = _BANKS.pop(key, None)
+        if bank is None or now - bank.touched > CONTROLLER_TTL:
+            bank = ControllerBank()
+        bank.touched = now
+        _BANKS[key] = bank
+        # Drop whole sessions that went quiet from the cold end, and enforce the size bound
+        while _BANKS:
+            oldest_key, oldest = next(iter(_BANKS.items()))
+            if len(_BANKS) <= MAX_SESSIONS and now - oldest.touched <= CONTROLLER_TTL:
+                break
+            del _BANKS[oldest_key]
+    return bank
+
+def _process_bank(input_data):
+    """
+    Streaming mode: state stays server-side between calls.
+    {"controllers": ["m1", "m2"], "errors": [0.1, -0.2],
+     "gains": [kp, ki, kd] or {"m1": [kp, ki, kd]}, "reset": ["m1"]}
+    """
+    controller_ids = list(input_data["controllers"])
+    if len(set(controller_ids)) != len(controller_ids):
+        raise ValueError("Controller ids must be unique within one call")
+
+    # Validate everything before touching the bank, so a rejected call
+    # leaves no controllers allocated
+    errors = _finite(input_data["errors"], "errors")
+    if errors.shape != (len(controller_ids),):
+        raise ValueError("controllers and errors must have the same length")
+    gains = input_data.get("gains")
+    if isinstance(gains, dict):
+        gains = {cid: np.broadcast_to(_finite(triple, "gains"), (3,)) for cid, triple in gains.items()}
+    elif gains is not None:
+        gains = np.broadcast_to(_finite(gains, "gains"), (len(controller_ids), 3))
+    reset = list(input_data.get("reset") or [])
+
+    bank = _bank_for(input_data)
+    bank.evict_idle(CONTROLLER_TTL)
+    # Registers every new id at once, after the capacity check
+    configured = list(gains) if isinstance(gains, dict) else []
+    bank.rows(controller_ids + configured + reset)
+
+    if isinstance(gains, dict):
+        for cid, triple in gains.items():
+            bank.configure([cid], triple)
+    elif gains is not None:
+        bank.configure(controller_ids, gains)
+    if reset:
+        bank.reset(reset)
+
+    outputs, integrals = bank.step(controller_ids, errors)
+    return {
+        "controllers": controller_ids,
+        "outputs": outputs.tolist(),
+        "integral": integrals.tolist(),
+        "active_controllers": len(bank)
+    }
+
 def process(input_data):
     """PID controller using Q15 fixed-point arithmetic"""
     try:
+        if "controllers" in input_data:
+            return _process_bank(input_data)
+
         # Fixed-point coefficients (Q15 format)
-        Kp, Ki, Kd = 32768, 1638, 6553  # 1.0, 0.05, 0.2 in Q15
-        
-        # Convert inputs to fixed-point
-        error = int(round(float(input_data["error"]) * 32768))
-        last_error = int(round(float(input_data.get("last_error", 0)) * 32768))
-        integral = int(round(float(input_data.get("integral", 0)) * 32768))
-        
+        Kp, Ki, Kd = (int(g) for g in _to_q15(input_data["gains"], "gains")) if "gains" in input_data else DEFAULT_GAINS
+
+        # Convert inputs to fixed-point (32-bit, as in the controller bank)
+        error, last_error, integral = (int(v) for v in _to_q15([
+            float(input_data["error"]),
+            float(input_data.get("last_error", 0)),
+            float(input_data.get("integral", 0))
+        ], "error, last_error and integral"))
+
         # Calculate integral term with anti-windup
         new_integral = integral + error
         integral = min(max(new_integral, -2**31), 2**31-1)  # 32-bit clamping
-        
+
         # Calculate derivative term
         derivative = error - last_error
-        
+
         # Calculate PID output (using integer arithmetic)
         output = (Kp * error + Ki * integral + Kd * derivative) // 32768  # Use floor division instead of >>
-        
+
         # Convert back to floating point
         return {
             "output": float(output) / 32768.0,
             "integral": float(integral) / 32768.0,
             "last_error": float(error) / 32768.0
         }
-        
-    except (KeyError, ValueError) as e:
+
+    except (KeyError, ValueError, TypeError) as e:
         # Handle missing or invalid input data
         return {
             "output": 0.0,
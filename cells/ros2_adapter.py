@@ -1,4 +1,6 @@
 import time
+
+CONCURRENCY = 'stateless'
 def process(input_data):
     # Converts between your API and ROS2 messages
     return {
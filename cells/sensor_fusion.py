@@ -1,39 +1,259 @@
+import os
+import time
+import threading
 import numpy as np
-from collections import deque
+from collections import OrderedDict
+
+CONCURRENCY = 'session'  # filter state is kept per (user, session)
+
+DEFAULT_DT = 0.1  # seconds between IMU samples when none is given
+FILTER_TTL = float(os.getenv('SENSOR_FUSION_TTL', 300))  # seconds idle before a filter is dropped
+MAX_FILTERS = int(os.getenv('SENSOR_FUSION_MAX_FILTERS', 10000))
+MAX_TRACKS = int(os.getenv('SENSOR_FUSION_MAX_TRACKS', 100000))  # per fleet
+
+
+def _inv2(S):
+    """Closed-form inverse of a 2x2 matrix"""
+    a, b = S[0]
+    c, d = S[1]
+    det = a * d - b * c
+    return np.array([[d, -b], [-c, a]]) / det
+
 
 class KalmanFilter:
+    # Constant matrices, built once instead of on every update()
+    H = np.array([[1., 0., 0.], [0., 1., 0.]])  # Measurement function
+    HT = H.T.copy()
+    I = np.eye(3)
+
     def __init__(self, dim_x=3, dim_z=2):
         self.x = np.zeros(dim_x)  # State [x, y, theta]
         self.P = np.eye(dim_x)   # Covariance
         self.Q = np.eye(dim_x)*0.01  # Process noise
         self.R = np.eye(dim_z)*0.1   # Measurement noise
-        
+
+    def predict(self, accel, gyro, dt=DEFAULT_DT):
+        # Prediction step (simplified)
+        self.x[0] += accel[0] * dt
+        self.x[1] += accel[1] * dt
+        self.x[2] += gyro * dt
+        self.P += self.Q
+
     def update(self, z):
         # Simplified Kalman update (reduced matrix ops)
-        H = np.array([[1,0,0],[0,1,0]])  # Measurement function
-        y = z - H @ self.x
-        S = H @ self.P @ H.T + self.R
-        K = self.P @ H.T @ np.linalg.pinv(S)
+        y = z - self.H @ self.x
+        PHT = self.P @ self.HT
+        S = self.H @ PHT + self.R
+        K = PHT @ _inv2(S)
         self.x += K @ y
-        self.P = (np.eye(len(self.x)) - K @ H) @ self.P
+        self.P = (self.I - K @ self.H) @ self.P
+
+
+class BatchKalmanFilter:
+    """
+    The same filter for N independent tracks at once.
+
+    States are stacked into x (N, 3) and P (N, 3, 3); predict/update run as
+    a few broadcast/einsum operations for the whole fleet instead of N
+    rounds of tiny 3x3 NumPy calls.
+    """
+
+    def __init__(self, n=0):
+        self.x = np.zeros((n, 3))
+        self.P = np.tile(np.eye(3), (n, 1, 1))
+        self.Q = np.eye(3)*0.01
+        self.R = np.eye(2)*0.1
+        self.ids = []
+        self.index = {}  # track id -> row
+
+    def rows(self, track_ids):
+        new_ids = [tid for tid in dict.fromkeys(track_ids) if tid not in self.index]
+        if new_ids:
+            if len(self.ids) + len(new_ids) > MAX_TRACKS:
+                raise ValueError(f"Fleet would exceed {MAX_TRACKS} tracks")
+            for tid in new_ids:
+                self.index[tid] = len(self.ids)
+                self.ids.append(tid)
+            n = len(new_ids)
+            self.x = np.concatenate([self.x, np.zeros((n, 3))])
+            self.P = np.concatenate([self.P, np.tile(np.eye(3), (n, 1, 1))])
+        return np.fromiter((self.index[tid] for tid in track_ids), dtype=np.intp, count=len(track_ids))
+
+    def predict(self, accel, gyro, dt=DEFAULT_DT, rows=slice(None)):
+        dt = np.asarray(dt, dtype=np.float64)
+        self.x[rows, :2] += np.asarray(accel, dtype=np.float64) * dt[..., None]
+        self.x[rows, 2] += np.asarray(gyro, dtype=np.float64) * dt
+        self.P[rows] += self.Q
+
+    def update(self, z, rows=slice(None)):
+        """z: (M, 2) GPS fixes for the tracks selected by `rows`"""
+        x = self.x[rows]
+        P = self.P[rows]
+        # With H = [I2 | 0]: H P H^T = P[:2, :2] and P H^T = P[:, :2]
+        S = P[:, :2, :2] + self.R
+        det = S[:, 0, 0] * S[:, 1, 1] - S[:, 0, 1] * S[:, 1, 0]
+        S_inv = np.stack([
+            np.stack([S[:, 1, 1], -S[:, 0, 1]], axis=-1),
+            np.stack([-S[:, 1, 0], S[:, 0, 0]], axis=-1)
+        ], axis=1) / det[:, None, None]
+        K = np.einsum('nij,njk->nik', P[:, :, :2], S_inv)
+        y = np.asarray(z, dtype=np.float64) - x[:, :2]
+        self.x[rows] = x + np.einsum('nij,nj->ni', K, y)
+        self.P[rows] = P - np.einsum('nij,njk->nik', K, P[:, :2, :])
+
+
+# Filters keyed by (user_id, session_id, filter_id), least recently used first
+_FILTERS = OrderedDict()
+_FILTERS_LOCK = threading.Lock()
+
+def _filter_for(input_data, factory=KalmanFilter):
+    context = input_data.get('_user_context', {})
+    key = (context.get('user_id'), context.get('session_id'), factory.__name__,
+           input_data.get('filter_id', 'default'))
+    now = time.monotonic()
+    with _FILTERS_LOCK:
+        entry = _FILTERS.pop(key, None)
+        if entry is None or input_data.get('reset') or now - entry[1] > FILTER_TTL:
+            kf = factory()
+        else:
+            kf = entry[0]
+        _FILTERS[key] = (kf, now)
+        # Evict expired filters from the cold end, and enforce the size bound
+        while _FILTERS:
+            oldest_key, (_, last_used) = next(iter(_FILTERS.items()))
+            if len(_FILTERS) <= MAX_FILTERS and now - last_used <= FILTER_TTL:
+                break
+            del _FILTERS[oldest_key]
+    return kf
+
+def _samples(input_data):
+    """Time-ordered (imu, gps, dt) tuples from 'samples', or the single imu/gps reading"""
+    if 'samples' not in input_data:
+        # Mock data - replace with real sensor inputs
+        imu_data = input_data.get("imu", {"accel": [0.1, 0.02], "gyro": 0.05})
+        gps_data = input_data.get("gps", [10.5, 20.3])
+        return [(imu_data, gps_data, input_data.get("dt", DEFAULT_DT))]
+
+    samples = input_data['samples']
+    if samples and all('t' in s for s in samples):
+        samples = sorted(samples, key=lambda s: s['t'])
+        times = [s['t'] for s in samples]
+        dts = [samples[0].get('dt', DEFAULT_DT)] + [b - a for a, b in zip(times, times[1:])]
+    else:
+        dts = [s.get('dt', DEFAULT_DT) for s in samples]
+    return [(s.get('imu'), s.get('gps'), dt) for s, dt in zip(samples, dts)]
+
+def _process_fleet(input_data):
+    """
+    {"tracks": ["r1", "r2", ...],
+     "imu": {"accel": [[ax, ay], ...], "gyro": [g, ...]},
+     "gps": [[x, y] | null, ...], "dt": s | [s, ...]}
+    """
+    track_ids = list(input_data['tracks'])
+    if len(set(track_ids)) != len(track_ids):
+        raise ValueError("Track ids must be unique within one call")
+    n = len(track_ids)
+
+    # Validate everything before touching the fleet, so a rejected call
+    # neither allocates tracks nor half-applies a step
+    imu_data = input_data.get('imu')
+    if imu_data is not None:
+        try:
+            accel = np.broadcast_to(np.asarray(imu_data['accel'], dtype=np.float64), (n, 2))
+            gyro = np.broadcast_to(np.asarray(imu_data['gyro'], dtype=np.float64), (n,))
+            dt = np.broadcast_to(np.asarray(input_data.get('dt', DEFAULT_DT), dtype=np.float64), (n,))
+        except ValueError:
+            raise ValueError("imu accel, gyro and dt must have one entry per track")
+    gps_data = input_data.get('gps')
+    if gps_data is not None:
+        gps_data = list(gps_data)
+        if len(gps_data) != n:
+            raise ValueError("gps must have one fix (or null) per track")
+        has_fix = np.fromiter((z is not None for z in gps_data), dtype=bool, count=n)
+        fixes = np.asarray([z for z in gps_data if z is not None], dtype=np.float64).reshape(-1, 2)
+        if len(fixes) != has_fix.sum():
+            raise ValueError("gps fixes must be [x, y] pairs")
+
+    fleet = BatchKalmanFilter() if input_data.get('stateless') else _filter_for(input_data, BatchKalmanFilter)
+    rows = fleet.rows(track_ids)
+
+    if imu_data is not None:
+        fleet.predict(accel, gyro, dt, rows)
+
+    # Tracks without a fix this step only get the prediction
+    if gps_data is not None and has_fix.any():
+        fleet.update(fixes, rows[has_fix])
 
-def process(input_data):
-    """Fuses IMU + GPS + Lidar data"""
-    kf = KalmanFilter()
-    
-    # Mock data - replace with real sensor inputs
-    imu_data = input_data.get("imu", {"accel": [0.1, 0.02], "gyro": 0.05})
-    gps_data = input_data.get("gps", [10.5, 20.3])
-    
-    # Prediction step (simplified)
-    kf.x[0] += imu_data["accel"][0] * 0.1  # Δt assumed 0.1s
-    kf.x[1] += imu_data["accel"][1] * 0.1
-    kf.x[2] += imu_data["gyro"] * 0.1
-    
-    # Update with GPS (2D position only)
-    kf.update(np.array(gps_data))
-    
     return {
+        "tracks": track_ids,
+        "fused_state": fleet.x[rows].tolist(),
+        "covariance": np.diagonal(fleet.P[rows], axis1=1, axis2=2).tolist()
+    }
+
+def process(input_data):
+    """
+    Fuses IMU + GPS + Lidar data
+
+    The filter state persists per session (and optional "filter_id")
+    between calls; "reset": true starts over and "stateless": true neither
+    reads nor stores session state. "samples" is a time-ordered list of
+    {"imu": {...}, "gps": [x, y] | null, "dt" | "t"} processed in one call.
+    "tracks" switches to fleet mode: one step for many robots at once.
+    """
+    if 'tracks' in input_data:
+        return _process_fleet(input_data)
+
+    kf = KalmanFilter() if input_data.get('stateless') else _filter_for(input_data)
+    trajectory = [] if input_data.get('return_trajectory') else None
+
+    for imu_data, gps_data, dt in _samples(input_data):
+        if imu_data is not None:
+            kf.predict(imu_data["accel"], imu_data["gyro"], dt)
+        # Update with GPS (2D position only)
+        if gps_data is not None:
+            kf.update(np.asarray(gps_data, dtype=np.float64))
+        if trajectory is not None:
+            trajectory.append(kf.x.tolist())
+
+    result = {
         "fused_state": kf.x.tolist(),
         "covariance": kf.P.diagonal().tolist()
-      }
+    }
+    if trajectory is not None:
+        result["trajectory"] = trajectory
+    return result
+
+
+def benchmark(n_tracks=500, steps=20):
+    """Fleet update vs n_tracks sequential KalmanFilter.update calls"""
+    rng = np.random.default_rng(0)
+    fixes = rng.normal(0, 5, size=(steps, n_tracks, 2))
+
+    filters = [KalmanFilter() for _ in range(n_tracks)]
+    start = time.perf_counter()
+    for step in range(steps):
+        for kf, z in zip(filters, fixes[step]):
+            kf.update(z)
+    sequential = time.perf_counter() - start
+
+    fleet = BatchKalmanFilter(n_tracks)
+    start = time.perf_counter()
+    for step in range(steps):
+        fleet.update(fixes[step])
+    batched = time.perf_counter() - start
+
+    error = max(np.abs(fleet.x - np.array([kf.x for kf in filters])).max(),
+                np.abs(fleet.P - np.array([kf.P for kf in filters])).max())
+    return {
+        "tracks": n_tracks,
+        "steps": steps,
+        "sequential_ms": sequential * 1000,
+        "batched_ms": batched * 1000,
+        "speedup": sequential / batched,
+        "max_abs_diff": float(error)
+    }
+
+
+if __name__ == "__main__":
+    for n in (10, 100, 1000):
+        print("Benchmark:", benchmark(n))
@@ -1,5 +1,7 @@
 import time
 
+CONCURRENCY = 'global'  # _CACHE is shared by every caller
+
 _CACHE = {}
 
 def get_cache(key):
@@ -1,3 +1,5 @@
+CONCURRENCY = 'stateless'
+
 def process(input_data):
     # Simple insolation model
     month = input_data["month"]
@@ -1 +1 @@
-
+CONCURRENCY = 'global'  # placeholder, no process() yet: the safe default until it has one
@@ -1,74 +1,183 @@
-import tensorflow as tf 
+import os
+import threading
 import numpy as np
 
-# Initialize the interpreter
 try:
-    _interpreter = tf.lite.Interpreter(model_path="mobilenetv2_quant.tflite")
-    _interpreter.allocate_tensors()
-except Exception as e:
-    raise ValueError(f"Failed to load model: {str(e)}")
+    from tflite_runtime.interpreter import Interpreter
+except ImportError:  # Full TensorFlow install
+    import tensorflow as tf
+    Interpreter = tf.lite.Interpreter
+
+CONCURRENCY = 'stateless'  # every worker thread gets its own interpreter
+MICRO_BATCH = True  # single images from concurrent requests share one invoke()
+
+MODEL_PATH = os.getenv('TINYML_MODEL_PATH', 'mobilenetv2_quant.tflite')
+NUM_THREADS = int(os.getenv('TINYML_NUM_THREADS', 1))  # per interpreter
+MAX_BATCH = int(os.getenv('TINYML_MAX_BATCH', 32))  # images per invoke()
+
+
+class _Engine:
+    """One interpreter whose input is resized to the batch size it is given"""
+
+    def __init__(self):
+        try:
+            self.interpreter = Interpreter(model_path=MODEL_PATH, num_threads=NUM_THREADS)
+            self.interpreter.allocate_tensors()
+        except Exception as e:
+            raise ValueError(f"Failed to load model: {str(e)}")
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        # Typically [1, height, width, 3]
+        self.batch_size, self.height, self.width, self.channels = (int(d) for d in self.input['shape'])
+        self.dynamic = True
+
+    def _resize_batch(self, n, force=False):
+        if n == self.batch_size and not force:
+            return
+        self.interpreter.resize_tensor_input(self.input['index'], [n, self.height, self.width, self.channels])
+        self.interpreter.allocate_tensors()
+        self.batch_size = n
+
+    def infer(self, batch):
+        """(N, H, W, C) model-sized input -> (N, classes) scores"""
+        if self.dynamic:
+            try:
+                self._resize_batch(len(batch))
+            except Exception:
+                # Model with a fixed batch dimension: fall back to one image per invoke().
+                # The failed resize may already have changed the input tensor, so
+                # restore it even though batch_size still reads 1
+                self.dynamic = False
+                self._resize_batch(1, force=True)
+        if not self.dynamic:
+            return np.concatenate([self._invoke(batch[i:i + 1]) for i in range(len(batch))])
+        return self._invoke(batch)
+
+    def _invoke(self, batch):
+        self.interpreter.set_tensor(self.input['index'], batch.astype(self.input['dtype'], copy=False))
+        self.interpreter.invoke()
+        # Copy: the tensor buffer is reused by the next invoke()
+        return np.array(self.interpreter.get_tensor(self.output['index']))
+
+
+_local = threading.local()
+
+def _engine():
+    # Built lazily, the first time a thread classifies something
+    engine = getattr(_local, 'engine', None)
+    if engine is None:
+        engine = _local.engine = _Engine()
+    return engine
+
+
+def _resize_stack(stack, height, width):
+    """
+    Resizes an (N, h, w, C) stack straight into one (N, height, width, C)
+    batch buffer, each image in a single cv2.resize over all its channels.
+    (Packing the whole stack into one (h, w, N*C) resize measured several
+    times slower: the transposes cost more than the per-image calls.)
+    """
+    import cv2
+    resized = np.empty((len(stack), height, width, stack.shape[3]), dtype=stack.dtype)
+    for i, image in enumerate(stack):
+        resized[i] = cv2.resize(image, (width, height), dst=resized[i])
+    return resized
+
+def _as_image(image, channels):
+    image = np.asarray(image, dtype=np.uint8)
+    if image.ndim == 4 and image.shape[0] == 1:  # [1, H, W, C]
+        image = image[0]
+    if image.ndim == 2:
+        image = np.repeat(image[:, :, None], channels, axis=2)
+    if image.ndim != 3 or image.shape[2] != channels:
+        raise ValueError(f"Input shape {image.shape} doesn't match model expectation (H, W, {channels})")
+    return image
+
+def classify(images):
+    """
+    Classifies a list of images ([H, W, C] uint8 arrays or nested lists).
+    Returns one result per image; an image that can't be used gets an error
+    result instead of failing the others.
+    """
+    engine = _engine()
+    results = [None] * len(images)
+
+    # Same-sized images are resized together as one stack
+    groups = {}
+    for i, image in enumerate(images):
+        try:
+            image = _as_image(image, engine.channels)
+        except Exception as e:
+            results[i] = {"error": str(e), "status": "failed"}
+            continue
+        groups.setdefault(image.shape, []).append((i, image))
+
+    for shape, members in groups.items():
+        stack = np.stack([image for _, image in members])
+        if shape[:2] != (engine.height, engine.width):
+            stack = _resize_stack(stack, engine.height, engine.width)
+        scores = np.concatenate([engine.infer(stack[i:i + MAX_BATCH]) for i in range(0, len(stack), MAX_BATCH)])
+        if scores.size == 0:
+            raise ValueError("Model returned empty output")
+        for (i, _), output in zip(members, scores):
+            results[i] = {
+                "class_id": int(np.argmax(output)),
+                "confidence": float(np.max(output)),
+                "status": "success"
+            }
+    return results
+
+def _images(input_data):
+    if isinstance(input_data, dict):
+        if "images" in input_data:
+            return list(input_data["images"])
+        return [input_data["image"]]
+    return [input_data]  # Bare image, as the cell originally took it
 
-# Get input and output details
-input_details = _interpreter.get_input_details()
-output_details = _interpreter.get_output_details()
-print("Input details:", input_details)
-print("Output details:", output_details)
 
 def process(input_data):
+    """
+    Image classification with a TFLite model
+
+    Takes an image ([H, W, C] nested list), {"image": ...} or
+    {"images": [...]}; the latter returns {"results": [...]} from batched
+    inference.
+    """
     try:
-        # Convert input to numpy array
-        input_tensor = np.array(input_data, dtype=np.uint8)
-        
-        # Get expected input shape from model (typically [1, height, width, 3])
-        expected_shape = input_details[0]['shape']
-        print(f"Expected shape: {expected_shape}")
-        
-        # Resize input to match model expectations
-        if input_tensor.ndim == 3:  # If input is [H,W,C]
-            # Add batch dimension
-            input_tensor = np.expand_dims(input_tensor, axis=0)
-        
-        # Check if we need to resize the spatial dimensions
-        if (input_tensor.shape[1] != expected_shape[1] or 
-            input_tensor.shape[2] != expected_shape[2]):
-            print(f"Resizing input from {input_tensor.shape} to {expected_shape}")
-            import cv2
-            input_tensor = np.stack([
-                cv2.resize(input_tensor[0,:,:,i], 
-                          (expected_shape[2], expected_shape[1]))
-                for i in range(3)
-            ], axis=-1)
-            input_tensor = np.expand_dims(input_tensor, axis=0)
-        
-        print(f"Final input shape: {input_tensor.shape}")
-        
-        # Verify input shape matches model expectation
-        if input_tensor.shape != tuple(expected_shape):
-            raise ValueError(f"Input shape {input_tensor.shape} doesn't match model expectation {expected_shape}")
-        
-        # Set input and run inference
-        _interpreter.set_tensor(input_details[0]['index'], input_tensor)
-        _interpreter.invoke()
-        
-        # Get output
-        output = _interpreter.get_tensor(output_details[0]['index'])
-        print(f"Raw output: {output}")
-        
-        if output.size == 0:
-            raise ValueError("Model returned empty output")
-            
-        output = output[0]  # Get first batch if exists
-        class_id = int(np.argmax(output))
-        confidence = float(np.max(output))
-        
-        return {
-            "class_id": class_id,
-            "confidence": confidence,
-            "status": "success"
-        }
-        
+        results = classify(_images(input_data))
+        if isinstance(input_data, dict) and "images" in input_data:
+            return {"results": results, "status": "success"}
+        return results[0]
     except Exception as e:
         return {
             "error": str(e),
             "status": "failed"
         }
+
+def process_batch(inputs):
+    """[{"image": ...}, ...] -> one result per input, inferred as one batch"""
+    images = []
+    owners = []
+    results = [None] * len(inputs)
+    for i, item in enumerate(inputs):
+        try:
+            item_images = _images(item)
+        except Exception as e:
+            results[i] = {"error": str(e), "status": "failed"}
+            continue
+        images.extend(item_images)
+        owners.append((i, len(item_images)))
+
+    try:
+        classified = iter(classify(images))
+    except Exception as e:
+        failed = {"error": str(e), "status": "failed"}
+        return [result or dict(failed) for result in results]
+
+    for i, count in owners:
+        item_results = [next(classified) for _ in range(count)]
+        if isinstance(inputs[i], dict) and "images" in inputs[i]:
+            results[i] = {"results": item_results, "status": "success"}
+        else:
+            results[i] = item_results[0]
+    return results
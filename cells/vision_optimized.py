@@ -1,30 +1,113 @@
+import time
+import threading
 import cv2
 import numpy as np
 
+CONCURRENCY = 'stateless'
+
+DEFAULT_MIN_AREA = 100
+DEFAULT_CANNY = (50, 150)
+_MAX_DETECTORS = 32  # per thread
+
+# SimpleBlobDetector keeps per-call state internally, so each thread
+# caches its own detectors, keyed by their parameters
+_local = threading.local()
+
+def _detector(min_area, max_area):
+    detectors = getattr(_local, 'detectors', None)
+    if detectors is None:
+        detectors = _local.detectors = {}
+    key = (min_area, max_area)
+    detector = detectors.get(key)
+    if detector is None:
+        if len(detectors) >= _MAX_DETECTORS:
+            detectors.pop(next(iter(detectors)))
+        params = cv2.SimpleBlobDetector_Params()
+        params.filterByArea = True
+        params.minArea = min_area
+        if max_area is not None:
+            params.maxArea = max_area
+        detector = detectors[key] = cv2.SimpleBlobDetector_create(params)
+    return detector
+
+def _roi(img, roi):
+    """Crop to [x, y, w, h] (clipped to the image); returns the view and its offset"""
+    x, y, w, h = (int(v) for v in roi)
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + w, img.shape[1]), min(y + h, img.shape[0])
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError("roi does not overlap the image")
+    return img[y0:y1, x0:x1], (x0, y0)
+
 def process(input_data):
-    """Lightweight object detection"""
+    """
+    Lightweight object detection
+
+    Optional inputs: "min_area"/"max_area" (pixels of the full-size image),
+    "canny": [low, high], "roi": [x, y, w, h] to only search part of the
+    frame, "downscale": factor in (0, 1] to detect on a smaller image.
+    Keypoints are always in full-image coordinates.
+    """
+    timings = {}
+    start = stage = time.perf_counter()
+
+    def lap(name):
+        nonlocal stage
+        now = time.perf_counter()
+        timings[name] = round((now - stage) * 1000, 3)
+        stage = now
+
     img_data = input_data.get("image")
-    if not img_data:
+    # Nested lists from JSON, or a NumPy array from a binary upload
+    if img_data is None or len(img_data) == 0:
         return {"error": "No image data"}
-    
+
+    min_area = float(input_data.get("min_area", DEFAULT_MIN_AREA))
+    max_area = input_data.get("max_area")
+    max_area = float(max_area) if max_area is not None else None
+    canny_low, canny_high = (float(t) for t in input_data.get("canny", DEFAULT_CANNY))
+    scale = float(input_data.get("downscale", 1.0))
+    if not 0 < scale <= 1:
+        raise ValueError("downscale must be in (0, 1]")
+
+    img = np.asarray(img_data, dtype=np.uint8)
+    lap("decode")
+
+    offset = (0, 0)
+    if input_data.get("roi") is not None:
+        img, offset = _roi(img, input_data["roi"])
+
     # Convert to grayscale (saves 75% processing)
-    if isinstance(img_data, list):
-        img = np.array(img_data, dtype=np.uint8)
-        if len(img.shape) == 3:
-            img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-    
+    if len(img.shape) == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    lap("grayscale")
+
+    if scale < 1:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        # Areas are given in full-size pixels
+        min_area *= scale * scale
+        if max_area is not None:
+            max_area *= scale * scale
+        lap("downscale")
+
     # Ultra-light edge detection (vs full CNN)
-    edges = cv2.Canny(img, 50, 150)
-    
+    edges = cv2.Canny(img, canny_low, canny_high)
+    lap("canny")
+
     # Fast blob detection
-    params = cv2.SimpleBlobDetector_Params()
-    params.filterByArea = True
-    params.minArea = 100
-    detector = cv2.SimpleBlobDetector_create(params)
-    keypoints = detector.detect(edges)
-    
+    keypoints = _detector(min_area, max_area).detect(edges)
+    lap("blob_detect")
+
+    # Back to full-size pixel centres, then undo the crop
+    def unscale(p):
+        return (p + 0.5) / scale - 0.5
+
     return {
         "objects": len(keypoints),
-        "keypoints": [{"x": k.pt[0], "y": k.pt[1]} for k in keypoints],
-        "processing_time_ms": cv2.getTickCount() * 1000 / cv2.getTickFrequency()
+        "keypoints": [
+            {"x": unscale(k.pt[0]) + offset[0], "y": unscale(k.pt[1]) + offset[1], "size": k.size / scale}
+            for k in keypoints
+        ],
+        "timings_ms": timings,
+        "processing_time_ms": round((time.perf_counter() - start) * 1000, 3)
     }
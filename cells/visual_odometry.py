@@ -1,8 +1,206 @@
+import os
+import math
+import time
+import threading
 import cv2
+import numpy as np
+from collections import OrderedDict
+
+CONCURRENCY = 'session'  # the previous frame is kept per (user, session)
+
+MODES = ('lk', 'farneback')
+TRACK_TTL = float(os.getenv('VISUAL_ODOMETRY_TTL', 120))  # seconds idle before a track is dropped
+MAX_TRACKS = int(os.getenv('VISUAL_ODOMETRY_MAX_TRACKS', 1000))
+
+
+class _Track:
+    """Previous frame of one stream, plus what was already computed for it"""
+
+    def __init__(self, gray):
+        self.gray = gray
+        self.points = None  # tracked FAST features in `gray`, Nx1x2 float32
+        self.frames = 1
+        self.pose = [0.0, 0.0, 0.0]  # accumulated x, y (pixels), heading (degrees)
+
+
+# Tracks keyed by (user_id, session_id, stream_id), least recently used first
+_TRACKS = OrderedDict()
+_TRACKS_LOCK = threading.Lock()
+
+def _track_key(input_data):
+    context = input_data.get('_user_context', {})
+    return (context.get('user_id'), context.get('session_id'), input_data.get('stream_id', 'default'))
+
+def _previous(key):
+    # Left in place: the stored frame is only replaced once a new one is processed
+    with _TRACKS_LOCK:
+        entry = _TRACKS.get(key)
+    if entry is None or time.monotonic() - entry[1] > TRACK_TTL:
+        return None
+    return entry[0]
+
+def _store(key, track):
+    now = time.monotonic()
+    with _TRACKS_LOCK:
+        _TRACKS[key] = (track, now)
+        _TRACKS.move_to_end(key)
+        # Evict expired tracks from the cold end, and enforce the size bound
+        while _TRACKS:
+            oldest_key, (_, last_used) = next(iter(_TRACKS.items()))
+            if len(_TRACKS) <= MAX_TRACKS and now - last_used <= TRACK_TTL:
+                break
+            del _TRACKS[oldest_key]
+
+
+def _gray(image):
+    img = np.asarray(image, dtype=np.uint8)
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_RGBA2GRAY if img.shape[2] == 4 else cv2.COLOR_RGB2GRAY)
+    if img.ndim != 2:
+        raise ValueError(f"Expected an (H, W) or (H, W, C) image, got shape {img.shape}")
+    return img
+
+def _detect(gray, threshold, max_features):
+    keypoints = cv2.FastFeatureDetector_create(threshold=threshold).detect(gray)
+    # Keep the strongest corners
+    keypoints = sorted(keypoints, key=lambda k: k.response, reverse=True)[:max_features]
+    return np.array([k.pt for k in keypoints], dtype=np.float32).reshape(-1, 1, 2)
+
+def _motion(prev_pts, curr_pts, center):
+    """
+    Similarity transform between matched points: (dx, dy, rotation_deg, scale, inliers).
+    dx, dy is how far the image centre moves, so a rotation about the centre
+    reports no translation.
+    """
+    deltas = (curr_pts - prev_pts).reshape(-1, 2)
+    dx, dy = np.median(deltas, axis=0)
+    if len(prev_pts) >= 3:
+        transform, inliers = cv2.estimateAffinePartial2D(prev_pts, curr_pts, method=cv2.RANSAC)
+        if transform is not None:
+            rotation = math.degrees(math.atan2(transform[1, 0], transform[0, 0]))
+            scale = math.hypot(transform[0, 0], transform[1, 0])
+            # transform[:, 2] is the motion of the origin (top-left corner), which
+            # picks up any rotation; use the centre's displacement instead
+            moved = transform[:, :2] @ center + transform[:, 2]
+            dx, dy = moved - center
+            return float(dx), float(dy), rotation, scale, int(inliers.sum())
+    return float(dx), float(dy), 0.0, 1.0, len(prev_pts)
+
 def process(input_data):
-    # Feature tracking between 2 frames (FAST + optical flow)
-    prev_pts = input_data["prev_keypoints"]
-    curr_pts = cv2.calcOpticalFlowFarneback(
-        prev_gray, curr_gray, None, 0.5, 3, 15, 3, 5, 1.2, 0
-    )
-    return {"delta_x": np.mean(dx), "delta_y": np.mean(dy)}
+    """
+    Visual odometry between consecutive frames of a session
+
+    {"image": frame} - the previous grayscale frame and its tracked
+    features are kept per session/"stream_id", so each call only converts
+    the new frame; the first call (or "reset": true) just initializes. Sending
+    "prev_image" as well compares the two frames without session state.
+
+    "mode": "lk" (default; FAST features + pyramidal Lucas-Kanade) or
+    "farneback" (dense flow). Tuning: "max_features", "min_features",
+    "fast_threshold", "win_size", "levels".
+    """
+    timings = {}
+    start = stage = time.perf_counter()
+
+    def lap(name):
+        nonlocal stage
+        now = time.perf_counter()
+        timings[name] = round((now - stage) * 1000, 3)
+        stage = now
+
+    mode = input_data.get("mode", "lk")
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of {MODES}")
+    max_features = int(input_data.get("max_features", 500))
+    min_features = int(input_data.get("min_features", max_features // 2))
+    fast_threshold = int(input_data.get("fast_threshold", 20))
+    win_size = int(input_data.get("win_size", 21))
+    levels = int(input_data.get("levels", 3))
+
+    if "image" not in input_data:
+        raise KeyError("image")
+    gray = _gray(input_data["image"])
+    stateless = "prev_image" in input_data
+    if stateless:
+        track = _Track(_gray(input_data["prev_image"]))
+        if track.gray.shape != gray.shape:
+            raise ValueError("prev_image and image must have the same size")
+    else:
+        key = _track_key(input_data)
+        track = None if input_data.get("reset") else _previous(key)
+    lap("grayscale")
+
+    if track is None or track.gray.shape != gray.shape:
+        # First frame of the stream: nothing to compare with yet
+        track = _Track(gray)
+        if mode == "lk":
+            track.points = _detect(gray, fast_threshold, max_features)
+            lap("detect")
+        _store(key, track)
+        return {
+            "initialized": True,
+            "delta_x": 0.0,
+            "delta_y": 0.0,
+            "features": 0 if track.points is None else len(track.points),
+            "mode": mode,
+            "timings_ms": timings,
+            "processing_time_ms": round((time.perf_counter() - start) * 1000, 3)
+        }
+
+    result = {"mode": mode}
+    current = _Track(gray)
+    current.frames = track.frames + 1
+    current.pose = track.pose
+
+    if mode == "lk":
+        if track.points is None or len(track.points) < min_features:
+            track.points = _detect(track.gray, fast_threshold, max_features)
+            lap("detect")
+
+        if len(track.points):
+            # The Python bindings only take images here, not prebuilt pyramids;
+            # OpenCV builds both pyramids internally
+            next_pts, status, _ = cv2.calcOpticalFlowPyrLK(
+                track.gray, gray, track.points, None,
+                winSize=(win_size, win_size), maxLevel=levels
+            )
+            good = status.reshape(-1) == 1
+            prev_pts, curr_pts = track.points[good], next_pts[good]
+        else:
+            prev_pts = curr_pts = np.empty((0, 1, 2), dtype=np.float32)
+        lap("track")
+
+        if len(curr_pts):
+            center = np.array([(gray.shape[1] - 1) / 2, (gray.shape[0] - 1) / 2])
+            dx, dy, rotation, scale, inliers = _motion(prev_pts, curr_pts, center)
+        else:
+            dx = dy = rotation = 0.0
+            scale, inliers = 1.0, 0
+        lap("estimate")
+        # Tracked points carry over; _detect tops them up when too few survive
+        current.points = curr_pts
+        result.update(tracked=len(curr_pts), inliers=inliers, rotation_deg=rotation, scale=scale)
+    else:
+        flow = cv2.calcOpticalFlowFarneback(
+            track.gray, gray, None, 0.5, levels, 15, 3, 5, 1.2, 0
+        )
+        lap("flow")
+        dx, dy = (float(v) for v in np.median(flow.reshape(-1, 2), axis=0))
+        rotation = 0.0
+        lap("estimate")
+
+    # Accumulate the frame-to-frame motion into a pose for the stream
+    x, y, heading = current.pose
+    current.pose = [x + dx, y + dy, heading + rotation]
+    if not stateless:
+        _store(key, current)
+
+    result.update({
+        "delta_x": dx,
+        "delta_y": dy,
+        "pose": {"x": current.pose[0], "y": current.pose[1], "heading_deg": current.pose[2]},
+        "frame": current.frames,
+        "timings_ms": timings,
+        "processing_time_ms": round((time.perf_counter() - start) * 1000, 3)
+    })
+    return result
@@ -0,0 +1,51 @@
+import os
+import threading
+from contextlib import nullcontext
+
+# Cell concurrency policies, declared in a cell module as CONCURRENCY = ...
+STATELESS = 'stateless'  # pure function of its input, never locked
+SESSION = 'session'      # keeps per-session state, calls of one session are serialized
+GLOBAL = 'global'        # shares module-level state, all calls are serialized
+POLICIES = (STATELESS, SESSION, GLOBAL)
+
+# Undeclared cells may hold module state, so they get the safe policy
+DEFAULT_POLICY = GLOBAL
+
+
+class LockStripes:
+    """
+    Fixed-size table of locks; keys hash onto a stripe.
+    Memory stays constant no matter how many users/sessions show up,
+    unlike a dict holding one lock per key forever.
+    """
+
+    def __init__(self, stripes=None):
+        stripes = int(stripes or os.getenv('CELL_LOCK_STRIPES', 256))
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def lock_for(self, key):
+        return self._locks[hash(key) % len(self._locks)]
+
+
+class CellLocks:
+    """Hands out only the lock a cell's concurrency policy actually needs"""
+
+    def __init__(self, policies, stripes=None):
+        self.policies = dict(policies)
+        self._global = {
+            cell_name: threading.Lock()
+            for cell_name, policy in self.policies.items()
+            if policy == GLOBAL
+        }
+        self._sessions = LockStripes(stripes)
+
+    def lock_for(self, cell_name, user_id, session_id):
+        policy = self.policies.get(cell_name, DEFAULT_POLICY)
+        if policy == STATELESS:
+            return nullcontext()
+        if policy == SESSION:
+            return self._sessions.lock_for((cell_name, user_id, session_id))
+        lock = self._global.get(cell_name)
+        if lock is None:
+            lock = self._global.setdefault(cell_name, threading.Lock())
+        return lock
@@ -0,0 +1,217 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection frees up within the borrow timeout"""
+
+
+def default_pool_size():
+    """
+    Per-worker pool size.
+    DB_POOL_MAX wins if set, otherwise the DB_MAX_CONNECTIONS budget is split
+    evenly across the WEB_CONCURRENCY worker processes.
+    """
+    if os.getenv('DB_POOL_MAX'):
+        return max(1, int(os.getenv('DB_POOL_MAX')))
+    budget = int(os.getenv('DB_MAX_CONNECTIONS', 20))
+    workers = int(os.getenv('WEB_CONCURRENCY', 1))
+    return max(1, budget // max(1, workers))
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe psycopg2 connection pool.
+
+    - at most max_size connections are open per worker process
+    - borrowers block up to `timeout` seconds when the pool is exhausted
+    - connections idle longer than `max_idle` seconds are closed
+    - connections idle longer than `health_check_after` seconds are pinged
+      with SELECT 1 before being handed out
+    """
+
+    def __init__(self, dsn, max_size=None, min_size=None, max_idle=None,
+                 health_check_after=None, timeout=None):
+        self.dsn = dsn
+        self.max_size = max_size or default_pool_size()
+        if min_size is None:
+            min_size = int(os.getenv('DB_POOL_MIN', 1))
+        self.min_size = min(min_size, self.max_size)
+        self.max_idle = float(max_idle if max_idle is not None else os.getenv('DB_POOL_MAX_IDLE', 300))
+        self.health_check_after = float(
+            health_check_after if health_check_after is not None
+            else os.getenv('DB_POOL_HEALTH_CHECK_AFTER', 30)
+        )
+        self.timeout = float(timeout if timeout is not None else os.getenv('DB_POOL_TIMEOUT', 10))
+        self._inherited = []
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._available = threading.Condition(threading.Lock())
+        self._idle = deque()  # (conn, last_used), most recently used on the right
+        self._size = 0  # open connections, idle + borrowed
+        self._counters = {"created": 0, "reused": 0, "discarded": 0, "health_check_failures": 0, "timeouts": 0}
+
+    def _check_pid(self):
+        # Connections are not fork-safe. A forked worker starts with an empty
+        # pool; the parent's sockets are kept referenced (never closed) so the
+        # child can't send a Terminate message down a connection it doesn't own.
+        if os.getpid() != self._pid:
+            self._inherited.extend(conn for conn, _ in self._idle)
+            self._reset()
+
+    # Borrowing
+    def getconn(self):
+        self._check_pid()
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn, idle_for = self._checkout(deadline)
+            if conn is None:
+                # A slot was reserved for a brand-new connection
+                try:
+                    conn = psycopg2.connect(self.dsn)
+                except Exception:
+                    self._release_slot()
+                    raise
+                with self._available:
+                    self._counters["created"] += 1
+                return conn
+
+            if idle_for > self.health_check_after and not self._ping(conn):
+                with self._available:
+                    self._counters["health_check_failures"] += 1
+                self._discard(conn)
+                continue
+
+            with self._available:
+                self._counters["reused"] += 1
+            return conn
+
+    def _checkout(self, deadline):
+        stale = []
+        try:
+            with self._available:
+                while True:
+                    while self._idle:
+                        # LIFO keeps a hot working set and lets the rest age out
+                        conn, last_used = self._idle.pop()
+                        idle_for = time.monotonic() - last_used
+                        if conn.closed or idle_for > self.max_idle:
+                            stale.append(conn)
+                            self._size -= 1
+                            self._counters["discarded"] += 1
+                            continue
+                        return conn, idle_for
+
+                    if self._size < self.max_size:
+                        self._size += 1
+                        return None, 0.0
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {self.timeout}s "
+                            f"(pool size {self.max_size})"
+                        )
+                    self._available.wait(remaining)
+        finally:
+            for conn in stale:
+                self._close(conn)
+
+    def _ping(self, conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    # Returning
+    def putconn(self, conn):
+        if os.getpid() != self._pid:
+            return
+
+        if conn.closed or conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            self._discard(conn)
+            return
+
+        if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                self._discard(conn)
+                return
+
+        expired = []
+        with self._available:
+            now = time.monotonic()
+            self._idle.append((conn, now))
+            # Close connections that sat at the cold end of the stack too long
+            while len(self._idle) > self.min_size and now - self._idle[0][1] > self.max_idle:
+                expired.append(self._idle.popleft()[0])
+                self._size -= 1
+            self._counters["discarded"] += len(expired)
+            self._available.notify()
+
+        for stale in expired:
+            self._close(stale)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a `with` block.
+        Commits on success and rolls back on error, like `with psycopg2.connect()`.
+        """
+        conn = self.getconn()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.putconn(conn)
+
+    # Bookkeeping
+    def _discard(self, conn):
+        self._close(conn)
+        self._release_slot(discarded=True)
+
+    def _release_slot(self, discarded=False):
+        with self._available:
+            self._size -= 1
+            if discarded:
+                self._counters["discarded"] += 1
+            self._available.notify()
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        """Close every idle connection, e.g. at worker shutdown"""
+        with self._available:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self):
+        with self._available:
+            return {
+                "max_size": self.max_size,
+                "open": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                **self._counters
+            }
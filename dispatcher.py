@@ -0,0 +1,208 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+from cell_pool import CellProcessPool
+from concurrency import CellLocks, STATELESS
+from microbatch import MicroBatcher
+from scratch import RequestScratch
+
+
+class CellDispatcher:
+    """
+    Runs the cells of one /ai-api request.
+
+    Each cell only takes the lock its CONCURRENCY policy requires, so
+    stateless cells of one user (or a fleet sharing one API key) run
+    concurrently across requests.
+
+    Independent cells of the same request run in parallel on a shared
+    thread pool (NumPy/OpenCV release the GIL), at most `max_parallel` at a
+    time per request. A request with a single cell runs inline.
+
+    Single inputs for MICRO_BATCH cells are queued in a MicroBatcher and
+    run together with those of concurrent requests.
+    """
+
+    def __init__(self, cells, logger=None, pool_size=None, max_parallel=None):
+        self.cells = cells
+        self.logger = logger
+        self.locks = CellLocks({
+            cell_name: capabilities['concurrency']
+            for cell_name, capabilities in cells.capabilities.items()
+        })
+        self.pool_size = int(pool_size or os.getenv('CELL_THREAD_POOL_SIZE', min(32, (os.cpu_count() or 1) * 4)))
+        self.max_parallel = int(max_parallel or os.getenv('CELL_MAX_PARALLEL', 4))
+        self.max_batch = int(os.getenv('CELL_MAX_BATCH', 10000))
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self.process_cells = self._process_routed()
+        self.process_pool = None
+        if self.process_cells:
+            self.process_pool = CellProcessPool(cells.cells_dir, self.process_cells)
+        self.micro_batchers = {
+            cell_name: MicroBatcher(self._batch_fn(cell_name), name=f"micro-batch-{cell_name}")
+            for cell_name in self._micro_batched()
+        }
+
+    def _process_routed(self):
+        routed = {
+            cell_name for cell_name, capabilities in self.cells.capabilities.items()
+            if capabilities['executor'] == 'process'
+        }
+        routed.update(filter(None, (
+            name.strip() for name in os.getenv('CELL_PROCESS_POOL_CELLS', '').split(',')
+        )))
+        eligible = set()
+        for cell_name in sorted(routed):
+            if cell_name not in self.cells:
+                continue
+            # State kept in a worker process would not be shared between workers
+            if self.cells.capabilities[cell_name]['concurrency'] != STATELESS:
+                if self.logger is not None:
+                    self.logger.warning(f"Cell {cell_name} is not stateless, keeping it in-process")
+                continue
+            eligible.add(cell_name)
+        return eligible
+
+    def _micro_batched(self):
+        eligible = []
+        for cell_name, capabilities in sorted(self.cells.capabilities.items()):
+            if not capabilities['micro_batch']:
+                continue
+            # A batch mixes inputs of different users and sessions
+            if capabilities['concurrency'] != STATELESS or not capabilities['batch']:
+                if self.logger is not None:
+                    self.logger.warning(f"Cell {cell_name} needs to be stateless with process_batch to be micro-batched")
+                continue
+            eligible.append(cell_name)
+        return eligible
+
+    def _batch_fn(self, cell_name):
+        if cell_name in self.process_cells:
+            return lambda items: self.process_pool.call(cell_name, items, batch=True)
+        return lambda items: self.cells.run_batch(cell_name, items)
+
+    def _executor(self):
+        # Threads don't survive fork, so each worker process builds its own pool
+        if self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool_pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='cell')
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def run(self, cell_names, input_data, user_id, session_id):
+        """
+        Returns (results, execution_times, batch_sizes) keyed by cell name.
+        A cell whose input is a non-empty list of dicts runs in batch mode
+        and its result is the list of per-input results.
+        """
+        # Unknown cells are skipped, repeated names run once
+        runnable = [cell_name for cell_name in dict.fromkeys(cell_names) if cell_name in self.cells]
+        outcomes = {}
+
+        # Scratch space is only created if a cell declares USES_SCRATCH
+        with RequestScratch(f"cell_{user_id}_") as scratch:
+            calls = {
+                cell_name: self._prepare(cell_name, input_data, user_id, session_id, scratch)
+                for cell_name in runnable
+            }
+
+            if len(calls) <= 1 or self.max_parallel <= 1:
+                for cell_name, call in calls.items():
+                    outcomes[cell_name] = call()
+            else:
+                pending = list(calls.items())
+                in_flight = {}
+                while pending or in_flight:
+                    while pending and len(in_flight) < self.max_parallel:
+                        cell_name, call = pending.pop(0)
+                        in_flight[self._executor().submit(call)] = cell_name
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        outcomes[in_flight.pop(future)] = future.result()
+
+        # Keep the request's cell order in the response
+        results = {}
+        execution_times = {}
+        batch_sizes = {}
+        for cell_name in runnable:
+            result, exec_time = outcomes[cell_name]
+            results[cell_name] = result
+            if exec_time is not None:
+                execution_times[cell_name] = exec_time
+            if _is_batch(input_data.get(cell_name)):
+                batch_sizes[cell_name] = len(input_data[cell_name])
+        return results, execution_times, batch_sizes
+
+    def _prepare(self, cell_name, input_data, user_id, session_id, scratch):
+        """Builds the cell input on the request thread; returns a call yielding (result, exec_time)"""
+        cell_input = input_data.get(cell_name, {})
+        # A list of inputs is a batch: one call, one result list, one usage record
+        batch = _is_batch(cell_input)
+        try:
+            if batch and len(cell_input) > self.max_batch:
+                raise ValueError(f"Batch of {len(cell_input)} inputs exceeds the limit of {self.max_batch}")
+
+            context = {
+                'user_id': user_id,
+                'session_id': session_id,
+                'timestamp': datetime.utcnow().isoformat()
+            }
+            if self.cells.capabilities[cell_name]['scratch']:
+                context['scratch_dir'] = scratch.get()
+            for item in (cell_input if batch else [cell_input]):
+                if isinstance(item, dict):
+                    item['_user_context'] = context
+        except Exception as e:
+            error = self._error(cell_name, user_id, e)
+            return lambda: error
+
+        def call():
+            try:
+                with self.locks.lock_for(cell_name, user_id, session_id):
+                    start_time = time.perf_counter()
+                    if cell_name in self.micro_batchers and not batch:
+                        result = self.micro_batchers[cell_name].call(cell_input)
+                    elif cell_name in self.process_cells:
+                        result = self.process_pool.call(cell_name, cell_input, batch=batch)
+                    elif batch:
+                        result = self.cells.run_batch(cell_name, cell_input)
+                    else:
+                        result = self.cells[cell_name](cell_input)
+                    return result, time.perf_counter() - start_time
+            except Exception as e:
+                return self._error(cell_name, user_id, e)
+
+        return call
+
+    def _error(self, cell_name, user_id, e):
+        if self.logger is not None:
+            self.logger.error(f"Cell {cell_name} error for user {user_id}: {str(e)}")
+        return {"error": str(e)}, None
+
+    def shutdown(self):
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=False)
+        for batcher in self.micro_batchers.values():
+            batcher.shutdown()
+        if self.process_pool is not None:
+            self.process_pool.shutdown()
+
+    def stats(self):
+        return {
+            "thread_pool_size": self.pool_size,
+            "max_parallel_per_request": self.max_parallel,
+            "process_pool": self.process_pool.stats() if self.process_pool is not None else None,
+            "micro_batch": {cell_name: batcher.stats() for cell_name, batcher in self.micro_batchers.items()}
+        }
+
+
+def _is_batch(cell_input):
+    # Only a non-empty list of dicts: some cells take a bare list (e.g. an
+    # image) as their input, and [] would otherwise be a batch of nothing
+    return isinstance(cell_input, list) and bool(cell_input) and all(isinstance(item, dict) for item in cell_input)
@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import hashlib
+
+try:
+    import xxhash
+except ImportError:  # blake2b from hashlib is the fallback
+    xxhash = None
+
+MODES = ('full', 'sampled', 'off')
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+def _hash(data):
+    if xxhash is not None:
+        return xxhash.xxh3_128_hexdigest(data)
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _skip(text, idx):
+    return _whitespace.match(text, idx).end()
+
+
+def _members(text, idx, descend=None):
+    """
+    Walks the JSON object starting at text[idx] without building it.
+    Returns ({key: (start, end)} of each member's value, index past the
+    object). The value under `descend` must itself be an object; its
+    members are returned as that key's entry instead of its span.
+    """
+    if text[idx] != '{':
+        raise ValueError("Expected an object")
+    members = {}
+    idx = _skip(text, idx + 1)
+    if text[idx] == '}':
+        return members, idx + 1
+    while True:
+        if text[idx] != '"':
+            raise ValueError("Expected a key")
+        key, idx = json.decoder.scanstring(text, idx + 1)
+        idx = _skip(text, idx)
+        if text[idx] != ':':
+            raise ValueError("Expected ':'")
+        start = _skip(text, idx + 1)
+        if key == descend and text[start] == '{':
+            members[key], idx = _members(text, start)
+        else:
+            # The C scanner finds the end; the decoded value is discarded
+            _, idx = _decoder.raw_decode(text, start)
+            members[key] = (start, idx)
+        idx = _skip(text, idx)
+        if text[idx] == '}':
+            return members, idx + 1
+        if text[idx] != ',':
+            raise ValueError("Expected ',' or '}'")
+        idx = _skip(text, idx + 1)
+
+
+def _cell_inputs(body, cell_names):
+    """
+    {cell_name: bytes of data[cell_name]} from a JSON request body. A cell
+    without an entry gets b''. A body that isn't a JSON object with a "data"
+    object (e.g. a binary upload, which every cell shares) is every cell's
+    input as a whole.
+    """
+    try:
+        text = bytes(body).decode('utf-8')
+        members, _ = _members(text, _skip(text, 0), descend='data')
+        data = members.get('data', {})
+        if not isinstance(data, dict):
+            raise ValueError("data is not an object")
+    except (ValueError, IndexError):
+        return {cell_name: body for cell_name in cell_names}
+    return {
+        cell_name: text[data[cell_name][0]:data[cell_name][1]].encode('utf-8') if cell_name in data else b''
+        for cell_name in cell_names
+    }
+
+
+def _parse_cell_modes(spec):
+    """'vision_optimized=sampled,lidar_compress=off' -> {cell: mode}"""
+    modes = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        cell_name, _, mode = item.partition('=')
+        mode = mode.strip()
+        if mode not in MODES:
+            raise ValueError(f"Unknown fingerprint mode '{mode}' for cell '{cell_name}'")
+        modes[cell_name.strip()] = mode
+    return modes
+
+
+class Fingerprinter:
+    """
+    Usage-log fingerprints computed from the raw request body.
+
+    The body bytes are immutable (unlike the parsed input dict, which gets
+    `_user_context` injected), so the fingerprint is stable. Hashing uses
+    xxh3 when xxhash is installed, blake2b otherwise.
+
+    Modes, configurable per cell:
+      full    - hash the cell's whole input
+      sampled - inputs above `max_bytes` are reduced to their length, head,
+                tail and evenly strided blocks before hashing (default)
+      off     - no fingerprint (empty string)
+    """
+
+    def __init__(self, default_mode=None, max_bytes=None, block_size=None, cell_modes=None):
+        self.default_mode = default_mode or os.getenv('FINGERPRINT_MODE', 'sampled')
+        if self.default_mode not in MODES:
+            raise ValueError(f"Unknown fingerprint mode '{self.default_mode}'")
+        self.max_bytes = int(max_bytes or os.getenv('FINGERPRINT_MAX_BYTES', 65536))
+        self.block_size = int(block_size or os.getenv('FINGERPRINT_BLOCK_SIZE', 4096))
+        self.cell_modes = cell_modes if cell_modes is not None else _parse_cell_modes(
+            os.getenv('FINGERPRINT_CELL_MODES')
+        )
+
+    def mode_for(self, cell_name):
+        return self.cell_modes.get(cell_name, self.default_mode)
+
+    def for_request(self, body, cell_names):
+        """
+        Capture what is needed to fingerprint `cell_names` later. Cheap on the
+        request path: unless the body exceeds `max_bytes`, it isn't even
+        sliced into cell inputs until a digest is asked for.
+        """
+        return RequestFingerprint(self, body, {cell_name: self.mode_for(cell_name) for cell_name in cell_names})
+
+    def sample(self, body):
+        """Bounded-size stand-in for `body`: length, head, tail and strided blocks"""
+        size = len(body)
+        if size <= self.max_bytes:
+            return bytes(body)
+
+        view = memoryview(body)
+        block = min(self.block_size, self.max_bytes // 2)
+        blocks = max(2, self.max_bytes // block)
+        stride = (size - block) // (blocks - 1)
+        parts = [size.to_bytes(8, 'little')]
+        parts.extend(view[i * stride:i * stride + block] for i in range(blocks - 1))
+        parts.append(view[size - block:])
+        return b''.join(parts)
+
+
+class RequestFingerprint:
+    """
+    Deferred fingerprints for one request. Each cell's fingerprint covers its
+    own data[cell_name] slice of the body, so the same input to a cell hashes
+    the same whatever else the request carried.
+    """
+
+    def __init__(self, fingerprinter, body, cell_modes):
+        self.fingerprinter = fingerprinter
+        self.cell_modes = {cell_name: mode for cell_name, mode in cell_modes.items() if mode != 'off'}
+        self._body = body if self.cell_modes else None
+        self._inputs = None
+        self._sampled = False
+        if self._body is not None and len(body) > fingerprinter.max_bytes and 'full' not in self.cell_modes.values():
+            # Don't hold a large body while the record waits in the queue:
+            # keep only the bounded samples of the cells' inputs
+            self._inputs = {
+                cell_name: fingerprinter.sample(data)
+                for cell_name, data in _cell_inputs(body, self.cell_modes).items()
+            }
+            self._sampled = True
+            self._body = None
+
+    def _input(self, cell_name):
+        if self._inputs is None:
+            self._inputs = _cell_inputs(self._body, self.cell_modes)
+            self._body = None
+        return self._inputs[cell_name]
+
+    def for_cell(self, cell_name):
+        mode = self.cell_modes.get(cell_name, 'off')
+        if mode == 'off':
+            return ''
+        data = self._input(cell_name)
+        if mode == 'sampled' and not self._sampled:
+            data = self.fingerprinter.sample(data)
+        return _hash(b''.join((cell_name.encode(), b':', data)))
+
+    def cell(self, cell_name):
+        """Zero-argument callable resolving to the cell's fingerprint"""
+        return lambda: self.for_cell(cell_name)
@@ -0,0 +1,107 @@
+import os
+import time
+import threading
+
+from psycopg2.extras import execute_values
+
+
+class LastLoginTracker:
+    """
+    Write-behind tracker for users.last_login.
+
+    Authenticated requests only record "user seen at t" in memory; a
+    background thread coalesces those into a single batched UPDATE every
+    `flush_interval` seconds (and once more at shutdown), so hot API calls no
+    longer take a row lock and write WAL on the users table.
+    """
+
+    def __init__(self, get_db, flush_interval=None):
+        self.get_db = get_db
+        self.flush_interval = float(
+            flush_interval if flush_interval is not None
+            else os.getenv('LAST_LOGIN_FLUSH_INTERVAL', 5)
+        )
+        self._lock = threading.Lock()
+        self._pending = {}  # user_id -> unix time last seen
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pid = None
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.errors = 0
+        self.last_flush_ms = None
+
+    def touch(self, user_id):
+        """Record that `user_id` was just seen; never touches the database"""
+        self._ensure_worker()
+        now = time.time()
+        with self._lock:
+            self._pending[user_id] = now
+
+    def _ensure_worker(self):
+        # Started lazily so each forked worker flushes its own pending rows
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pending = {}
+        threading.Thread(target=self._run, name='last-login-flush', daemon=True).start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Write all pending timestamps in one UPDATE; returns the number of rows sent"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            start = time.perf_counter()
+            # Sorted ids keep lock order consistent across workers
+            rows = sorted(batch.items())
+            try:
+                with self.get_db() as conn:
+                    with conn.cursor() as cur:
+                        execute_values(cur, """
+                            UPDATE users AS u
+                            SET last_login = to_timestamp(v.seen)::timestamp
+                            FROM (VALUES %s) AS v(id, seen)
+                            WHERE u.id = v.id
+                            AND (u.last_login IS NULL OR u.last_login < to_timestamp(v.seen)::timestamp)
+                        """, rows, page_size=1000)
+                        conn.commit()
+            except Exception as e:
+                # Put the rows back unless a newer timestamp arrived meanwhile
+                with self._lock:
+                    for user_id, seen in batch.items():
+                        if self._pending.get(user_id, 0) < seen:
+                            self._pending[user_id] = seen
+                    self.errors += 1
+                print(f"last_login flush failed: {str(e)}")
+                return 0
+
+            self.flushes += 1
+            self.flushed_rows += len(rows)
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+            return len(rows)
+
+    def shutdown(self):
+        self._stop.set()
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "errors": self.errors,
+            "last_flush_ms": self.last_flush_ms,
+            "flush_interval_s": self.flush_interval
+        }
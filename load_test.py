@@ -0,0 +1,165 @@
+"""
+Load test for the HTTP serving modes: the Flask app (app.py) and the ASGI
+app (asgi_app.py).
+
+For each --url it opens --idle keep-alive connections that stay idle (the
+robots that are connected but quiet), then runs --concurrency clients
+calling /ai-api back to back for --duration seconds, and finally checks how
+many of the idle connections the server kept open. Example:
+
+    python load_test.py --api-key KEY --idle 5000 --concurrency 64 \\
+        --url http://localhost:5000 --url http://localhost:8000
+
+Idle connections need file descriptors on both sides; raise `ulimit -n`
+in the shell running the test.
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+from urllib.parse import urlsplit
+
+import aiohttp
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index] * 1000, 3)
+
+
+class IdleConnection:
+    """A raw keep-alive HTTP/1.1 connection that sends /ping now and then"""
+
+    def __init__(self, host, port, path='/ping'):
+        self.host = host
+        self.port = port
+        self.request = f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: keep-alive\r\n\r\n".encode()
+        self.reader = self.writer = None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        await self.ping()
+
+    async def ping(self):
+        """One request/response over the existing socket; raises if the server closed it"""
+        self.writer.write(self.request)
+        await self.writer.drain()
+        head = await self.reader.readuntil(b'\r\n\r\n')
+        status = int(head.split(b' ', 2)[1])
+        length = 0
+        for line in head.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                length = int(value)
+        await self.reader.readexactly(length)
+        if status != 200:
+            raise ConnectionError(f"/ping returned {status}")
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def _gather_counted(coroutines, limit):
+    """Runs coroutines at most `limit` at a time; returns how many succeeded"""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            try:
+                await coroutine
+                return True
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                return False
+
+    return sum(await asyncio.gather(*(run(c) for c in coroutines)))
+
+
+async def run_target(url, args, payload):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    headers = {"X-API-Key": args.api_key, "Content-Type": "application/json"}
+
+    # Idle robots: connect, make one call, then stay quiet
+    idle = [IdleConnection(host, port) for _ in range(args.idle)]
+    started = time.perf_counter()
+    opened = await _gather_counted((c.open() for c in idle), args.connect_rate)
+    connect_s = time.perf_counter() - started
+
+    latencies, statuses, errors = [], {}, 0
+    deadline = time.perf_counter() + args.duration
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+
+        async def client():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                sent = time.perf_counter()
+                try:
+                    async with session.post(url.rstrip('/') + args.path, data=payload) as response:
+                        await response.read()
+                        statuses[response.status] = statuses.get(response.status, 0) + 1
+                        if response.status == 200:
+                            latencies.append(time.perf_counter() - sent)
+                except aiohttp.ClientError:
+                    errors += 1
+
+        load_started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - load_started
+
+    # Did the server keep the idle connections through the load phase?
+    alive = await _gather_counted((c.ping() for c in idle if c.writer is not None), args.connect_rate)
+    for connection in idle:
+        connection.close()
+
+    latencies.sort()
+    return {
+        "url": url,
+        "idle_requested": args.idle,
+        "idle_opened": opened,
+        "idle_alive_after_load": alive,
+        "idle_connect_s": round(connect_s, 3),
+        "concurrency": args.concurrency,
+        "requests": sum(statuses.values()),
+        "statuses": statuses,
+        "transport_errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "p99": _percentile(latencies, 99),
+            "max": _percentile(latencies, 100)
+        }
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', action='append', required=True,
+                        help="server base URL; repeat to compare servers")
+    parser.add_argument('--api-key', required=True)
+    parser.add_argument('--path', default='/ai-api')
+    parser.add_argument('--cells', default='pid_controller', help="comma-separated cell names")
+    parser.add_argument('--data', default='{"pid_controller": {"error": 0.25}}',
+                        help="JSON for the request's \"data\" field")
+    parser.add_argument('--idle', type=int, default=1000, help="idle keep-alive connections to hold open")
+    parser.add_argument('--connect-rate', type=int, default=200, help="idle connections opened at a time")
+    parser.add_argument('--concurrency', type=int, default=32, help="clients sending requests back to back")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds of load per server")
+    args = parser.parse_args(argv)
+
+    payload = json.dumps({
+        "cells": [name.strip() for name in args.cells.split(',') if name.strip()],
+        "data": json.loads(args.data)
+    })
+    for url in args.url:
+        print(json.dumps(asyncio.run(run_target(url, args, payload)), indent=2))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Dynamic batching in front of one batch function.
+
+    Concurrent callers each submit a single item. A background thread
+    collects items until `max_batch_size` are waiting or the oldest has
+    waited `max_wait_ms`, runs them through `batch_fn(list_of_items)` in
+    one call and hands each caller its own result. The thread is started
+    lazily in each (forked) worker process.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=None, max_wait_ms=None, timeout=None, name='micro-batch'):
+        self.batch_fn = batch_fn
+        self.max_batch_size = int(max_batch_size or os.getenv('MICRO_BATCH_MAX_SIZE', 16))
+        self.max_wait = float(
+            max_wait_ms if max_wait_ms is not None
+            else os.getenv('MICRO_BATCH_MAX_WAIT_MS', 5)
+        ) / 1000
+        self.timeout = float(timeout or os.getenv('MICRO_BATCH_TIMEOUT', 30))
+        self.name = name
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pid = None
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.counters = {"batches": 0, "items": 0, "errors": 0, "queue_delay_s": 0.0, "max_queue_delay_s": 0.0}
+
+    def submit(self, item):
+        """Queue one item; returns a Future for its result"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+
+    def call(self, item):
+        """Run one item as part of whatever batch it lands in"""
+        return self.submit(item).result(timeout=self.timeout)
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            threading.Thread(target=self._run, name=self.name, daemon=True).start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=1)]
+            except queue.Empty:
+                continue
+            # Fill up until the batch is full or its oldest item has waited long enough
+            deadline = batch[0][2] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._execute(batch)
+
+    def _execute(self, batch):
+        started = time.monotonic()
+        delays = [started - enqueued for _, _, enqueued in batch]
+        with self._stats_lock:
+            self.counters["batches"] += 1
+            self.counters["items"] += len(batch)
+            self.counters["queue_delay_s"] += sum(delays)
+            self.counters["max_queue_delay_s"] = max(self.counters["max_queue_delay_s"], max(delays))
+
+        try:
+            results = self.batch_fn([item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch function returned {len(results)} results for {len(batch)} inputs")
+        except Exception as e:
+            with self._stats_lock:
+                self.counters["errors"] += 1
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+    def shutdown(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._stats_lock:
+            counters = dict(self.counters)
+        batches = counters["batches"]
+        items = counters["items"]
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize(),
+            "batches": batches,
+            "items": items,
+            "errors": counters["errors"],
+            "avg_batch_size": round(items / batches, 2) if batches else 0,
+            "fill_ratio": round(items / (batches * self.max_batch_size), 3) if batches else 0,
+            "avg_queue_delay_ms": round(counters["queue_delay_s"] / items * 1000, 3) if items else 0,
+            "max_queue_delay_ms": round(counters["max_queue_delay_s"] * 1000, 3)
+        }
@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+
+
+def _default_root():
+    # tmpfs keeps scratch I/O in memory where the platform provides it
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+SCRATCH_ROOT = os.getenv('CELL_SCRATCH_ROOT') or _default_root()
+
+
+class RequestScratch:
+    """
+    Scratch directory shared by the cells of one request.
+
+    Nothing touches the filesystem until a cell that declares
+    USES_SCRATCH asks for the path; the directory is then created once,
+    reused by every later cell of the request and removed on exit.
+    """
+
+    def __init__(self, prefix, root=None):
+        self.prefix = prefix
+        self.root = root or SCRATCH_ROOT
+        self.path = None
+
+    def get(self):
+        if self.path is None:
+            self.path = tempfile.mkdtemp(prefix=self.prefix, dir=self.root)
+        return self.path
+
+    def cleanup(self):
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
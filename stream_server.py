@@ -0,0 +1,270 @@
+import os
+import json
+import time
+import asyncio
+import socket
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import websockets
+
+
+class StreamServer:
+    """
+    WebSocket endpoint for high-rate cell calls (control loops at 50-500 Hz).
+
+    A client authenticates once per connection and then sends a stream of
+    invocations over the open socket, skipping the per-request HTTP
+    parsing, API key lookup and CORS work of /ai-api. Cells run through the
+    same dispatcher (and so the same registry, locks and per-session state)
+    as /ai-api, and usage is logged the same way.
+
+    Protocol, one JSON text frame per message:
+      -> {"type": "auth", "api_key": "...", "session_id": "...", "ordered": true}
+         (or send X-API-Key / X-Session-Id headers with the handshake)
+      <- {"type": "ready", "user_id": ..., "session_id": "..."}
+      -> {"id": 17, "cells": ["pid_controller"], "data": {...}}
+      <- {"id": 17, "success": true, "results": {...}}
+    With "ordered": true (default) invocations run one at a time and
+    results come back in order; with false up to `max_in_flight` run
+    concurrently and each result is matched by its "id".
+
+    The key is looked up again before a message is run whenever
+    `api_key_cache` reports an invalidation, and at least every
+    `reauth_interval` seconds; a revoked key closes the socket with 4401.
+
+    Starting: call start() in every process that serves requests; app.py
+    does so at import (gunicorn workers, `flask run`, `python app.py`) and
+    again before each request, which catches workers forked from a
+    preloaded app. start() is a no-op when already serving in this process
+    or when STREAM_PORT is 0. Worker processes share the port through
+    SO_REUSEPORT. `python stream_server.py` runs a stream-only process.
+    """
+
+    def __init__(self, dispatcher, resolve_api_key, usage_logger=None, fingerprinter=None,
+                 last_login_tracker=None, host=None, port=None, max_in_flight=None,
+                 auth_timeout=None, max_message_size=None, logger=None,
+                 api_key_cache=None, reauth_interval=None):
+        self.dispatcher = dispatcher
+        self.resolve_api_key = resolve_api_key
+        self.usage_logger = usage_logger
+        self.fingerprinter = fingerprinter
+        self.last_login_tracker = last_login_tracker
+        self.host = host or os.getenv('STREAM_HOST', '0.0.0.0')
+        self.port = int(port or os.getenv('STREAM_PORT', 8765))
+        self.max_in_flight = int(max_in_flight or os.getenv('STREAM_MAX_IN_FLIGHT', 32))
+        self.auth_timeout = float(auth_timeout or os.getenv('STREAM_AUTH_TIMEOUT', 10))
+        self.max_message_size = int(max_message_size or os.getenv('STREAM_MAX_MESSAGE_SIZE', 16 * 1024 * 1024))
+        self.logger = logger
+        self.api_key_cache = api_key_cache
+        self.reauth_interval = float(reauth_interval or os.getenv('STREAM_REAUTH_INTERVAL', 30))
+        self.workers = int(os.getenv('STREAM_WORKERS', min(32, (os.cpu_count() or 1) * 4)))
+        self.enabled = self.port != 0
+        self.reuse_port = hasattr(socket, 'SO_REUSEPORT')
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='stream')
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._loop = None
+        self._stopped = None
+        self.counters = {"connections": 0, "open_connections": 0, "auth_failures": 0, "messages": 0, "errors": 0, "revoked": 0}
+
+    # Lifecycle
+    def start(self):
+        """Serve in a background thread with its own event loop, once per process"""
+        if not self.enabled or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked from a process that was already serving: its thread,
+                # loop and executor threads did not come along
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='stream')
+                self._loop = self._stopped = None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self.run, name='stream-server', daemon=True)
+            self._thread.start()
+
+    def run(self):
+        """Serve in the calling thread until shutdown()"""
+        asyncio.run(self._serve())
+
+    def wait(self):
+        """Blocks until the background server started by start() stops"""
+        if self._thread is not None:
+            self._thread.join()
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        # No per-message compression: small frames, latency matters more than bytes
+        async with websockets.serve(self._handle, self.host, self.port,
+                                    max_size=self.max_message_size, compression=None,
+                                    reuse_port=self.reuse_port):
+            if self.logger is not None:
+                self.logger.info(f"Stream server listening on ws://{self.host}:{self.port}")
+            await self._stopped.wait()
+
+    def shutdown(self):
+        if self._loop is not None and self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        self._executor.shutdown(wait=False)
+
+    # Connection handling
+    def _cache_generation(self):
+        return self.api_key_cache.generation() if self.api_key_cache is not None else None
+
+    def _authorized(self, identity):
+        return identity is not None and 'cells:execute' in identity.get('permissions', ['cells:execute'])
+
+    async def _authenticate(self, websocket):
+        headers = websocket.request_headers
+        api_key = headers.get('X-API-Key')
+        session_id = headers.get('X-Session-Id')
+        ordered = True
+        if not api_key:
+            message = json.loads(await asyncio.wait_for(websocket.recv(), self.auth_timeout))
+            if not isinstance(message, dict) or message.get("type") != "auth":
+                raise PermissionError("First message must be {\"type\": \"auth\", \"api_key\": ...}")
+            api_key = message.get("api_key")
+            session_id = message.get("session_id", session_id)
+            ordered = bool(message.get("ordered", True))
+        if not api_key:
+            raise PermissionError("API key required")
+
+        # resolve_api_key may hit the database; keep it off the event loop
+        generation = self._cache_generation()
+        identity = await asyncio.get_running_loop().run_in_executor(self._executor, self.resolve_api_key, api_key)
+        if identity is None:
+            raise PermissionError("Invalid API key")
+        if not self._authorized(identity):
+            raise PermissionError("Insufficient permissions")
+        if self.last_login_tracker is not None:
+            self.last_login_tracker.touch(identity['user_id'])
+        auth = {"api_key": api_key, "generation": generation, "checked": time.monotonic()}
+        return identity, session_id or secrets.token_hex(16), ordered, auth
+
+    async def _still_authorized(self, connection):
+        """Re-resolves the key after a cache invalidation or every reauth_interval seconds"""
+        auth = connection["auth"]
+        generation = self._cache_generation()
+        if generation == auth["generation"] and time.monotonic() - auth["checked"] < self.reauth_interval:
+            return True
+        identity = await asyncio.get_running_loop().run_in_executor(
+            self._executor, self.resolve_api_key, auth["api_key"]
+        )
+        auth["generation"], auth["checked"] = generation, time.monotonic()
+        return self._authorized(identity) and identity['user_id'] == connection["user_id"]
+
+    async def _handle(self, websocket):
+        try:
+            identity, session_id, ordered, auth = await self._authenticate(websocket)
+        except websockets.ConnectionClosed:
+            # Client went away before (or while) authenticating
+            self.counters["auth_failures"] += 1
+            return
+        except (PermissionError, ValueError, asyncio.TimeoutError) as e:
+            self.counters["auth_failures"] += 1
+            await websocket.close(code=4401, reason=str(e)[:120] or "Authentication failed")
+            return
+
+        self.counters["connections"] += 1
+        self.counters["open_connections"] += 1
+        connection = {
+            "user_id": identity['user_id'],
+            "session_id": session_id,
+            "ip_address": websocket.remote_address[0] if websocket.remote_address else None,
+            "user_agent": websocket.request_headers.get('User-Agent'),
+            "auth": auth
+        }
+        in_flight = asyncio.Semaphore(1 if ordered else self.max_in_flight)
+        tasks = set()
+
+        def finished(task):
+            tasks.discard(task)
+            in_flight.release()
+
+        try:
+            await websocket.send(json.dumps({"type": "ready", "user_id": identity['user_id'], "session_id": session_id}))
+            async for message in websocket:
+                # Keys revoked or rotated while the socket is open stop working too
+                try:
+                    authorized = await self._still_authorized(connection)
+                except Exception as e:
+                    self.counters["errors"] += 1
+                    await websocket.close(code=1011, reason=f"Authorization check failed: {str(e)}"[:120])
+                    break
+                if not authorized:
+                    self.counters["revoked"] += 1
+                    await websocket.close(code=4401, reason="API key revoked")
+                    break
+                # Stops reading (backpressure) while max_in_flight calls are running
+                await in_flight.acquire()
+                task = asyncio.ensure_future(self._invoke(websocket, connection, message))
+                tasks.add(task)
+                task.add_done_callback(finished)
+                if ordered:
+                    await task
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for task in list(tasks):
+                task.cancel()
+            self.counters["open_connections"] -= 1
+
+    async def _invoke(self, websocket, connection, message):
+        self.counters["messages"] += 1
+        request_id = None
+        try:
+            request_data = json.loads(message)
+            request_id = request_data.get("id")
+            cell_names = request_data.get("cells", [])
+            input_data = request_data.get("data", {})
+            if not cell_names or not isinstance(cell_names, list):
+                raise ValueError("Invalid cells parameter")
+
+            results, execution_times, batch_sizes = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.dispatcher.run,
+                cell_names, input_data, connection["user_id"], connection["session_id"]
+            )
+            self._log_usage(connection, message, execution_times, batch_sizes)
+            response = {"id": request_id, "success": True, "results": results}
+        except Exception as e:
+            self.counters["errors"] += 1
+            response = {"id": request_id, "success": False, "error": str(e)}
+
+        try:
+            await websocket.send(json.dumps(response))
+        except websockets.ConnectionClosed:
+            pass
+
+    def _log_usage(self, connection, message, execution_times, batch_sizes):
+        if self.usage_logger is None:
+            return
+        body = message.encode() if isinstance(message, str) else message
+        fingerprint = self.fingerprinter.for_request(body, execution_times) if self.fingerprinter is not None else None
+        self.usage_logger.log_request(
+            connection["user_id"],
+            connection["session_id"],
+            connection["ip_address"],
+            connection["user_agent"],
+            [
+                (cell_name, fingerprint.cell(cell_name) if fingerprint is not None else None,
+                 exec_time, batch_sizes.get(cell_name, 1))
+                for cell_name, exec_time in execution_times.items()
+            ]
+        )
+
+    def stats(self):
+        running = self._pid == os.getpid() or self._loop is not None
+        return {"port": self.port, "running": running, **self.counters}
+
+
+if __name__ == '__main__':
+    # Stream-only process, sharing app.py's cells, dispatcher and key lookup
+    # (importing app already starts it in the background)
+    from app import stream_server
+    stream_server.start()
+    stream_server.wait()
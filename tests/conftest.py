@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Infrastructure modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing app.py would otherwise start its stream server on the default port
+os.environ.setdefault('STREAM_PORT', '0')
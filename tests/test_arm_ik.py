@@ -0,0 +1,77 @@
+import os
+import math
+import importlib.util
+
+import numpy as np
+import pytest
+
+CELLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cells")
+
+
+@pytest.fixture
+def arm_ik():
+    spec = importlib.util.spec_from_file_location('arm_ik_under_test', os.path.join(CELLS_DIR, 'arm_ik.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _reference(x, y, z):
+    # The original scalar solver
+    theta1 = math.atan2(y, x)
+    theta2 = math.atan2(math.sqrt(x ** 2 + y ** 2) - 0.5, z)
+    return [theta1, theta2, math.pi / 2 - theta2]
+
+
+def test_single_target_matches_the_scalar_solver(arm_ik):
+    result = arm_ik.process({'target': [0.5, 0.2, 0.8]})
+    assert result['success'] and result['mode'] == 'fast_approx'
+    assert result['joints'] == pytest.approx(_reference(0.5, 0.2, 0.8))
+    assert arm_ik.process({'target_x': 0.5, 'target_y': 0.2, 'target_z': 0.8})['joints'] == result['joints']
+
+
+def test_trajectory_matches_per_target_solutions(arm_ik):
+    targets = np.random.default_rng(0).uniform(-2, 2, size=(50, 3))
+    result = arm_ik.process({'targets': targets.tolist()})
+    assert result['success'] and result['mode'] == 'vectorized'
+    for target, joints in zip(targets, result['joints']):
+        assert joints == pytest.approx(_reference(*target))
+    assert all(result['valid'])
+
+
+def test_singularity_is_flagged(arm_ik):
+    joints, valid = arm_ik.solve_batch([[0, 0, 1], [1, 0, 1]])
+    assert valid.tolist() == [False, True]
+    assert 'singularity' in arm_ik.process({'target': [0, 0, 1]})['error']
+
+
+def test_joint_limits_are_flagged(arm_ik):
+    # The elbow leaves [-π, π] once the shoulder angle goes below -π/2
+    result = arm_ik.process({'target': [0.1, 0.0, -1.0]})
+    assert not result['success'] and 'limits' in result['error']
+    assert len(result['joints']) == 3
+
+
+@pytest.mark.parametrize("targets", [[[1, 2]], [[1, 2, 3, 4]], [1, 2], [[[1, 2, 3]]], [["a", 1, 2]]])
+def test_malformed_trajectories_are_rejected(arm_ik, targets):
+    result = arm_ik.process({'targets': targets})
+    assert not result['success'] and 'Invalid targets input' in result['error']
+
+
+def test_single_row_and_empty_trajectories(arm_ik):
+    assert arm_ik.solve_batch([1, 2, 3])[0].shape == (1, 3)
+    assert arm_ik.process({'targets': []}) == {'joints': [], 'valid': [], 'mode': 'vectorized', 'success': True}
+
+
+@pytest.mark.parametrize("input_data", [{'target_x': 'invalid'}, {'target': ['a', 1, 2]}, {'target': [1, 2]}])
+def test_invalid_single_targets_are_reported(arm_ik, input_data):
+    result = arm_ik.process(input_data)
+    assert not result['success'] and result['received_data'] == input_data
+
+
+def test_process_batch_matches_process(arm_ik):
+    inputs = [{'target': [0.5, 0.2, 0.8]}, {'target_x': 'bad'}, {'target': [0, 0, 1]}, "not a dict"]
+    results = arm_ik.process_batch(inputs)
+    assert results[0] == arm_ik.process(inputs[0])
+    assert results[2] == arm_ik.process(inputs[2])
+    assert not results[1]['success'] and not results[3]['success']
@@ -0,0 +1,210 @@
+import json
+import math
+
+import numpy as np
+import pytest
+
+asgi_app = pytest.importorskip('asgi_app')
+from starlette.testclient import TestClient
+
+IDENTITY = {'user_id': 7, 'username': 'robot', 'permissions': ['cells:execute'], 'expires_at': None}
+LOOPBACK = ('127.0.0.1', 50000)
+REMOTE = ('203.0.113.7', 50000)
+
+
+class RecordingDispatcher:
+    """Stands in for CellDispatcher.run; results come from `results`"""
+
+    def __init__(self, results=None):
+        self.results = results
+        self.calls = []
+
+    def run(self, cell_names, input_data, user_id, session_id):
+        self.calls.append((cell_names, input_data, user_id, session_id))
+        results = self.results or {name: {"ok": True} for name in cell_names}
+        return results, {name: 0.001 for name in cell_names}, {}
+
+    def stats(self):
+        return {}
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    async def resolve(api_key):
+        return dict(IDENTITY) if api_key == 'good-key' else None
+
+    dispatcher = RecordingDispatcher()
+    monkeypatch.setattr(asgi_app, 'resolve_api_key', resolve)
+    monkeypatch.setattr(asgi_app, 'dispatcher', dispatcher)
+    monkeypatch.setattr(asgi_app.last_login_tracker, 'touch', lambda user_id: None)
+    monkeypatch.setattr(asgi_app.usage_logger, 'log_request', lambda *args: None)
+    return dispatcher
+
+
+def _client(address=LOOPBACK):
+    # Not used as a context manager, so startup never opens the asyncpg pool
+    return TestClient(asgi_app.app, client=address)
+
+
+def _call(client, **kwargs):
+    headers = {'X-API-Key': 'good-key', **kwargs.pop('headers', {})}
+    return client.post('/ai-api', headers=headers, **kwargs)
+
+
+# Authentication and validation
+
+def test_missing_and_unknown_keys_are_401(dispatcher):
+    client = _client()
+    assert client.post('/ai-api', json={"cells": ["c"]}).status_code == 401
+    response = client.post('/ai-api', json={"cells": ["c"]}, headers={'X-API-Key': 'nope'})
+    assert response.status_code == 401
+    assert response.json() == {"error": "Invalid API key"}
+    assert dispatcher.calls == []
+
+
+@pytest.mark.parametrize("cells", [[], "pid_controller", None])
+def test_invalid_cells_parameter_is_400(dispatcher, cells):
+    response = _call(_client(), json={"cells": cells, "data": {}})
+    assert response.status_code == 400
+    assert response.json() == {"error": "Invalid cells parameter"}
+
+
+def test_json_request_runs_through_the_dispatcher(dispatcher):
+    response = _call(_client(), json={"cells": ["pid_controller"], "data": {"pid_controller": {"e": 1}}},
+                     headers={'X-Session-Id': 'sess'})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success"] is True
+    assert body["metadata"] == {"user_id": 7, "session_id": "sess", "cell_count": 1}
+    assert dispatcher.calls == [(["pid_controller"], {"pid_controller": {"e": 1}}, 7, "sess")]
+
+
+def test_dispatcher_failure_is_500(dispatcher, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(dispatcher, 'run', fail)
+    response = _call(_client(), json={"cells": ["c"], "data": {}})
+    assert response.status_code == 500
+    assert response.json()["message"] == "boom"
+
+
+# JSON encoding matches Flask's jsonify
+
+def test_non_finite_results_are_encoded_like_flask(dispatcher):
+    flask = pytest.importorskip('flask')
+    results = {"c": {"nan": math.nan, "inf": math.inf, "ninf": -math.inf, "text": "Ω"}}
+    dispatcher.results = results
+
+    response = _call(_client(), json={"cells": ["c"], "data": {}}, headers={'X-Session-Id': 's'})
+    assert response.status_code == 200
+    assert b'NaN' in response.content and b'-Infinity' in response.content
+
+    payload = {"success": True, "results": results,
+               "metadata": {"user_id": 7, "session_id": "s", "cell_count": 1}}
+    with flask.Flask(__name__).app_context():
+        assert response.content == flask.jsonify(payload).get_data()
+
+
+def test_json_default_matches_flask_for_dates():
+    from datetime import date, datetime
+    encoded = asgi_app.FlaskJSONResponse({"at": datetime(2024, 1, 2, 3, 4, 5), "on": date(2024, 1, 2)}).body
+    assert json.loads(encoded) == {"at": "Tue, 02 Jan 2024 03:04:05 GMT", "on": "Tue, 02 Jan 2024 00:00:00 GMT"}
+    with pytest.raises(TypeError):
+        asgi_app.FlaskJSONResponse({"x": object()})
+
+
+# Binary uploads
+
+def test_raw_upload_reaches_cells_as_an_array(dispatcher):
+    pixels = np.arange(12, dtype=np.uint8)
+    response = _call(_client(), content=pixels.tobytes(), headers={
+        'Content-Type': 'application/octet-stream', 'X-Cells': 'vision_optimized',
+        'X-Image-Shape': '2,2,3', 'X-Cell-Data': json.dumps({"vision_optimized": {"min_area": 5}})
+    })
+    assert response.status_code == 200
+    cell_names, input_data, _, _ = dispatcher.calls[0]
+    assert cell_names == ["vision_optimized"]
+    assert input_data["vision_optimized"]["min_area"] == 5
+    np.testing.assert_array_equal(input_data["vision_optimized"]["image"], pixels.reshape(2, 2, 3))
+
+
+@pytest.mark.parametrize("headers, content", [
+    ({'Content-Type': 'application/octet-stream', 'X-Image-Shape': '2,2'}, b'\x00' * 4),
+    ({'Content-Type': 'application/octet-stream', 'X-Cells': 'c', 'X-Image-Shape': '3,3'}, b'\x00' * 4),
+    ({'Content-Type': 'application/octet-stream', 'X-Cells': 'c', 'X-Image-Shape': 'a,b'}, b'\x00' * 4),
+    ({'Content-Type': 'application/octet-stream', 'X-Cells': 'c', 'X-Image-Shape': '2,2',
+      'X-Cell-Data': '[1, 2]'}, b'\x00' * 4),
+    ({'Content-Type': 'application/octet-stream', 'X-Cells': 'c', 'X-Image-Shape': '2,2',
+      'X-Cell-Data': '{not json'}, b'\x00' * 4),
+    ({'Content-Type': 'image/png', 'X-Cells': 'c'}, b'not a png'),
+])
+def test_malformed_binary_uploads_are_400(dispatcher, headers, content):
+    response = _call(_client(), content=content, headers=headers)
+    assert response.status_code == 400
+    assert "error" in response.json()
+    assert dispatcher.calls == []
+
+
+def test_multipart_upload_resolves_file_parts(dispatcher):
+    request = {"cells": ["c"], "data": {"c": {"image": {"$file": "frame", "shape": [2, 2]}}}}
+    response = _call(_client(), data={"request": json.dumps(request)},
+                     files={"frame": ("frame.bin", b'\x01\x02\x03\x04', 'application/octet-stream')})
+    assert response.status_code == 200
+    image = dispatcher.calls[0][1]["c"]["image"]
+    np.testing.assert_array_equal(image, [[1, 2], [3, 4]])
+
+
+@pytest.mark.parametrize("request_field, files", [
+    ("{not json", {"frame": ("f", b'\x00', 'application/octet-stream')}),
+    ("[1, 2]", {"frame": ("f", b'\x00', 'application/octet-stream')}),
+    (json.dumps({"cells": ["c"], "data": {"c": {"image": {"$file": "missing"}}}}),
+     {"frame": ("f", b'\x00', 'application/octet-stream')}),
+])
+def test_malformed_multipart_requests_are_400(dispatcher, request_field, files):
+    response = _call(_client(), data={"request": request_field}, files=files)
+    assert response.status_code == 400
+    assert dispatcher.calls == []
+
+
+def test_unparseable_multipart_body_is_400(dispatcher):
+    response = _call(_client(), content=b'--nope\r\ngarbage', headers={
+        'Content-Type': 'multipart/form-data; boundary=expected'
+    })
+    assert response.status_code == 400
+
+
+# /metrics access and pool sizing
+
+def test_metrics_from_loopback():
+    response = _client(LOOPBACK).get('/metrics')
+    assert response.status_code == 200
+    assert "dispatcher" in response.json()
+
+
+def test_metrics_refused_for_remote_callers(monkeypatch):
+    monkeypatch.delenv('METRICS_TOKEN', raising=False)
+    response = _client(REMOTE).get('/metrics')
+    assert response.status_code == 403
+    assert response.json() == {"error": "Forbidden"}
+
+
+def test_metrics_token_admits_remote_callers(monkeypatch):
+    monkeypatch.setenv('METRICS_TOKEN', 'ops-token')
+    client = _client(REMOTE)
+    assert client.get('/metrics', headers={'X-Metrics-Token': 'wrong'}).status_code == 403
+    assert client.get('/metrics', headers={'X-Metrics-Token': 'ops-token'}).status_code == 200
+
+
+@pytest.mark.parametrize("env, expected", [
+    ({'DB_MAX_CONNECTIONS': '20'}, 18),
+    ({'DB_MAX_CONNECTIONS': '20', 'WEB_CONCURRENCY': '4'}, 3),
+    ({'DB_POOL_MAX': '3'}, 1),
+    ({'DB_POOL_MAX': '1'}, 1),
+])
+def test_async_pool_leaves_room_for_the_sync_pool(monkeypatch, env, expected):
+    for name in ('DB_POOL_MAX', 'DB_MAX_CONNECTIONS', 'WEB_CONCURRENCY'):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    assert asgi_app.async_pool_size() == expected
@@ -0,0 +1,91 @@
+import time
+
+from auth_cache import ApiKeyCache
+
+
+def _identity(user_id):
+    return {'user_id': user_id, 'username': f'user{user_id}', 'permissions': ['cells:execute']}
+
+
+def test_hit_after_put_and_miss_for_unknown_key():
+    cache = ApiKeyCache(ttl=60)
+    cache.put('key-a', _identity(1))
+
+    assert cache.get('key-a')['user_id'] == 1
+    assert cache.get('key-b') is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+
+def test_raw_keys_are_not_kept():
+    cache = ApiKeyCache(ttl=60)
+    cache.put('secret-key', _identity(1))
+    assert 'secret-key' not in cache._entries
+
+
+def test_entries_expire_after_ttl():
+    cache = ApiKeyCache(ttl=0.05)
+    cache.put('key-a', _identity(1))
+    time.sleep(0.1)
+    assert cache.get('key-a') is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_key_expiry_caps_the_entry_lifetime():
+    cache = ApiKeyCache(ttl=60)
+    cache.put('key-a', _identity(1), expires_in=0.05)
+    time.sleep(0.1)
+    assert cache.get('key-a') is None
+
+    cache.put('key-b', _identity(2), expires_in=0)
+    assert cache.get('key-b') is None
+
+
+def test_zero_ttl_disables_caching():
+    cache = ApiKeyCache(ttl=0)
+    cache.put('key-a', _identity(1))
+    assert cache.get('key-a') is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ApiKeyCache(max_entries=2, ttl=60)
+    cache.put('key-a', _identity(1))
+    cache.put('key-b', _identity(2))
+    cache.get('key-a')
+    cache.put('key-c', _identity(3))
+
+    assert cache.get('key-b') is None
+    assert cache.get('key-a') is not None and cache.get('key-c') is not None
+
+
+def test_invalidate_user_drops_all_of_their_keys():
+    cache = ApiKeyCache(ttl=60)
+    cache.put('key-a1', _identity(1))
+    cache.put('key-a2', _identity(1))
+    cache.put('key-b', _identity(2))
+
+    cache.invalidate_user(1)
+
+    assert cache.get('key-a1') is None and cache.get('key-a2') is None
+    assert cache.get('key-b')['user_id'] == 2
+
+
+def test_put_racing_an_invalidation_is_dropped():
+    cache = ApiKeyCache(ttl=60)
+    generation = cache.generation()
+    # The key is revoked while its lookup was still in flight
+    cache.invalidate_user(1)
+    cache.put('key-a', _identity(1), generation=generation)
+
+    assert cache.get('key-a') is None
+    cache.put('key-a', _identity(1), generation=cache.generation())
+    assert cache.get('key-a') is not None
+
+
+def test_clear_bumps_the_generation():
+    cache = ApiKeyCache(ttl=60)
+    cache.put('key-a', _identity(1))
+    generation = cache.generation()
+    cache.clear()
+
+    assert cache.generation() != generation
+    assert cache.get('key-a') is None
@@ -0,0 +1,146 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+import binary_ingest
+from binary_ingest import BinaryIngestError, decode_image, from_body, from_multipart, is_binary
+
+
+def _raw(shape=(4, 6, 3), dtype='uint8'):
+    return np.arange(int(np.prod(shape)), dtype=dtype).reshape(shape)
+
+
+def test_raw_buffers_are_viewed_without_copying():
+    image = _raw()
+    body = image.tobytes()
+    decoded = decode_image(body, shape="4,6,3")
+    assert np.array_equal(decoded, image)
+    assert not decoded.flags.writeable and not decoded.flags.owndata
+
+
+@pytest.mark.parametrize("shape", ["4x6x3", "4, 6, 3", [4, 6, 3]])
+def test_shape_spellings(shape):
+    assert decode_image(_raw().tobytes(), shape=shape).shape == (4, 6, 3)
+
+
+def test_multi_byte_dtypes_are_little_endian():
+    image = _raw((2, 3), 'uint16')
+    decoded = decode_image(image.astype('<u2').tobytes(), shape="2,3", dtype='uint16')
+    assert decoded.tolist() == image.tolist()
+
+
+@pytest.mark.parametrize("kwargs, message", [
+    ({}, "needs a shape"),
+    ({"shape": "4,6"}, "needs 24"),
+    ({"shape": "0,6,3"}, "Invalid image shape"),
+    ({"shape": "a,b"}, "Invalid image shape"),
+    ({"shape": 5}, "Invalid image shape"),
+    ({"shape": "4,6,3", "dtype": "complex128"}, "Unsupported dtype"),
+    ({"shape": "4,6,3", "encoding": "gif"}, "Unknown image encoding"),
+])
+def test_raw_failure_paths(kwargs, message):
+    with pytest.raises(BinaryIngestError, match=message):
+        decode_image(_raw().tobytes(), **kwargs)
+
+
+def test_shapes_whose_int64_product_wraps_are_rejected():
+    # 2**32 * 2**32 * 72 wraps to 0 in int64, which an empty buffer would match
+    with pytest.raises(BinaryIngestError, match="exceeds"):
+        decode_image(b'', shape=[2**32, 2**32, 72])
+    assert int(np.prod([2**32, 2**32, 72])) == 0
+
+
+def test_size_cap(monkeypatch):
+    monkeypatch.setattr(binary_ingest, 'MAX_IMAGE_BYTES', 100)
+    with pytest.raises(BinaryIngestError, match="exceeds 100 bytes"):
+        decode_image(b'\0' * 101, shape="101")
+    assert decode_image(b'\0' * 100, shape="100").shape == (100,)
+
+
+@pytest.mark.parametrize("extension, encoding", [(".png", "png"), (".jpg", "jpeg")])
+def test_compressed_images_are_decoded_to_rgb(extension, encoding):
+    cv2 = pytest.importorskip("cv2")
+    rgb = np.zeros((8, 8, 3), dtype=np.uint8)
+    rgb[..., 0] = 255  # red
+    ok, data = cv2.imencode(extension, cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+    assert ok
+    for given in (encoding, None):  # named, or sniffed from the magic bytes
+        decoded = decode_image(data.tobytes(), encoding=given)
+        assert decoded.shape == (8, 8, 3) and decoded[..., 0].min() > 240 and decoded[..., 2].max() < 15
+
+
+def test_undecodable_compressed_image():
+    pytest.importorskip("cv2")
+    with pytest.raises(BinaryIngestError, match="Could not decode png"):
+        decode_image(b'\x89PNG\r\n\x1a\n' + b'garbage')
+
+
+def test_from_body_builds_one_input_per_cell():
+    headers = {
+        "X-Cells": "vision_optimized, tinyml_classify",
+        "X-Image-Shape": "4,6,3",
+        "X-Cell-Data": json.dumps({"vision_optimized": {"threshold": 3}}),
+    }
+    cell_names, input_data = from_body(_raw().tobytes(), headers, 'application/octet-stream')
+    assert cell_names == ["vision_optimized", "tinyml_classify"]
+    assert input_data["vision_optimized"]["threshold"] == 3
+    assert input_data["vision_optimized"]["image"] is input_data["tinyml_classify"]["image"]
+    assert input_data["vision_optimized"] is not input_data["tinyml_classify"]
+
+
+@pytest.mark.parametrize("headers, message", [
+    ({"X-Image-Shape": "4,6,3"}, "X-Cells"),
+    ({"X-Cells": "a", "X-Image-Shape": "4,6,3", "X-Cell-Data": "{"}, "not valid JSON"),
+    ({"X-Cells": "a", "X-Image-Shape": "4,6,3", "X-Cell-Data": "[1, 2]"}, "must be a JSON object"),
+    ({"X-Cells": "a", "X-Image-Shape": "4,6,3", "X-Cell-Data": '"text"'}, "must be a JSON object"),
+    ({"X-Cells": "a", "X-Image-Shape": "4,6,3", "X-Cell-Data": '{"a": [1]}'}, "for 'a' must be a JSON object"),
+])
+def test_from_body_failure_paths(headers, message):
+    with pytest.raises(BinaryIngestError, match=message):
+        from_body(_raw().tobytes(), headers)
+
+
+def test_multipart_resolves_file_references():
+    image = _raw()
+    files = {"frame": (image.tobytes(), {"X-Image-Shape": "4,6,3"}, 'application/octet-stream')}
+    request = {"cells": ["a"], "data": {"a": {"frames": [{"$file": "frame"}], "k": 1}}}
+    cell_names, input_data = from_multipart(json.dumps(request), files)
+    assert cell_names == ["a"] and input_data["a"]["k"] == 1
+    assert np.array_equal(input_data["a"]["frames"][0], image)
+
+
+@pytest.mark.parametrize("request_json, message", [
+    ("{", "not valid JSON"),
+    ("[1]", "must be a JSON object"),
+    ('{"cells": ["a"], "data": {"a": {"$file": "missing"}}}', "No uploaded part named 'missing'"),
+])
+def test_multipart_failure_paths(request_json, message):
+    with pytest.raises(BinaryIngestError, match=message):
+        from_multipart(request_json, {})
+
+
+def test_errors_are_value_errors_for_400_handling():
+    assert issubclass(BinaryIngestError, ValueError)
+    assert is_binary('image/png') and is_binary('multipart/form-data') and not is_binary('application/json')
+
+
+def test_parse_flask_request():
+    flask = pytest.importorskip("flask")
+    app = flask.Flask(__name__)
+    image = _raw()
+    with app.test_request_context('/ai-api', method='POST', data=image.tobytes(),
+                                  content_type='application/octet-stream',
+                                  headers={"X-Cells": "a", "X-Image-Shape": "4,6,3"}):
+        cell_names, input_data = binary_ingest.parse_flask_request(flask.request)
+        assert np.array_equal(input_data["a"]["image"], image)
+
+    form = {
+        "request": json.dumps({"cells": ["a"], "data": {"a": {"image": {"$file": "f", "shape": "4,6,3"}}}}),
+        "f": (io.BytesIO(image.tobytes()), "frame.raw", 'application/octet-stream'),
+    }
+    with app.test_request_context('/ai-api', method='POST', data=form, content_type='multipart/form-data'):
+        cell_names, input_data = binary_ingest.parse_flask_request(flask.request)
+        assert np.array_equal(input_data["a"]["image"], image)
+        assert len(flask.request.get_data()) > image.nbytes
@@ -0,0 +1,117 @@
+import sys
+import textwrap
+
+import pytest
+
+from cell_loader import LazyCell, load_cells
+
+
+@pytest.fixture
+def cells_dir(tmp_path):
+    cells = tmp_path / "cells"
+    cells.mkdir()
+    marker = tmp_path / "imported"
+
+    def write(name, source):
+        (cells / f"{name}.py").write_text(textwrap.dedent(source))
+
+    write("good", f"""
+        open({str(marker)!r}, 'a').write('good\\n')
+        CONCURRENCY = 'session'
+        USES_SCRATCH = True
+
+        def process(input_data):
+            return {{"ok": True}}
+
+        def process_batch(inputs):
+            return [{{"batched": True}} for _ in inputs]
+    """)
+    write("broken", """
+        import module_that_does_not_exist
+        CONCURRENCY = 'stateless'
+
+        def process(input_data):
+            return {}
+    """)
+    write("no_process", "CONCURRENCY = 'stateless'\n")
+    write("syntax", "def process(input_data)\n    return {}\n")
+    write("_private", "def process(input_data):\n    return {}\n")
+    (cells / "notes.txt").write_text("not a cell")
+    yield cells
+    for name in ("good", "broken"):
+        sys.modules.pop(f"cells.{name}", None)
+
+
+def _imported(cells_dir):
+    marker = cells_dir.parent / "imported"
+    return marker.read_text().split() if marker.exists() else []
+
+
+def test_lazy_registration_reads_flags_without_importing(cells_dir):
+    cells = load_cells(str(cells_dir), lazy=True, warmup=[])
+    assert sorted(cells) == ["broken", "good"]
+    assert isinstance(cells["good"], LazyCell)
+    assert cells.capabilities["good"] == {
+        'scratch': True, 'concurrency': 'session', 'executor': 'thread', 'batch': True, 'micro_batch': False
+    }
+    assert _imported(cells_dir) == []
+    assert cells.load_info["good"] == {"loaded": False}
+    assert set(cells.failures) == {"no_process", "syntax"}
+
+
+def test_first_call_imports_once_and_records_load_info(cells_dir):
+    cells = load_cells(str(cells_dir), lazy=True, warmup=[])
+    assert cells["good"]({}) == {"ok": True}
+    assert cells.run_batch("good", [{}, {}]) == [{"batched": True}] * 2
+    assert _imported(cells_dir) == ["good"]
+    info = cells.load_info["good"]
+    assert info["loaded"] is True and info["import_time_ms"] >= 0 and "rss_delta_kb" in info
+
+
+def test_failed_import_is_recorded_and_raised_to_every_caller(cells_dir):
+    cells = load_cells(str(cells_dir), lazy=True, warmup=[])
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match="broken failed to load"):
+            cells["broken"]({})
+    assert "module_that_does_not_exist" in cells.failures["broken"]
+    assert cells.load_info["broken"]["loaded"] is False
+    assert "cells.broken" not in sys.modules
+    status = cells.status()
+    assert status["broken"]["loaded"] is False and status["broken"]["concurrency"] == 'stateless'
+
+
+def test_warmup_imports_listed_cells_and_survives_failures(cells_dir):
+    cells = load_cells(str(cells_dir), lazy=True, warmup=["good", "broken", "unknown"])
+    assert _imported(cells_dir) == ["good"]
+    assert cells.load_info["good"]["loaded"] is True
+    assert "broken" in cells.failures
+
+
+def test_warmup_star_and_env(cells_dir, monkeypatch):
+    monkeypatch.setenv('CELL_WARMUP', '*')
+    load_cells(str(cells_dir), lazy=True)
+    assert _imported(cells_dir) == ["good"]
+
+
+def test_eager_loading_skips_cells_that_fail_to_import(cells_dir, monkeypatch):
+    monkeypatch.setenv('CELL_LAZY_LOAD', 'false')
+    cells = load_cells(str(cells_dir))
+    assert sorted(cells) == ["good"]
+    assert not isinstance(cells["good"], LazyCell)
+    assert set(cells.failures) == {"broken", "no_process", "syntax"}
+
+
+def test_names_limit_what_is_registered(cells_dir):
+    assert sorted(load_cells(str(cells_dir), names=["good"], lazy=True, warmup=[])) == ["good"]
+
+
+def test_missing_directory_is_an_empty_registry(tmp_path):
+    assert load_cells(str(tmp_path / "nowhere")) == {}
+
+
+def test_non_literal_flags_are_treated_as_undeclared(tmp_path):
+    (tmp_path / "computed.py").write_text(
+        "import os\nCONCURRENCY = os.getenv('X', 'stateless')\ndef process(input_data):\n    return {}\n"
+    )
+    cells = load_cells(str(tmp_path), lazy=True, warmup=[])
+    assert cells.capabilities["computed"]["concurrency"] == 'global'
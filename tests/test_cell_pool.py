@@ -0,0 +1,153 @@
+import os
+import textwrap
+
+import pytest
+
+import cell_pool
+from cell_pool import CellPoolError, CellProcessPool
+
+
+@pytest.fixture
+def cells_dir(tmp_path):
+    cells = tmp_path / "cells"
+    cells.mkdir()
+    # Worker startup fails while `fail_start` exists; each start is recorded in `starts`
+    (cells / "work.py").write_text(textwrap.dedent(f"""
+        import os
+
+        CONCURRENCY = 'stateless'
+        EXECUTOR = 'process'
+
+        with open({str(tmp_path / 'starts')!r}, 'a') as f:
+            f.write(str(os.getpid()) + '\\n')
+        if os.path.exists({str(tmp_path / 'fail_start')!r}):
+            os._exit(3)
+
+        def process(input_data):
+            if input_data.get('crash'):
+                os._exit(1)
+            if input_data.get('raise'):
+                raise ValueError('bad input')
+            return {{"pid": os.getpid(), "value": input_data.get('value')}}
+
+        def process_batch(inputs):
+            return [process(item) for item in inputs]
+    """))
+    return cells
+
+
+def _pool(cells_dir, **kwargs):
+    kwargs.setdefault('size', 1)
+    return CellProcessPool(str(cells_dir), ["work"], call_timeout=10, startup_timeout=10, **kwargs)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # A killed child that was reaped is gone; one that wasn't would be a zombie
+    with open(f"/proc/{pid}/stat") as f:
+        return f.read().split(')')[1].split()[0] != 'Z'
+
+
+def test_calls_and_batches_run_in_a_warm_worker(cells_dir):
+    pool = _pool(cells_dir)
+    try:
+        first = pool.call("work", {"value": 1})
+        assert first["value"] == 1 and first["pid"] != os.getpid()
+        assert pool.call("work", [{"value": 2}, {"value": 3}], batch=True)[1]["value"] == 3
+        assert pool.call("work", {"value": 4})["pid"] == first["pid"]
+    finally:
+        pool.shutdown()
+
+
+def test_a_cell_error_keeps_the_worker(cells_dir):
+    pool = _pool(cells_dir)
+    try:
+        pid = pool.call("work", {})["pid"]
+        with pytest.raises(RuntimeError, match="bad input"):
+            pool.call("work", {"raise": True})
+        assert pool.call("work", {})["pid"] == pid
+        assert pool.stats()["restarts"] == 0
+    finally:
+        pool.shutdown()
+
+
+def test_a_crashed_worker_is_replaced(cells_dir):
+    pool = _pool(cells_dir)
+    try:
+        pid = pool.call("work", {})["pid"]
+        with pytest.raises(CellPoolError):
+            pool.call("work", {"crash": True})
+        assert pool.call("work", {})["pid"] != pid
+        stats = pool.stats()
+        assert stats["failures"] == 1 and stats["restarts"] == 1 and stats["idle"] == 1
+    finally:
+        pool.shutdown()
+
+
+def test_a_failed_restart_keeps_the_slot_and_is_retried(cells_dir, tmp_path):
+    pool = _pool(cells_dir)
+    try:
+        pool.call("work", {})
+        (tmp_path / "fail_start").touch()
+        with pytest.raises(CellPoolError):
+            pool.call("work", {"crash": True})
+        assert pool.stats()["idle"] == 1 and pool.stats()["restart_failures"] == 1
+
+        # Still failing: the call reports it and the slot comes back again
+        with pytest.raises(CellPoolError, match="failed to restart"):
+            pool.call("work", {})
+        assert pool.stats()["idle"] == 1 and pool.stats()["restart_failures"] == 2
+
+        (tmp_path / "fail_start").unlink()
+        assert pool.call("work", {"value": 5})["value"] == 5
+        assert pool.stats()["restarts"] == 1
+    finally:
+        pool.shutdown()
+
+
+def test_a_failed_recycle_keeps_the_slot(cells_dir, tmp_path):
+    pool = _pool(cells_dir, max_calls=1)
+    try:
+        pool.call("work", {})
+        (tmp_path / "fail_start").touch()
+        # The call itself succeeded; only the worker's replacement failed
+        assert pool.call("work", {"value": 6})["value"] == 6
+        assert pool.stats()["idle"] == 1 and pool.stats()["restart_failures"] == 1
+        (tmp_path / "fail_start").unlink()
+        assert pool.call("work", {"value": 7})["value"] == 7
+    finally:
+        pool.shutdown()
+
+
+def test_partial_startup_kills_the_workers_it_started(cells_dir, tmp_path, monkeypatch):
+    started = []
+    failing = [True]
+    real_worker = cell_pool._Worker
+
+    def worker(*args):
+        # The third worker of the first startup fails
+        if len(started) == 2 and failing:
+            failing.pop()
+            (tmp_path / "fail_start").touch()
+        started.append(real_worker(*args))
+        return started[-1]
+
+    monkeypatch.setattr(cell_pool, '_Worker', worker)
+    pool = _pool(cells_dir, size=3)
+    with pytest.raises(CellPoolError, match="failed to start"):
+        pool.call("work", {})
+    assert len(started) == 2
+    assert not any(_alive(w.process.pid) for w in started)
+    starts = (tmp_path / "starts").read_text().split()
+    assert len(starts) == 3 and not _alive(int(starts[-1]))
+
+    # Startup is retried by the next call
+    (tmp_path / "fail_start").unlink()
+    try:
+        assert pool.call("work", {"value": 8})["value"] == 8
+        assert len(pool.stats()["workers"]) == 3
+    finally:
+        pool.shutdown()
@@ -0,0 +1,103 @@
+import os
+import glob
+import threading
+import textwrap
+from contextlib import nullcontext
+
+import pytest
+
+from cell_loader import load_cells, _static_metadata
+from concurrency import CellLocks, LockStripes, POLICIES, GLOBAL, SESSION, STATELESS
+from dispatcher import CellDispatcher
+
+CELLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cells')
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(CELLS_DIR, '*.py'))), ids=os.path.basename)
+def test_every_cell_file_declares_a_policy(path):
+    flags, _ = _static_metadata(path)
+    assert flags.get('CONCURRENCY') in POLICIES
+
+
+def test_stateless_cells_are_never_locked():
+    locks = CellLocks({"a": STATELESS})
+    assert isinstance(locks.lock_for("a", 1, "s1"), nullcontext)
+
+
+def test_session_cells_lock_per_user_and_session():
+    locks = CellLocks({"a": SESSION, "b": SESSION}, stripes=4096)
+    assert locks.lock_for("a", 1, "s1") is locks.lock_for("a", 1, "s1")
+    others = [locks.lock_for("a", 1, "s2"), locks.lock_for("a", 2, "s1"), locks.lock_for("b", 1, "s1")]
+    assert any(lock is not locks.lock_for("a", 1, "s1") for lock in others)
+
+
+def test_global_and_undeclared_cells_share_one_lock():
+    locks = CellLocks({"a": GLOBAL})
+    assert locks.lock_for("a", 1, "s1") is locks.lock_for("a", 2, "s2")
+    assert locks.lock_for("unknown", 1, "s1") is locks.lock_for("unknown", 2, "s2")
+    assert locks.lock_for("a", 1, "s1") is not locks.lock_for("unknown", 1, "s1")
+
+
+def test_lock_stripes_stay_bounded():
+    stripes = LockStripes(8)
+    assert len({id(stripes.lock_for(("a", user, "s"))) for user in range(1000)}) <= 8
+
+
+def _dispatcher(tmp_path, policy):
+    cells_dir = tmp_path / "cells"
+    cells_dir.mkdir()
+    declaration = f"CONCURRENCY = {policy!r}\n" if policy else ""
+    (cells_dir / "slow.py").write_text(declaration + textwrap.dedent("""
+        import time
+        import threading
+
+        _active = [0, 0]  # current, peak
+        _guard = threading.Lock()
+
+        def process(input_data):
+            with _guard:
+                _active[0] += 1
+                _active[1] = max(_active)
+            time.sleep(0.02)
+            with _guard:
+                _active[0] -= 1
+            return {"peak": _active[1]}
+    """))
+    return CellDispatcher(load_cells(str(cells_dir)))
+
+
+def _peak_overlap(dispatcher, sessions):
+    results = []
+
+    def call(i):
+        results.append(dispatcher.run(["slow"], {}, 1, sessions[i % len(sessions)])[0]["slow"])
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    dispatcher.shutdown()
+    return max(result["peak"] for result in results)
+
+
+@pytest.mark.parametrize("policy, sessions, expected", [
+    ('global', ["s1", "s2", "s3"], 1),
+    (None, ["s1", "s2", "s3"], 1),
+    ('session', ["s1"], 1),
+])
+def test_dispatcher_serializes_what_the_policy_says(tmp_path, policy, sessions, expected):
+    assert _peak_overlap(_dispatcher(tmp_path, policy), sessions) == expected
+
+
+def test_dispatcher_overlaps_stateless_calls(tmp_path):
+    assert _peak_overlap(_dispatcher(tmp_path, 'stateless'), ["s1"]) > 1
+
+
+def test_unknown_policy_falls_back_to_global(tmp_path):
+    cells_dir = tmp_path / "cells"
+    cells_dir.mkdir()
+    (cells_dir / "odd.py").write_text("CONCURRENCY = 'sometimes'\ndef process(input_data):\n    return {}\n")
+    cells = load_cells(str(cells_dir))
+    assert cells.capabilities["odd"]["concurrency"] == GLOBAL
+    assert cells.load_info["odd"]["warnings"]
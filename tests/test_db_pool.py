@@ -0,0 +1,148 @@
+import os
+
+import pytest
+from psycopg2 import extensions
+
+import db_pool
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self, healthy=True):
+        self.closed = 0
+        self.healthy = healthy
+        self.rollbacks = 0
+        self.info = type('Info', (), {'transaction_status': extensions.TRANSACTION_STATUS_IDLE})()
+
+    def cursor(self):
+        conn = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql):
+                if not conn.healthy:
+                    raise RuntimeError("server closed the connection")
+
+        return Cursor()
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    created = []
+
+    def connect(dsn):
+        created.append(FakeConnection())
+        return created[-1]
+
+    monkeypatch.setattr(db_pool.psycopg2, 'connect', connect)
+    return created
+
+
+def _pool(**kwargs):
+    options = dict(max_size=2, min_size=0, max_idle=300, health_check_after=30, timeout=0.05)
+    options.update(kwargs)
+    return ConnectionPool('postgres://test', **options)
+
+
+def test_connections_are_reused(connections):
+    pool = _pool()
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    assert first is second
+    assert len(connections) == 1
+    assert pool.stats()["created"] == 1 and pool.stats()["reused"] == 1
+
+
+def test_exhausted_pool_times_out(connections):
+    pool = _pool(max_size=1)
+    conn = pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()["timeouts"] == 1
+
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+
+
+def test_failed_connect_releases_its_slot(monkeypatch):
+    pool = _pool(max_size=1)
+
+    def refuse(dsn):
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(db_pool.psycopg2, 'connect', refuse)
+    for _ in range(3):
+        with pytest.raises(OSError):
+            pool.getconn()
+    assert pool.stats()["open"] == 0
+
+
+def test_unhealthy_idle_connection_is_replaced(connections):
+    pool = _pool(health_check_after=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.healthy = False
+
+    replacement = pool.getconn()
+
+    assert replacement is not conn
+    assert conn.closed
+    assert pool.stats()["health_check_failures"] == 1
+
+
+def test_open_transaction_is_rolled_back_on_return(connections):
+    pool = _pool()
+    conn = pool.getconn()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+
+    assert conn.rollbacks == 1
+    assert pool.getconn() is conn
+
+
+def test_forked_worker_starts_with_an_empty_pool(connections):
+    pool = _pool()
+    parent_conn = pool.getconn()
+    pool.putconn(parent_conn)
+
+    # Pretend this process is a fork of the one that filled the pool
+    pool._pid = os.getpid() + 1
+    child_conn = pool.getconn()
+
+    assert child_conn is not parent_conn
+    # The parent's socket is kept referenced but never closed by the child
+    assert not parent_conn.closed
+    assert parent_conn in pool._inherited
+
+
+def test_default_pool_size_splits_the_budget(monkeypatch):
+    monkeypatch.delenv('DB_POOL_MAX', raising=False)
+    monkeypatch.setenv('DB_MAX_CONNECTIONS', '20')
+    monkeypatch.setenv('WEB_CONCURRENCY', '4')
+    assert db_pool.default_pool_size() == 5
+    monkeypatch.setenv('DB_POOL_MAX', '3')
+    assert db_pool.default_pool_size() == 3
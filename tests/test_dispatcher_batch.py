@@ -0,0 +1,89 @@
+import textwrap
+
+import pytest
+
+from cell_loader import load_cells
+from dispatcher import CellDispatcher, _is_batch
+
+
+@pytest.mark.parametrize("cell_input, expected", [
+    ([{"a": 1}, {"a": 2}], True),
+    ([{}], True),
+    ([], False),
+    ([[1, 2], [3, 4]], False),
+    ([{"a": 1}, 2], False),
+    ({"a": 1}, False),
+    (None, False),
+])
+def test_is_batch(cell_input, expected):
+    assert _is_batch(cell_input) is expected
+
+
+@pytest.fixture
+def dispatcher(tmp_path):
+    cells_dir = tmp_path / "cells"
+    cells_dir.mkdir()
+    (cells_dir / "looped.py").write_text(textwrap.dedent("""
+        CONCURRENCY = 'stateless'
+
+        def process(input_data):
+            if isinstance(input_data, list):
+                return {"length": len(input_data)}
+            if input_data.get("fail"):
+                raise ValueError("bad item")
+            return {"x": input_data["x"] * 2}
+    """))
+    (cells_dir / "batched.py").write_text(textwrap.dedent("""
+        CONCURRENCY = 'stateless'
+        CALLS = []
+
+        def process(input_data):
+            return {"x": input_data["x"]}
+
+        def process_batch(inputs):
+            CALLS.append(len(inputs))
+            return [{"x": item["x"], "calls": list(CALLS)} for item in inputs]
+    """))
+    dispatcher = CellDispatcher(load_cells(str(cells_dir)))
+    yield dispatcher
+    dispatcher.shutdown()
+
+
+def test_batch_runs_once_and_reports_its_size(dispatcher):
+    results, execution_times, batch_sizes = dispatcher.run(
+        ["batched"], {"batched": [{"x": 1}, {"x": 2}, {"x": 3}]}, 1, "s1"
+    )
+    assert [item["x"] for item in results["batched"]] == [1, 2, 3]
+    assert results["batched"][-1]["calls"] == [3]
+    assert batch_sizes == {"batched": 3} and "batched" in execution_times
+
+
+def test_cells_without_process_batch_loop_with_per_item_errors(dispatcher):
+    results, _, batch_sizes = dispatcher.run(["looped"], {"looped": [{"x": 1}, {"fail": True}]}, 1, "s1")
+    assert results["looped"] == [{"x": 2}, {"error": "bad item"}]
+    assert batch_sizes == {"looped": 2}
+
+
+def test_every_batch_item_gets_the_user_context(dispatcher):
+    items = [{"x": 1}, {"x": 2}]
+    dispatcher.run(["looped"], {"looped": items}, 5, "s5")
+    assert all(item["_user_context"]["session_id"] == "s5" for item in items)
+
+
+def test_empty_list_is_a_plain_input_not_a_batch(dispatcher):
+    results, _, batch_sizes = dispatcher.run(["looped"], {"looped": []}, 1, "s1")
+    assert results["looped"] == {"length": 0}
+    assert batch_sizes == {}
+
+
+def test_bare_list_input_is_not_a_batch(dispatcher):
+    results, _, batch_sizes = dispatcher.run(["looped"], {"looped": [[1, 2], [3, 4]]}, 1, "s1")
+    assert results["looped"] == {"length": 2}
+    assert batch_sizes == {}
+
+
+def test_oversized_batch_is_rejected(dispatcher):
+    dispatcher.max_batch = 2
+    results, execution_times, _ = dispatcher.run(["batched"], {"batched": [{"x": 1}] * 3}, 1, "s1")
+    assert "exceeds the limit" in results["batched"]["error"]
+    assert execution_times == {}
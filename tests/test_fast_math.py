@@ -0,0 +1,77 @@
+import os
+import math
+import importlib.util
+
+import numpy as np
+import pytest
+
+CELLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cells")
+
+
+@pytest.fixture
+def fast_math():
+    spec = importlib.util.spec_from_file_location('fast_math_under_test', os.path.join(CELLS_DIR, 'fast_math.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_scalar_angle_keeps_the_original_contract(fast_math):
+    result = fast_math.process({"angle": 30})
+    assert result["sin"] == pytest.approx(0.5) and result["cos"] == pytest.approx(math.sqrt(3) / 2)
+    assert result["precision_deg"] == 0.1 and result["method"] == "LUT"
+
+
+def test_angle_lists_match_numpy_within_table_precision(fast_math):
+    angles = np.random.default_rng(0).uniform(-720, 720, 1000)
+    result = fast_math.process({"angles": angles.tolist(), "functions": ["sin", "cos", "tan"]})
+    radians = np.radians(angles)
+    # Nearest entry: off by at most half a step
+    assert np.max(np.abs(np.array(result["sin"]) - np.sin(radians))) < math.radians(0.05) + 1e-12
+    assert np.max(np.abs(np.array(result["cos"]) - np.cos(radians))) < math.radians(0.05) + 1e-12
+    away_from_poles = np.abs(np.cos(radians)) > 0.2
+    assert np.allclose(np.array(result["tan"])[away_from_poles], np.tan(radians)[away_from_poles], atol=0.05)
+
+
+def test_interpolation_is_more_precise(fast_math):
+    lut = fast_math.get_lut(1.0)
+    angles = np.linspace(0, 360, 997)
+    nearest = np.max(np.abs(lut.sin(angles) - np.sin(np.radians(angles))))
+    lerp = np.max(np.abs(lut.sin(angles, interpolate=True) - np.sin(np.radians(angles))))
+    assert lerp < nearest / 10
+
+
+def test_atan2_covers_every_quadrant(fast_math):
+    y, x = np.meshgrid(np.linspace(-3, 3, 41), np.linspace(-3, 3, 41))
+    result = fast_math.get_lut().atan2(y.ravel(), x.ravel(), interpolate=True)
+    assert np.allclose(result, np.degrees(np.arctan2(y.ravel(), x.ravel())), atol=1e-3)
+    assert fast_math.process({"y": 1, "x": 0})["atan2"] == pytest.approx(90)
+
+
+def test_a_single_function_name_is_not_split_into_characters(fast_math):
+    result = fast_math.process({"angle": 90, "functions": "sin"})
+    assert set(result) == {"sin", "precision_deg", "method"}
+
+
+@pytest.mark.parametrize("input_data", [
+    {"angle": float("nan")},
+    {"angles": [0, float("inf")]},
+    {"y": float("nan"), "x": 1},
+    {"y": 1, "x": [0, float("-inf")]},
+])
+def test_non_finite_inputs_are_rejected(fast_math, input_data):
+    with pytest.raises(ValueError, match="finite"):
+        fast_math.process(input_data)
+
+
+@pytest.mark.parametrize("resolution", [0.7, 0.0001, float("nan"), float("inf")])
+def test_unusable_resolutions_are_rejected(fast_math, resolution):
+    with pytest.raises(ValueError):
+        fast_math.TrigLUT(resolution)
+
+
+def test_unknown_function_and_missing_angle(fast_math):
+    with pytest.raises(ValueError, match="Unknown function"):
+        fast_math.process({"angle": 1, "functions": ["sec"]})
+    with pytest.raises(KeyError):
+        fast_math.process({})
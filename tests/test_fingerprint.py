@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from fingerprint import Fingerprinter, _cell_inputs, _parse_cell_modes
+
+
+def _body(data, **extra):
+    return json.dumps({"cells": list(data), "data": data, **extra}).encode()
+
+
+def test_cell_inputs_are_the_raw_data_slices():
+    body = b'{"cells": ["a", "b"], "data": {"a": {"x": [1, 2]}, "b" : "caf\\u00e9 \xc3\xa9"}}'
+    inputs = _cell_inputs(body, ["a", "b", "missing"])
+    assert inputs == {"a": b'{"x": [1, 2]}', "b": '"caf\\u00e9 é"'.encode(), "missing": b''}
+
+
+@pytest.mark.parametrize("body", [b'\x89PNG\r\n\x1a\n', b'[1, 2]', b'{"data": [1]}', b'{"data": {"a": 1'])
+def test_bodies_without_a_data_object_are_the_whole_input(body):
+    assert _cell_inputs(body, ["a"]) == {"a": body}
+
+
+def test_fingerprint_covers_only_the_cells_own_input():
+    fingerprinter = Fingerprinter(default_mode='full', cell_modes={})
+    first = fingerprinter.for_request(_body({"a": {"x": 1}, "b": {"y": 1}}), ["a", "b"])
+    second = fingerprinter.for_request(_body({"a": {"x": 1}, "b": {"y": 2}}, extra=True), ["a", "b"])
+    assert first.for_cell("a") == second.for_cell("a")
+    assert first.for_cell("b") != second.for_cell("b")
+
+
+def test_same_input_to_different_cells_differs():
+    fingerprinter = Fingerprinter(default_mode='full', cell_modes={})
+    fingerprint = fingerprinter.for_request(_body({"a": {"x": 1}, "b": {"x": 1}}), ["a", "b"])
+    assert fingerprint.for_cell("a") != fingerprint.for_cell("b")
+
+
+def test_sampled_mode_matches_full_for_small_inputs_and_bounds_large_ones():
+    data = {"a": {"x": 1}, "big": {"blob": "z" * 200000}}
+    sampled = Fingerprinter(default_mode='sampled', max_bytes=1024, block_size=128, cell_modes={})
+    fingerprint = sampled.for_request(_body(data), ["a", "big"])
+    # Large body: only bounded samples are kept while the record is queued
+    assert fingerprint._body is None
+    assert all(len(value) <= 1024 + 8 for value in fingerprint._inputs.values())
+
+    full = Fingerprinter(default_mode='full', cell_modes={}).for_request(_body(data), ["a", "big"])
+    assert fingerprint.for_cell("a") == full.for_cell("a")
+    assert fingerprint.for_cell("big") != full.for_cell("big")
+
+    changed = dict(data, big={"blob": "z" * 199999 + "y"})
+    assert sampled.for_request(_body(changed), ["a", "big"]).for_cell("big") != fingerprint.for_cell("big")
+
+
+def test_lazy_and_eager_sampling_agree():
+    data = {"big": {"blob": "q" * 5000}}
+    lazy = Fingerprinter(default_mode='sampled', max_bytes=4096, block_size=512, cell_modes={})
+    eager = Fingerprinter(default_mode='sampled', max_bytes=4096, block_size=512, cell_modes={})
+    small_body = _body(data)
+    assert lazy.for_request(small_body, ["big"]).for_cell("big") == \
+        eager.for_request(small_body + b' ' * 5000, ["big"]).for_cell("big")
+
+
+def test_off_mode_and_unknown_cells_are_empty():
+    fingerprinter = Fingerprinter(default_mode='sampled', cell_modes={"a": "off"})
+    fingerprint = fingerprinter.for_request(_body({"a": 1, "b": 2}), ["a", "b"])
+    assert fingerprint.for_cell("a") == ''
+    assert fingerprint.for_cell("c") == ''
+    assert fingerprint.cell("b")() == fingerprint.for_cell("b") != ''
+
+
+def test_parse_cell_modes_strips_whitespace():
+    assert _parse_cell_modes(" a= full ") == {"a": "full"}
+    assert _parse_cell_modes("a = sampled , b=off") == {"a": "sampled", "b": "off"}
+    assert _parse_cell_modes(None) == {}
+
+
+@pytest.mark.parametrize("spec", ["a=fast", "a"])
+def test_parse_cell_modes_rejects_unknown_modes(spec):
+    with pytest.raises(ValueError):
+        _parse_cell_modes(spec)
+
+
+def test_unknown_default_mode_is_rejected():
+    with pytest.raises(ValueError):
+        Fingerprinter(default_mode='fast')
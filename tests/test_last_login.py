@@ -0,0 +1,98 @@
+import pytest
+
+import last_login
+from last_login import LastLoginTracker
+
+
+class FakeDb:
+    def __init__(self):
+        self.fail = False
+        self.commits = 0
+
+    def __call__(self):
+        return self
+
+    def __enter__(self):
+        if self.fail:
+            raise RuntimeError("database unavailable")
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return self
+
+    def commit(self):
+        self.commits += 1
+
+
+@pytest.fixture
+def updates(monkeypatch):
+    sent = []
+    monkeypatch.setattr(last_login, 'execute_values', lambda cur, sql, rows, **kwargs: sent.append(list(rows)))
+    return sent
+
+
+def _tracker(db):
+    # A long interval keeps the background thread out of the way; tests flush by hand
+    return LastLoginTracker(db, flush_interval=3600)
+
+
+def test_touches_are_coalesced_into_one_update(updates):
+    db = FakeDb()
+    tracker = _tracker(db)
+    for user_id in (3, 1, 3, 2, 1):
+        tracker.touch(user_id)
+
+    assert tracker.flush() == 3
+    assert len(updates) == 1
+    # Sorted by user id, one row per user
+    assert [user_id for user_id, _ in updates[0]] == [1, 2, 3]
+    assert tracker.flush() == 0
+    assert tracker.stats()["flushes"] == 1 and tracker.stats()["flushed_rows"] == 3
+
+
+def test_failed_flush_keeps_rows_for_the_next_one(updates):
+    db = FakeDb()
+    tracker = _tracker(db)
+    tracker.touch(1)
+    db.fail = True
+
+    assert tracker.flush() == 0
+    assert tracker.stats()["errors"] == 1 and tracker.stats()["pending"] == 1
+
+    db.fail = False
+    assert tracker.flush() == 1
+    assert updates[0][0][0] == 1
+
+
+def test_requeued_row_does_not_overwrite_a_newer_touch(updates):
+    db = FakeDb()
+    tracker = _tracker(db)
+    tracker.touch(1)
+    seen = tracker._pending[1]
+
+    def fail_after_newer_touch():
+        # Another request sees the user while the flush is in flight
+        tracker._pending[1] = seen + 10
+        raise RuntimeError("database unavailable")
+
+    tracker.get_db = fail_after_newer_touch
+    tracker.flush()
+    assert tracker._pending[1] == seen + 10
+
+
+def test_forked_worker_starts_with_nothing_pending(updates):
+    tracker = _tracker(FakeDb())
+    tracker.touch(1)
+    tracker._pid = -1  # as seen from a freshly forked child
+    tracker.touch(2)
+    assert list(tracker._pending) == [2]
+
+
+def test_shutdown_flushes_pending_rows(updates):
+    tracker = _tracker(FakeDb())
+    tracker.touch(7)
+    tracker.shutdown()
+    assert updates and updates[0][0][0] == 7
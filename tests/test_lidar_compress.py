@@ -0,0 +1,127 @@
+import os
+import base64
+import importlib.util
+
+import numpy as np
+import pytest
+
+CELLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cells")
+
+
+@pytest.fixture
+def lidar():
+    spec = importlib.util.spec_from_file_location('lidar_compress_under_test', os.path.join(CELLS_DIR, 'lidar_compress.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _call(lidar, session='s1', **data):
+    return lidar.process(dict(data, _user_context={'user_id': 1, 'session_id': session}))
+
+
+def _scan(n=720, seed=0):
+    rng = np.random.default_rng(seed)
+    return (5 + np.cumsum(rng.normal(0, 0.01, n))).tolist()
+
+
+@pytest.mark.parametrize("values", [
+    [0, 1, -1, 63, 64, -64, -65, 2**31, -2**31],
+    [2**60 - 1, -(2**60 - 1), 0, 2**60 - 1],
+    [],
+    [7],
+])
+def test_codec_round_trips_key_frames(lidar, values):
+    quantized = np.array(values, dtype=np.int64)
+    decoded, precision, frame = lidar.decode(lidar.encode(quantized, 0.001))
+    assert decoded.tolist() == values and precision == 0.001 and frame == lidar.KEY_FRAME
+
+
+def test_codec_round_trips_inter_frames(lidar):
+    rng = np.random.default_rng(1)
+    reference = rng.integers(-2**40, 2**40, 1000)
+    quantized = reference + rng.integers(-5, 5, 1000)
+    quantized[::97] = rng.integers(-2**59, 2**59, len(quantized[::97]))  # escapes
+    data = lidar.encode(quantized, 0.01, reference)
+    decoded, _, frame = lidar.decode(data, reference)
+    assert frame == lidar.INTER_FRAME and np.array_equal(decoded, quantized)
+
+
+def test_varints_match_leb128(lidar):
+    values = np.array([0, 1, 127, 128, 300, 2**63, 2**64 - 1], dtype=np.uint64)
+    expected = b''
+    for value in values.tolist():
+        while True:
+            byte = value & 0x7F
+            value >>= 7
+            expected += bytes([byte | (0x80 if value else 0)])
+            if not value:
+                break
+    assert lidar._varint_encode(values) == expected
+    assert lidar._varint_decode(expected, len(values)).tolist() == values.tolist()
+
+
+def test_process_round_trip_within_precision(lidar):
+    scan = _scan()
+    result = _call(lidar, scan=scan)
+    assert result["frame"] == "key" and result["compression_ratio"] > 1
+    decoded = _call(lidar, decompress=result["compressed_scan"])["scan"]
+    assert np.max(np.abs(np.array(decoded) - scan)) <= 0.0005 + 1e-12
+    assert result["max_error"] <= 0.0005 + 1e-12
+
+
+def test_streams_use_inter_frames_per_session(lidar):
+    first, second = _scan(seed=0), _scan(seed=0)
+    second[10] += 0.5
+    assert _call(lidar, scan=first, stream=True)["frame"] == "key"
+    encoded = _call(lidar, scan=second, stream=True)
+    assert encoded["frame"] == "inter"
+    assert _call(lidar, 's2', scan=second, stream=True)["frame"] == "key"
+    assert _call(lidar, scan=second, stream=True, keyframe=True)["frame"] == "key"
+
+    # The decoding side keeps its own reference per session
+    _call(lidar, 's3', decompress=_call(lidar, 's9', scan=first, stream=True)["compressed_scan"], stream=True)
+    decoded = _call(lidar, 's3', decompress=_call(lidar, 's9', scan=second, stream=True)["compressed_scan"], stream=True)
+    assert decoded["frame"] == "inter"
+    assert np.allclose(decoded["scan"], second, atol=0.0005)
+
+
+def test_inter_frame_without_reference_is_rejected(lidar):
+    _call(lidar, scan=_scan(), stream=True)
+    inter = _call(lidar, scan=_scan(), stream=True)["compressed_scan"]
+    with pytest.raises(ValueError, match="reference"):
+        _call(lidar, 'other', decompress=inter, stream=True)
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: data[:10],                      # truncated header
+    lambda data: b'XXXX' + data[4:],             # wrong magic
+    lambda data: data[:4] + b'\x07' + data[5:],  # unknown frame type
+    lambda data: data[:-1],                      # last varint cut short
+    lambda data: data + b'\x01',                 # more varints than the header says
+    lambda data: data[:-1] + b'\x80' * 11 + b'\x01',  # varint longer than a uint64
+])
+def test_corrupt_streams_are_rejected(lidar, corrupt):
+    data = lidar.encode(np.arange(0, 5000, 37, dtype=np.int64), 0.001)
+    with pytest.raises(ValueError):
+        lidar.decode(corrupt(data))
+
+
+@pytest.mark.parametrize("data", [
+    {"scan": [1.0, float("nan")]},
+    {"scan": [[1.0, 2.0]]},
+    {"scan": [1e300]},
+    {"scan": [1.0], "precision": 0},
+    {"scan": [1.0], "precision": float("inf")},
+    {"scan": [1.0], "precision": float("nan")},
+])
+def test_unusable_scans_are_rejected(lidar, data):
+    with pytest.raises(ValueError):
+        _call(lidar, **data)
+
+
+def test_streams_are_bounded(lidar, monkeypatch):
+    monkeypatch.setattr(lidar, 'MAX_STREAMS', 2)
+    for session in ('s1', 's2', 's3'):
+        _call(lidar, session, scan=_scan(), stream=True)
+    assert [key[1] for key in lidar._STREAMS] == ['s2', 's3']
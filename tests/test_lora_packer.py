@@ -0,0 +1,91 @@
+import os
+import base64
+import importlib.util
+
+import numpy as np
+import pytest
+
+CELLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cells")
+
+
+@pytest.fixture
+def lora():
+    spec = importlib.util.spec_from_file_location('lora_packer_under_test', os.path.join(CELLS_DIR, 'lora_packer.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+GOOD = {"temp": 12.3, "humidity": 55, "accel_x": -3.21, "battery": 12.6}
+
+
+def _records(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {"temp": t, "humidity": h, "accel_x": a, "battery": b}
+        for t, h, a, b in zip(rng.uniform(-12.8, 12.7, n), rng.integers(0, 101, n),
+                              rng.uniform(-327, 327, n), rng.uniform(0, 25.5, n))
+    ]
+
+
+def test_single_packet_layout(lora):
+    packet = base64.b64decode(lora.process(GOOD)["lora_packet"])
+    assert packet == bytes([123, 55]) + (-321).to_bytes(2, 'big', signed=True) + bytes([126])
+
+
+def test_bulk_packing_matches_single_packets(lora):
+    records = _records(200)
+    result = lora.process({"records": records, "encoding": "hex"})
+    expected = b''.join(bytes.fromhex(lora.process(dict(r, encoding="hex"))["lora_packet"]) for r in records)
+    assert bytes.fromhex(result["lora_packets"]) == expected
+    assert result["count"] == 200 and all(result["valid"]) and result["errors"] == {}
+
+
+def test_invalid_records_are_flagged_and_left_out(lora):
+    records = [GOOD, dict(GOOD, temp=50), {"humidity": 1}, dict(GOOD, battery="x"), "junk", dict(GOOD, accel_x=float("inf"))]
+    result = lora.process({"records": records})
+    assert result["valid"] == [True, False, False, False, False, False]
+    assert result["errors"]["1"] == "Temperature out of range"
+    assert result["errors"]["2"] == "Missing or invalid temp"
+    assert result["errors"]["3"] == "Missing or invalid battery"
+    assert result["errors"]["5"] == "Acceleration out of range"
+    assert base64.b64decode(result["lora_packets"]) == base64.b64decode(lora.process(GOOD)["lora_packet"])
+
+
+def test_unpack_round_trip(lora):
+    records = _records(50, seed=3)
+    packed = lora.process({"records": records})["lora_packets"]
+    unpacked = lora.process({"unpack": packed})
+    assert unpacked["count"] == 50
+    for original, record in zip(records, unpacked["records"]):
+        for name, _, scale, _, _ in lora.SCHEMA:
+            assert abs(record[name] - original[name]) < 1 / scale + 1e-9
+
+
+def test_empty_batches(lora):
+    assert lora.process({"records": []})["lora_packets"] == ""
+    assert lora.process({"unpack": ""}) == {"records": [], "count": 0}
+
+
+def test_unpack_rejects_partial_records(lora):
+    with pytest.raises(ValueError, match="multiple of 5"):
+        lora.process({"unpack": "AAAAAA==", "encoding": "base64"})
+
+
+def test_single_record_errors(lora):
+    with pytest.raises(ValueError, match="Humidity out of range"):
+        lora.process(dict(GOOD, humidity=300))
+    with pytest.raises(KeyError):
+        lora.process({"temp": 1})
+
+
+def test_unknown_encoding(lora):
+    with pytest.raises(ValueError, match="Unknown encoding"):
+        lora.process(dict(GOOD, encoding="base85"))
+
+
+def test_numpy_layout_matches_struct(lora):
+    assert lora.RECORD_DTYPE.itemsize == lora.RECORD.size == 5
+    packed = np.zeros(1, dtype=lora.RECORD_DTYPE)
+    packed[0] = (-5, 200, -1234, 99)
+    assert packed.tobytes() == lora.RECORD.pack(-5, 200, -1234, 99)
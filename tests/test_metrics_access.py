@@ -0,0 +1,29 @@
+import pytest
+
+app_module = pytest.importorskip('app')
+
+
+@pytest.fixture
+def client():
+    app_module.app.config['TESTING'] = True
+    app_module.limiter.enabled = False
+    return app_module.app.test_client()
+
+
+def test_metrics_from_loopback(client):
+    response = client.get('/metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'})
+    assert response.status_code == 200
+    assert "dispatcher" in response.get_json()
+
+
+def test_metrics_refused_for_remote_callers(client, monkeypatch):
+    monkeypatch.delenv('METRICS_TOKEN', raising=False)
+    response = client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'})
+    assert response.status_code == 403
+
+
+def test_metrics_token_admits_remote_callers(client, monkeypatch):
+    monkeypatch.setenv('METRICS_TOKEN', 'ops-token')
+    remote = {'REMOTE_ADDR': '203.0.113.7'}
+    assert client.get('/metrics', environ_base=remote, headers={'X-Metrics-Token': 'wrong'}).status_code == 403
+    assert client.get('/metrics', environ_base=remote, headers={'X-Metrics-Token': 'ops-token'}).status_code == 200
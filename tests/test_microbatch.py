@@ -0,0 +1,122 @@
+import os
+import textwrap
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cell_loader import load_cells
+from dispatcher import CellDispatcher
+from microbatch import MicroBatcher
+
+
+class Recorder:
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.delay = delay
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        time.sleep(self.delay)
+        return [item * 10 for item in items]
+
+
+def test_concurrent_items_share_a_batch():
+    batch_fn = Recorder()
+    batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=200)
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(batcher.call, range(8)))
+    batcher.shutdown()
+    assert results == [i * 10 for i in range(8)]
+    assert len(batch_fn.batches) == 1 and sorted(batch_fn.batches[0]) == list(range(8))
+    stats = batcher.stats()
+    assert stats["batches"] == 1 and stats["fill_ratio"] == 1.0
+
+
+def test_batches_are_capped_at_max_batch_size():
+    batch_fn = Recorder()
+    batcher = MicroBatcher(batch_fn, max_batch_size=3, max_wait_ms=200)
+    futures = [batcher.submit(i) for i in range(7)]
+    assert [f.result(timeout=5) for f in futures] == [i * 10 for i in range(7)]
+    batcher.shutdown()
+    assert [len(batch) for batch in batch_fn.batches] == [3, 3, 1]
+
+
+def test_a_lone_item_waits_at_most_max_wait():
+    batcher = MicroBatcher(Recorder(), max_batch_size=16, max_wait_ms=20)
+    started = time.monotonic()
+    assert batcher.call(4) == 40
+    assert time.monotonic() - started < 1
+    assert batcher.stats()["max_queue_delay_ms"] >= 15
+    batcher.shutdown()
+
+
+def test_a_failing_batch_fails_every_caller():
+    def broken(items):
+        raise ValueError("model exploded")
+
+    batcher = MicroBatcher(broken, max_batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit(i) for i in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError, match="model exploded"):
+            future.result(timeout=5)
+    assert batcher.stats()["errors"] == 1
+    batcher.shutdown()
+
+
+def test_a_wrong_number_of_results_is_an_error():
+    batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=2, max_wait_ms=50)
+    futures = [batcher.submit(i) for i in range(2)]
+    with pytest.raises(RuntimeError, match="1 results for 2 inputs"):
+        futures[0].result(timeout=5)
+    batcher.shutdown()
+
+
+def test_worker_restarts_after_fork():
+    batcher = MicroBatcher(Recorder(), max_batch_size=1, max_wait_ms=0)
+    assert batcher.call(1) == 10
+    batcher._pid = os.getpid() + 1  # as seen from a forked child
+    assert batcher.call(2) == 20
+    batcher.shutdown()
+
+
+def _cells(tmp_path, concurrency):
+    cells_dir = tmp_path / "cells"
+    cells_dir.mkdir()
+    (cells_dir / "model.py").write_text(textwrap.dedent(f"""
+        CONCURRENCY = {concurrency!r}
+        MICRO_BATCH = True
+        BATCHES = []
+
+        def process(input_data):
+            return process_batch([input_data])[0]
+
+        def process_batch(inputs):
+            BATCHES.append(len(inputs))
+            return [{{"x": item["x"], "batch": len(inputs)}} for item in inputs]
+    """))
+    return load_cells(str(cells_dir))
+
+
+def test_dispatcher_micro_batches_single_inputs_across_requests(tmp_path, monkeypatch):
+    monkeypatch.setenv('MICRO_BATCH_MAX_WAIT_MS', '200')
+    monkeypatch.setenv('MICRO_BATCH_MAX_SIZE', '4')
+    dispatcher = CellDispatcher(_cells(tmp_path, 'stateless'))
+    assert list(dispatcher.micro_batchers) == ["model"]
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(
+            lambda i: dispatcher.run(["model"], {"model": {"x": i}}, i, f"s{i}")[0]["model"], range(4)
+        ))
+    dispatcher.shutdown()
+    assert [r["x"] for r in results] == [0, 1, 2, 3]
+    assert all(r["batch"] == 4 for r in results)
+
+    # An explicit batch bypasses the batcher
+    results, _, _ = dispatcher.run(["model"], {"model": [{"x": 1}, {"x": 2}]}, 1, "s1")
+    assert [r["batch"] for r in results["model"]] == [2, 2]
+
+
+def test_stateful_cells_are_not_micro_batched(tmp_path):
+    dispatcher = CellDispatcher(_cells(tmp_path, 'session'))
+    assert dispatcher.micro_batchers == {}
@@ -0,0 +1,90 @@
+import textwrap
+import threading
+import time
+
+from cell_loader import load_cells
+from dispatcher import CellDispatcher
+
+
+def _cells(tmp_path, sources):
+    cells_dir = tmp_path / "cells"
+    cells_dir.mkdir()
+    for name, source in sources.items():
+        (cells_dir / f"{name}.py").write_text(textwrap.dedent(source))
+    return load_cells(str(cells_dir))
+
+
+SLOW = """
+    import time
+    CONCURRENCY = 'stateless'
+
+    def process(input_data):
+        time.sleep(0.1)
+        return {"value": input_data.get("value")}
+"""
+
+
+def test_independent_cells_run_in_parallel(tmp_path):
+    dispatcher = CellDispatcher(_cells(tmp_path, {f"slow{i}": SLOW for i in range(4)}), max_parallel=4)
+    started = time.perf_counter()
+    results, execution_times, _ = dispatcher.run(
+        [f"slow{i}" for i in range(4)], {f"slow{i}": {"value": i} for i in range(4)}, 1, "s1"
+    )
+    elapsed = time.perf_counter() - started
+    dispatcher.shutdown()
+
+    assert elapsed < 0.3
+    assert results == {f"slow{i}": {"value": i} for i in range(4)}
+    assert set(execution_times) == set(results)
+
+
+def test_max_parallel_bounds_a_request(tmp_path):
+    dispatcher = CellDispatcher(_cells(tmp_path, {f"slow{i}": SLOW for i in range(4)}), max_parallel=2)
+    started = time.perf_counter()
+    dispatcher.run([f"slow{i}" for i in range(4)], {}, 1, "s1")
+    elapsed = time.perf_counter() - started
+    dispatcher.shutdown()
+    assert elapsed >= 0.2
+
+
+def test_results_keep_request_order_and_skip_unknown_cells(tmp_path):
+    dispatcher = CellDispatcher(_cells(tmp_path, {
+        "fast": "CONCURRENCY = 'stateless'\ndef process(input_data):\n    return {'cell': 'fast'}\n",
+        "slow": SLOW,
+    }), max_parallel=4)
+    results, _, _ = dispatcher.run(["slow", "missing", "fast", "slow"], {}, 1, "s1")
+    dispatcher.shutdown()
+    assert list(results) == ["slow", "fast"]
+
+
+def test_a_failing_cell_does_not_affect_the_others(tmp_path):
+    dispatcher = CellDispatcher(_cells(tmp_path, {
+        "broken": "CONCURRENCY = 'stateless'\ndef process(input_data):\n    raise RuntimeError('boom')\n",
+        "slow": SLOW,
+    }), max_parallel=4)
+    results, execution_times, _ = dispatcher.run(["broken", "slow"], {"slow": {"value": 1}}, 1, "s1")
+    dispatcher.shutdown()
+    assert results == {"broken": {"error": "boom"}, "slow": {"value": 1}}
+    assert list(execution_times) == ["slow"]
+
+
+def test_single_cell_requests_run_inline(tmp_path):
+    dispatcher = CellDispatcher(_cells(tmp_path, {
+        "where": "CONCURRENCY = 'stateless'\nimport threading\n"
+                 "def process(input_data):\n    return {'thread': threading.get_ident()}\n",
+    }), max_parallel=4)
+    results, _, _ = dispatcher.run(["where"], {}, 1, "s1")
+    assert results["where"]["thread"] == threading.get_ident()
+    assert dispatcher._pool is None
+
+
+def test_every_cell_gets_the_user_context(tmp_path):
+    dispatcher = CellDispatcher(_cells(tmp_path, {
+        name: "CONCURRENCY = 'stateless'\n"
+              "def process(input_data):\n    return dict(input_data['_user_context'])\n"
+        for name in ("a", "b")
+    }), max_parallel=4)
+    results, _, _ = dispatcher.run(["a", "b"], {}, 7, "s9")
+    dispatcher.shutdown()
+    for result in results.values():
+        assert result["user_id"] == 7 and result["session_id"] == "s9" and "timestamp" in result
@@ -0,0 +1,109 @@
+import os
+import importlib.util
+
+import numpy as np
+import pytest
+
+CELLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cells")
+
+
+@pytest.fixture
+def pid():
+    spec = importlib.util.spec_from_file_location('pid_controller_under_test', os.path.join(CELLS_DIR, 'pid_controller.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _call(pid, session='s1', **data):
+    return pid.process(dict(data, _user_context={'user_id': 1, 'session_id': session}))
+
+
+def test_scalar_mode_matches_the_q15_formula(pid):
+    result = pid.process({"error": 0.5, "last_error": 0.25, "integral": 1.0})
+    error, integral, derivative = 16384, 32768 + 16384, 16384 - 8192
+    assert result["output"] == (32768 * error + 1638 * integral + 6553 * derivative) // 32768 / 32768
+    assert result["integral"] == 1.5 and result["last_error"] == 0.5
+
+
+def test_bank_matches_chained_scalar_calls(pid):
+    errors = np.random.default_rng(0).uniform(-1, 1, size=(20, 3))
+    state = [{"last_error": 0.0, "integral": 0.0} for _ in range(3)]
+    for step in errors:
+        bank = _call(pid, controllers=["a", "b", "c"], errors=step.tolist())
+        for i, error in enumerate(step):
+            scalar = pid.process(dict(state[i], error=float(error)))
+            state[i] = {"last_error": scalar["last_error"], "integral": scalar["integral"]}
+            assert bank["outputs"][i] == scalar["output"]
+            assert bank["integral"][i] == scalar["integral"]
+
+
+def test_sessions_have_separate_state(pid):
+    _call(pid, 's1', controllers=["m"], errors=[1.0])
+    assert _call(pid, 's1', controllers=["m"], errors=[1.0])["integral"] == [2.0]
+    assert _call(pid, 's2', controllers=["m"], errors=[1.0])["integral"] == [1.0]
+
+
+def test_gains_and_reset(pid):
+    _call(pid, controllers=["m1", "m2"], errors=[0.5, 0.5])
+    result = _call(pid, controllers=["m1", "m2"], errors=[0.5, 0.5],
+                   gains={"m1": [2.0, 0.0, 0.0]}, reset=["m2"])
+    assert result["outputs"][0] == 1.0
+    assert result["integral"] == [1.0, 0.5]
+
+
+def test_rejected_calls_allocate_nothing(pid):
+    bad = [
+        dict(controllers=["a", "b"], errors=[0.1]),
+        dict(controllers=["a", "a"], errors=[0.1, 0.2]),
+        dict(controllers=["a"], errors=[float("nan")]),
+        dict(controllers=["a"], errors=[0.1], gains=[float("inf"), 0, 0]),
+        dict(controllers=["a"], errors=[0.1], gains={"b": [0, float("nan"), 0]}),
+    ]
+    for data in bad:
+        assert "error" in _call(pid, **data)
+    assert _call(pid, controllers=["z"], errors=[0.0])["active_controllers"] == 1
+
+
+@pytest.mark.parametrize("data", [
+    {"error": float("nan")},
+    {"error": 0.1, "integral": float("inf")},
+    {"error": 0.1, "gains": [1.0, float("nan"), 0.0]},
+    {"error": "x"},
+    {},
+])
+def test_scalar_mode_reports_invalid_input(pid, data):
+    result = pid.process(data)
+    assert result["output"] == 0.0 and result["error"].startswith("Invalid input")
+
+
+def test_controllers_per_session_are_bounded(pid, monkeypatch):
+    monkeypatch.setattr(pid, 'MAX_CONTROLLERS', 2)
+    _call(pid, controllers=["a", "b"], errors=[0, 0])
+    assert "exceed" in _call(pid, controllers=["c"], errors=[0])["error"]
+
+
+def test_sessions_are_bounded_least_recently_used_first(pid, monkeypatch):
+    monkeypatch.setattr(pid, 'MAX_SESSIONS', 2)
+    _call(pid, 's1', controllers=["m"], errors=[1.0])
+    _call(pid, 's2', controllers=["m"], errors=[1.0])
+    _call(pid, 's1', controllers=["m"], errors=[1.0])  # s2 is now the coldest
+    _call(pid, 's3', controllers=["m"], errors=[1.0])
+    assert [key[1] for key in pid._BANKS] == ['s1', 's3']
+    assert _call(pid, 's1', controllers=["m"], errors=[1.0])["integral"] == [3.0]
+    assert _call(pid, 's2', controllers=["m"], errors=[1.0])["integral"] == [1.0]
+
+
+def test_idle_sessions_expire(pid):
+    _call(pid, 's1', controllers=["m"], errors=[1.0])
+    _call(pid, 's2', controllers=["m"], errors=[1.0])
+    for bank in pid._BANKS.values():
+        bank.touched -= pid.CONTROLLER_TTL + 1
+    assert _call(pid, 's1', controllers=["m"], errors=[1.0])["integral"] == [1.0]
+    assert [key[1] for key in pid._BANKS] == ['s1']
+
+
+def test_large_gains_do_not_overflow(pid):
+    result = _call(pid, controllers=["m"], errors=[60000.0], gains=[60000.0, 60000.0, 60000.0])
+    scalar = pid.process({"error": 60000.0, "gains": [60000.0, 60000.0, 60000.0]})
+    assert result["outputs"] == [scalar["output"]]
@@ -0,0 +1,74 @@
+import os
+import textwrap
+
+from cell_loader import load_cells
+from dispatcher import CellDispatcher
+from scratch import RequestScratch
+
+
+def test_nothing_is_created_until_asked(tmp_path):
+    with RequestScratch("cell_1_", root=str(tmp_path)) as scratch:
+        assert scratch.path is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_directory_is_reused_then_removed(tmp_path):
+    with RequestScratch("cell_1_", root=str(tmp_path)) as scratch:
+        path = scratch.get()
+        assert scratch.get() == path
+        assert os.path.isdir(path) and os.path.basename(path).startswith("cell_1_")
+        with open(os.path.join(path, "frame.bin"), "wb") as f:
+            f.write(b"\0" * 16)
+    assert not os.path.exists(path)
+    assert scratch.path is None
+
+
+def test_removed_when_a_cell_raises(tmp_path):
+    try:
+        with RequestScratch("cell_1_", root=str(tmp_path)) as scratch:
+            scratch.get()
+            raise RuntimeError("cell failed")
+    except RuntimeError:
+        pass
+    assert os.listdir(tmp_path) == []
+
+
+def _write_cell(cells_dir, name, source):
+    (cells_dir / f"{name}.py").write_text(textwrap.dedent(source))
+
+
+def test_dispatcher_only_gives_scratch_to_cells_that_declare_it(tmp_path, monkeypatch):
+    import scratch
+    root = tmp_path / "scratch"
+    root.mkdir()
+    monkeypatch.setattr(scratch, 'SCRATCH_ROOT', str(root))
+    cells_dir = tmp_path / "cells"
+    cells_dir.mkdir()
+    _write_cell(cells_dir, "writer", """
+        import os
+        USES_SCRATCH = True
+        CONCURRENCY = 'stateless'
+
+        def process(input_data):
+            path = input_data['_user_context']['scratch_dir']
+            open(os.path.join(path, 'out'), 'w').close()
+            return {"scratch_dir": path, "files": os.listdir(path)}
+    """)
+    _write_cell(cells_dir, "reader", """
+        CONCURRENCY = 'stateless'
+
+        def process(input_data):
+            return {"has_scratch": 'scratch_dir' in input_data['_user_context']}
+    """)
+    dispatcher = CellDispatcher(load_cells(str(cells_dir)), max_parallel=1)
+
+    results, _, _ = dispatcher.run(["reader"], {}, 1, "s1")
+    assert results["reader"] == {"has_scratch": False}
+    assert os.listdir(root) == []
+
+    results, _, _ = dispatcher.run(["writer", "reader"], {}, 1, "s1")
+    assert results["writer"]["files"] == ["out"]
+    assert results["reader"] == {"has_scratch": False}
+    assert not os.path.exists(results["writer"]["scratch_dir"])
+    assert os.listdir(root) == []
+    dispatcher.shutdown()
@@ -0,0 +1,141 @@
+import os
+import importlib.util
+
+import numpy as np
+import pytest
+
+CELLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cells")
+
+
+@pytest.fixture
+def fusion():
+    spec = importlib.util.spec_from_file_location('sensor_fusion_under_test', os.path.join(CELLS_DIR, 'sensor_fusion.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _call(fusion, session='s1', **data):
+    return fusion.process(dict(data, _user_context={'user_id': 1, 'session_id': session}))
+
+
+STEP = {"imu": {"accel": [1.0, 0.5], "gyro": 0.1}, "gps": [0.2, 0.1], "dt": 0.1}
+
+
+def _sequential(steps):
+    """A filter that saw STEP `steps` times, as one session should"""
+    spec = importlib.util.spec_from_file_location('sensor_fusion_reference', os.path.join(CELLS_DIR, 'sensor_fusion.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    kf = module.KalmanFilter()
+    for _ in range(steps):
+        kf.predict(STEP["imu"]["accel"], STEP["imu"]["gyro"], STEP["dt"])
+        kf.update(np.array(STEP["gps"]))
+    return kf
+
+
+def test_state_carries_over_between_calls_of_a_session(fusion):
+    for _ in range(3):
+        result = _call(fusion, **STEP)
+    assert result["fused_state"] == pytest.approx(_sequential(3).x.tolist())
+
+
+def test_sessions_and_filter_ids_are_separate(fusion):
+    _call(fusion, 's1', **STEP)
+    _call(fusion, 's1', **STEP)
+    assert _call(fusion, 's2', **STEP)["fused_state"] == pytest.approx(_sequential(1).x.tolist())
+    assert _call(fusion, 's1', filter_id='arm', **STEP)["fused_state"] == pytest.approx(_sequential(1).x.tolist())
+
+
+def test_reset_and_stateless(fusion):
+    _call(fusion, **STEP)
+    assert _call(fusion, reset=True, **STEP)["fused_state"] == pytest.approx(_sequential(1).x.tolist())
+    assert _call(fusion, stateless=True, **STEP)["fused_state"] == pytest.approx(_sequential(1).x.tolist())
+    # The stateless call left the session's filter alone
+    assert _call(fusion, **STEP)["fused_state"] == pytest.approx(_sequential(2).x.tolist())
+
+
+def test_samples_run_in_time_order(fusion):
+    samples = [
+        {"imu": {"accel": [1.0, 0.0], "gyro": 0.0}, "gps": None, "t": 0.3},
+        {"imu": {"accel": [0.0, 1.0], "gyro": 0.0}, "gps": None, "t": 0.1, "dt": 0.1},
+        {"imu": {"accel": [0.0, 0.0], "gyro": 1.0}, "gps": [0.0, 0.1], "t": 0.2},
+    ]
+    result = _call(fusion, samples=samples, return_trajectory=True)
+    assert len(result["trajectory"]) == 3
+    assert result["trajectory"][0] == pytest.approx([0.0, 0.1, 0.0])
+    assert result["trajectory"][-1] == result["fused_state"]
+
+
+def test_filters_are_bounded_least_recently_used_first(fusion, monkeypatch):
+    monkeypatch.setattr(fusion, 'MAX_FILTERS', 2)
+    _call(fusion, 's1', **STEP)
+    _call(fusion, 's2', **STEP)
+    _call(fusion, 's1', **STEP)
+    _call(fusion, 's3', **STEP)
+    assert [key[1] for key in fusion._FILTERS] == ['s1', 's3']
+    assert _call(fusion, 's2', **STEP)["fused_state"] == pytest.approx(_sequential(1).x.tolist())
+
+
+def test_idle_filters_expire(fusion):
+    _call(fusion, 's1', **STEP)
+    key = next(iter(fusion._FILTERS))
+    kf, last_used = fusion._FILTERS[key]
+    fusion._FILTERS[key] = (kf, last_used - fusion.FILTER_TTL - 1)
+    assert _call(fusion, 's1', **STEP)["fused_state"] == pytest.approx(_sequential(1).x.tolist())
+
+
+def _fleet_step(n, rng):
+    return {
+        "imu": {"accel": rng.normal(size=(n, 2)).tolist(), "gyro": rng.normal(size=n).tolist()},
+        "gps": [None if i % 3 == 0 else z for i, z in enumerate(rng.normal(size=(n, 2)).tolist())],
+        "dt": rng.uniform(0.05, 0.2, size=n).tolist(),
+    }
+
+
+def test_fleet_matches_one_filter_per_track(fusion):
+    rng = np.random.default_rng(0)
+    tracks = [f"r{i}" for i in range(7)]
+    filters = [fusion.KalmanFilter() for _ in tracks]
+    for _ in range(5):
+        step = _fleet_step(len(tracks), rng)
+        result = _call(fusion, tracks=tracks, **step)
+        for i, kf in enumerate(filters):
+            kf.predict(step["imu"]["accel"][i], step["imu"]["gyro"][i], step["dt"][i])
+            if step["gps"][i] is not None:
+                kf.update(np.array(step["gps"][i]))
+    assert np.allclose(result["fused_state"], [kf.x for kf in filters])
+    assert np.allclose(result["covariance"], [kf.P.diagonal() for kf in filters])
+
+
+def test_fleet_tracks_keep_state_in_any_order(fusion):
+    _call(fusion, tracks=["a", "b"], gps=[[1.0, 1.0], [5.0, 5.0]])
+    result = _call(fusion, tracks=["b", "c"], gps=[None, None], imu={"accel": [0.0, 0.0], "gyro": 0.0})
+    assert result["fused_state"][0][0] > 2 and result["fused_state"][1] == [0.0, 0.0, 0.0]
+
+
+def test_fleet_batch_benchmark_agrees(fusion):
+    assert fusion.benchmark(50, 3)["max_abs_diff"] < 1e-9
+
+
+@pytest.mark.parametrize("data", [
+    {"tracks": ["a", "b"], "imu": {"accel": [[1, 0]] * 3, "gyro": [0, 0]}},
+    {"tracks": ["a", "b"], "imu": {"accel": [[1, 0]] * 2, "gyro": [0, 0, 0]}},
+    {"tracks": ["a", "b"], "imu": {"accel": [[1, 0]] * 2, "gyro": [0, 0]}, "dt": [0.1, 0.1, 0.1]},
+    {"tracks": ["a", "b"], "imu": {"accel": [[1, 0, 0]] * 2, "gyro": 0}},
+    {"tracks": ["a", "b"], "gps": [[1, 1]]},
+    {"tracks": ["a", "b"], "gps": [[1, 1, 1], None]},
+    {"tracks": ["a", "b"], "gps": [[1], [2]]},
+    {"tracks": ["a", "a"], "gps": [None, None]},
+])
+def test_rejected_fleet_calls_allocate_nothing(fusion, data):
+    with pytest.raises(ValueError):
+        _call(fusion, **data)
+    assert not fusion._FILTERS
+
+
+def test_fleet_size_is_bounded(fusion, monkeypatch):
+    monkeypatch.setattr(fusion, 'MAX_TRACKS', 2)
+    _call(fusion, tracks=["a", "b"])
+    with pytest.raises(ValueError, match="exceed"):
+        _call(fusion, tracks=["c"])
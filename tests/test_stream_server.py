@@ -0,0 +1,211 @@
+import json
+import time
+import socket
+
+import pytest
+from websockets.sync.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from stream_server import StreamServer
+
+KEYS = {
+    'good-key': {'user_id': 7, 'permissions': ['cells:execute']},
+    'read-only': {'user_id': 8, 'permissions': ['usage:read']},
+}
+
+
+class EchoDispatcher:
+    """Returns each cell's input with the caller's identity, like dispatcher.run"""
+
+    def __init__(self):
+        self.calls = []
+
+    def run(self, cell_names, input_data, user_id, session_id):
+        self.calls.append((cell_names, user_id, session_id))
+        if input_data.get('sleep'):
+            time.sleep(input_data['sleep'])
+        if input_data.get('fail'):
+            raise ValueError("cell failed")
+        results = {name: {'echo': input_data, 'user_id': user_id} for name in cell_names}
+        return results, {name: 0.001 for name in cell_names}, {}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def keys():
+    return dict(KEYS)
+
+
+@pytest.fixture
+def server(keys):
+    server = StreamServer(EchoDispatcher(), keys.get, host='127.0.0.1', port=_free_port(),
+                          auth_timeout=2, reauth_interval=60)
+    server.start()
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', server.port), timeout=0.2).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.02)
+    yield server
+    server.shutdown()
+
+
+def _url(server):
+    return f"ws://127.0.0.1:{server.port}"
+
+
+def _auth(ws, api_key='good-key', **extra):
+    ws.send(json.dumps({"type": "auth", "api_key": api_key, **extra}))
+    return json.loads(ws.recv(timeout=2))
+
+
+def _close_frame(ws):
+    """The close frame the server sent, once the socket is closed"""
+    with pytest.raises(ConnectionClosed) as closed:
+        ws.recv(timeout=2)
+    return closed.value.rcvd
+
+
+def _wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_auth_message_then_ordered_calls(server):
+    with connect(_url(server)) as ws:
+        ready = _auth(ws, session_id='s1')
+        assert ready == {"type": "ready", "user_id": 7, "session_id": "s1"}
+        for i in range(3):
+            ws.send(json.dumps({"id": i, "cells": ["pid_controller"], "data": {"n": i}}))
+        replies = [json.loads(ws.recv(timeout=2)) for _ in range(3)]
+
+    assert [r["id"] for r in replies] == [0, 1, 2]
+    assert replies[2]["results"]["pid_controller"] == {"echo": {"n": 2}, "user_id": 7}
+    assert server.dispatcher.calls[0] == (["pid_controller"], 7, "s1")
+
+
+def test_header_auth_skips_the_auth_message(server):
+    with connect(_url(server), additional_headers={'X-API-Key': 'good-key', 'X-Session-Id': 'hdr'}) as ws:
+        ready = json.loads(ws.recv(timeout=2))
+        assert ready["session_id"] == "hdr"
+        ws.send(json.dumps({"id": "a", "cells": ["math_utils"], "data": {}}))
+        assert json.loads(ws.recv(timeout=2))["success"] is True
+
+
+def test_unordered_results_are_tagged_by_id(server):
+    with connect(_url(server)) as ws:
+        _auth(ws, ordered=False)
+        ws.send(json.dumps({"id": "slow", "cells": ["c"], "data": {"sleep": 0.3}}))
+        ws.send(json.dumps({"id": "fast", "cells": ["c"], "data": {}}))
+        replies = [json.loads(ws.recv(timeout=2))["id"] for _ in range(2)]
+    assert replies == ["fast", "slow"]
+
+
+def test_cell_errors_and_bad_messages_keep_the_socket_open(server):
+    with connect(_url(server)) as ws:
+        _auth(ws)
+        ws.send(json.dumps({"id": 1, "cells": ["c"], "data": {"fail": True}}))
+        assert json.loads(ws.recv(timeout=2)) == {"id": 1, "success": False, "error": "cell failed"}
+        ws.send("not json")
+        assert json.loads(ws.recv(timeout=2))["success"] is False
+        ws.send(json.dumps({"id": 2, "cells": "c", "data": {}}))
+        assert json.loads(ws.recv(timeout=2))["error"] == "Invalid cells parameter"
+        ws.send(json.dumps({"id": 3, "cells": ["c"], "data": {}}))
+        assert json.loads(ws.recv(timeout=2))["success"] is True
+    assert server.counters["errors"] == 3
+
+
+@pytest.mark.parametrize("first_message, reason", [
+    ({"type": "auth", "api_key": "unknown"}, "Invalid API key"),
+    ({"type": "auth", "api_key": "read-only"}, "Insufficient permissions"),
+    ({"type": "auth"}, "API key required"),
+    ({"cells": ["c"]}, "First message must be"),
+])
+def test_failed_auth_closes_with_4401(server, first_message, reason):
+    with connect(_url(server)) as ws:
+        ws.send(json.dumps(first_message))
+        close = _close_frame(ws)
+    assert close.code == 4401
+    assert close.reason.startswith(reason)
+    assert server.counters["auth_failures"] == 1
+    assert server.counters["connections"] == 0
+
+
+def test_non_json_auth_message_closes_with_4401(server):
+    with connect(_url(server)) as ws:
+        ws.send("hello")
+        close = _close_frame(ws)
+    assert close.code == 4401
+
+
+def test_disconnect_during_auth_is_counted_not_raised(server):
+    ws = connect(_url(server))
+    ws.close()
+    _wait_for(lambda: server.counters["auth_failures"] == 1)
+    assert server.counters["open_connections"] == 0
+
+    # The server keeps accepting connections
+    with connect(_url(server)) as ws:
+        assert _auth(ws)["type"] == "ready"
+
+
+def test_revoked_key_closes_with_4401(server, keys):
+    server.reauth_interval = 0
+    with connect(_url(server)) as ws:
+        _auth(ws)
+        del keys['good-key']
+        ws.send(json.dumps({"id": 1, "cells": ["c"], "data": {}}))
+        close = _close_frame(ws)
+    assert close.code == 4401
+    assert server.counters["revoked"] == 1
+    _wait_for(lambda: server.counters["open_connections"] == 0)
+
+
+def test_key_moved_to_another_user_counts_as_revoked(server, keys):
+    server.reauth_interval = 0
+    with connect(_url(server)) as ws:
+        _auth(ws)
+        keys['good-key'] = {'user_id': 99, 'permissions': ['cells:execute']}
+        ws.send(json.dumps({"id": 1, "cells": ["c"], "data": {}}))
+        close = _close_frame(ws)
+    assert close.code == 4401
+
+
+def test_failing_reauth_closes_with_1011(server):
+    def unavailable(api_key):
+        raise RuntimeError("database unavailable")
+
+    with connect(_url(server)) as ws:
+        _auth(ws)
+        server.reauth_interval = 0
+        server.resolve_api_key = unavailable
+        ws.send(json.dumps({"id": 1, "cells": ["c"], "data": {}}))
+        close = _close_frame(ws)
+    assert close.code == 1011
+    assert "database unavailable" in close.reason
+
+
+def test_start_is_idempotent_and_port_zero_disables(monkeypatch):
+    server = StreamServer(EchoDispatcher(), KEYS.get, host='127.0.0.1', port=_free_port())
+    server.start()
+    thread = server._thread
+    server.start()
+    assert server._thread is thread
+    server.shutdown()
+
+    monkeypatch.setenv('STREAM_PORT', '0')
+    disabled = StreamServer(EchoDispatcher(), KEYS.get)
+    disabled.start()
+    assert disabled._thread is None
+    assert disabled.stats()["running"] is False
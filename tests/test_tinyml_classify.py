@@ -0,0 +1,146 @@
+import os
+import sys
+import types
+import importlib.util
+
+import numpy as np
+import pytest
+
+CELLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cells")
+
+
+class FixedBatchInterpreter:
+    """
+    Stands in for a model with a fixed batch dimension (e.g. a constant
+    Reshape([1, classes])): resize_tensor_input() is accepted, but
+    allocate_tensors() fails for any batch other than 1. As in TFLite, the
+    input tensor keeps the resized shape even when allocation fails.
+    """
+    CLASSES = 4
+
+    def __init__(self, model_path=None, num_threads=None):
+        self.shape = [1, 8, 8, 3]
+        self.allocated = False
+        self.output = None
+
+    def get_input_details(self):
+        return [{'index': 0, 'shape': np.array([1, 8, 8, 3]), 'dtype': np.uint8}]
+
+    def get_output_details(self):
+        return [{'index': 1}]
+
+    def resize_tensor_input(self, index, shape):
+        self.shape = list(shape)
+        self.allocated = False
+
+    def allocate_tensors(self):
+        if self.shape[0] != 1:
+            raise RuntimeError("Cannot reshape batch %d to [1, %d]" % (self.shape[0], self.CLASSES))
+        self.allocated = True
+
+    def set_tensor(self, index, value):
+        if not self.allocated or list(value.shape) != self.shape:
+            raise ValueError(f"Cannot set tensor: got {list(value.shape)}, expected {self.shape}")
+        self.output = np.eye(self.CLASSES, dtype=np.float32)[value.reshape(len(value), -1)[:, 0] % self.CLASSES]
+
+    def invoke(self):
+        pass
+
+    def get_tensor(self, index):
+        return self.output
+
+
+class DynamicBatchInterpreter(FixedBatchInterpreter):
+    """A model whose batch dimension can be resized to anything"""
+    invokes = []
+
+    def allocate_tensors(self):
+        self.allocated = True
+
+    def invoke(self):
+        self.invokes.append(self.shape[0])
+
+
+def _load(monkeypatch, interpreter_class):
+    runtime = types.ModuleType('tflite_runtime')
+    interpreter = types.ModuleType('tflite_runtime.interpreter')
+    interpreter.Interpreter = interpreter_class
+    runtime.interpreter = interpreter
+    monkeypatch.setitem(sys.modules, 'tflite_runtime', runtime)
+    monkeypatch.setitem(sys.modules, 'tflite_runtime.interpreter', interpreter)
+
+    spec = importlib.util.spec_from_file_location(
+        'tinyml_classify_under_test', os.path.join(CELLS_DIR, 'tinyml_classify.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def tinyml(monkeypatch):
+    return _load(monkeypatch, FixedBatchInterpreter)
+
+
+@pytest.fixture
+def dynamic(monkeypatch):
+    DynamicBatchInterpreter.invokes = []
+    return _load(monkeypatch, DynamicBatchInterpreter)
+
+
+def _image(value):
+    return np.full((8, 8, 3), value, dtype=np.uint8)
+
+
+def test_fixed_batch_model_falls_back_to_single_invokes(tinyml):
+    results = tinyml.process({"images": [_image(v) for v in (0, 1, 2, 3, 5)]})
+
+    assert results["status"] == "success"
+    assert [r["class_id"] for r in results["results"]] == [0, 1, 2, 3, 1]
+    assert tinyml._engine().dynamic is False
+
+
+def test_fixed_batch_model_keeps_working_after_fallback(tinyml):
+    tinyml.process({"images": [_image(1), _image(2)]})
+
+    # Same thread, same engine: later single and batched calls still succeed
+    assert tinyml.process({"image": _image(3)})["class_id"] == 3
+    batched = tinyml.process_batch([{"image": _image(2)}, {"image": _image(1)}])
+    assert [r["class_id"] for r in batched] == [2, 1]
+
+
+def test_images_are_classified_in_one_invoke(dynamic):
+    results = dynamic.process({"images": [_image(v) for v in (0, 1, 2, 3, 5)]})
+    assert [r["class_id"] for r in results["results"]] == [0, 1, 2, 3, 1]
+    assert DynamicBatchInterpreter.invokes == [5]
+
+
+def test_batches_are_split_at_max_batch(dynamic):
+    dynamic.MAX_BATCH = 2
+    dynamic.process({"images": [_image(v) for v in range(5)]})
+    assert DynamicBatchInterpreter.invokes == [2, 2, 1]
+
+
+def test_other_sizes_are_resized_and_grouped(dynamic):
+    images = [np.full((16, 12, 3), 1, dtype=np.uint8), _image(2), np.full((16, 12, 3), 3, dtype=np.uint8)]
+    results = dynamic.process({"images": images})["results"]
+    assert [r["class_id"] for r in results] == [1, 2, 3]
+    assert sorted(DynamicBatchInterpreter.invokes) == [1, 2]
+
+
+def test_grayscale_and_leading_batch_axis_are_accepted(dynamic):
+    assert dynamic.process({"image": np.full((8, 8), 2, dtype=np.uint8)})["class_id"] == 2
+    assert dynamic.process(_image(3)[None].tolist())["class_id"] == 3
+
+
+def test_unusable_images_fail_on_their_own(dynamic):
+    results = dynamic.process({"images": [_image(1), np.zeros((8, 8, 4), dtype=np.uint8), "junk"]})["results"]
+    assert results[0]["class_id"] == 1
+    assert [r["status"] for r in results] == ["success", "failed", "failed"]
+
+
+def test_process_batch_keeps_each_inputs_shape(dynamic):
+    results = dynamic.process_batch([{"image": _image(1)}, {"images": [_image(2), _image(3)]}, {}])
+    assert results[0]["class_id"] == 1
+    assert [r["class_id"] for r in results[1]["results"]] == [2, 3]
+    assert results[2]["status"] == "failed"
+    assert DynamicBatchInterpreter.invokes == [3]
@@ -0,0 +1,211 @@
+import os
+import json
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import usage_logger
+from usage_logger import UsageLogger
+
+
+class FakeDb:
+    def __init__(self):
+        self.fail = False
+
+    def __call__(self):
+        if self.fail:
+            raise RuntimeError("database unavailable")
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return self
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def written(monkeypatch):
+    rows = {"cell_usage": [], "user_sessions": []}
+
+    def execute_values(cur, sql, argslist, **kwargs):
+        table = "cell_usage" if "cell_usage" in sql else "user_sessions"
+        rows[table].extend(argslist)
+
+    monkeypatch.setattr(usage_logger, 'execute_values', execute_values)
+    return rows
+
+
+def _stalled(logger):
+    # No background worker: the queue only drains when a test says so
+    logger._pid = os.getpid()
+    return logger
+
+
+def _record(session_id='s1', executions=None, ts=1.0):
+    return {
+        "user_id": 1, "session_id": session_id, "ip_address": None, "user_agent": None,
+        "executions": executions if executions is not None else [["cell", "hash", 0.5, 1]], "ts": ts
+    }
+
+
+def _dead_pid():
+    child = subprocess.Popen([sys.executable, '-c', 'pass'])
+    child.wait()
+    return child.pid
+
+
+def test_batch_is_written_with_one_session_row(written):
+    logger = _stalled(UsageLogger(FakeDb(), batch_size=10))
+    logger.log_request(1, 's1', '10.0.0.1', 'robot', [('a', lambda: 'h1', 0.1, 1), ('b', 'h2', 0.2, 4)])
+    logger.log_request(1, 's1', '10.0.0.1', 'robot', [('a', 'h3', 0.1, 1)])
+
+    assert logger._write(logger._next_batch(0))
+    assert [row[2] for row in written["cell_usage"]] == ['h1', 'h2', 'h3']
+    assert len(written["user_sessions"]) == 1
+    assert logger.stats()["batches"] == 1 and logger.stats()["usage_rows"] == 3
+
+
+def test_drop_policy_counts_overflow(written):
+    logger = _stalled(UsageLogger(FakeDb(), max_queue=1, policy='drop'))
+    for _ in range(3):
+        logger.log_request(1, 's1', None, None, [('a', 'h', 0.1, 1)])
+    assert logger.stats()["enqueued"] == 1 and logger.stats()["dropped"] == 2
+
+
+def test_block_policy_waits_then_drops(written):
+    logger = _stalled(UsageLogger(FakeDb(), max_queue=1, policy='block', block_timeout=0.01))
+    logger.log_request(1, 's1', None, None, [('a', 'h', 0.1, 1)])
+    logger.log_request(1, 's1', None, None, [('a', 'h', 0.1, 1)])
+    assert logger.stats()["dropped"] == 1
+
+
+def test_spill_policy_writes_overflow_and_replays_it(tmp_path, written):
+    logger = _stalled(UsageLogger(FakeDb(), max_queue=1, policy='spill', spill_dir=str(tmp_path)))
+    logger.log_request(1, 's1', None, None, [('a', lambda: 'queued', 0.1, 1)])
+    logger.log_request(1, 's2', None, None, [('a', lambda: 'spilled', 0.1, 2)])
+    assert logger.stats()["spilled"] == 1
+    assert os.path.exists(logger._spill_path())
+
+    logger._replay_spill()
+
+    assert [row[2] for row in written["cell_usage"]] == ['spilled']
+    assert logger.stats()["replayed"] == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_failed_write_spills_the_batch(tmp_path, written):
+    db = FakeDb()
+    logger = _stalled(UsageLogger(db, policy='spill', spill_dir=str(tmp_path)))
+    db.fail = True
+    assert not logger._write([_record()])
+    assert logger.stats()["write_errors"] == 1 and logger.stats()["spilled"] == 1
+
+    db.fail = False
+    logger._replay_spill()
+    assert len(written["cell_usage"]) == 1
+
+
+def test_replay_skips_truncated_lines(tmp_path, written):
+    path = tmp_path / f"usage-spill-{_dead_pid()}.jsonl"
+    path.write_text(json.dumps(_record()) + "\n" + '{"user_id": 1, "sess')
+    logger = _stalled(UsageLogger(FakeDb(), policy='spill', spill_dir=str(tmp_path)))
+
+    logger._replay_spill()
+
+    assert len(written["cell_usage"]) == 1
+    assert logger.stats()["malformed"] == 1 and logger.stats()["replayed"] == 1
+
+
+def test_replay_picks_up_a_claim_abandoned_by_a_dead_worker(tmp_path, written):
+    path = tmp_path / f"usage-spill-{_dead_pid()}.jsonl.{_dead_pid()}.replay"
+    path.write_text(json.dumps(_record()) + "\n")
+    logger = _stalled(UsageLogger(FakeDb(), policy='drop', spill_dir=str(tmp_path)))
+
+    logger._replay_spill()
+
+    assert len(written["cell_usage"]) == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_spill_of_a_live_worker_is_left_alone(tmp_path, written):
+    live = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(5)'])
+    try:
+        path = tmp_path / f"usage-spill-{live.pid}.jsonl"
+        path.write_text(json.dumps(_record()) + "\n")
+        _stalled(UsageLogger(FakeDb(), policy='spill', spill_dir=str(tmp_path)))._replay_spill()
+        assert path.exists() and written["cell_usage"] == []
+    finally:
+        live.kill()
+        live.wait()
+
+
+def test_records_from_before_batch_sizes_are_accepted(tmp_path, written):
+    path = tmp_path / f"usage-spill-{_dead_pid()}.jsonl"
+    path.write_text(json.dumps(_record(executions=[["cell", "hash", 0.5]])) + "\n")
+    logger = _stalled(UsageLogger(FakeDb(), policy='spill', spill_dir=str(tmp_path)))
+
+    logger._replay_spill()
+
+    assert written["cell_usage"][0][5] is None
+    assert logger.stats()["malformed"] == 0
+
+
+def test_malformed_record_does_not_sink_the_batch(written):
+    logger = _stalled(UsageLogger(FakeDb()))
+    batch = [_record(executions=[["broken"]]), _record(session_id='s2'), "not a record"]
+    assert logger._write(batch)
+    assert len(written["cell_usage"]) == 1
+    assert logger.stats()["malformed"] == 2
+
+
+def test_worker_survives_an_unexpected_error(written, monkeypatch):
+    logger = UsageLogger(FakeDb(), flush_interval=0.01)
+    calls = []
+    real_write = logger._write
+
+    def flaky_write(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise RuntimeError("unexpected")
+        return real_write(batch)
+
+    monkeypatch.setattr(logger, '_write', flaky_write)
+    logger.log_request(1, 's1', None, None, [('a', 'h1', 0.1, 1)])
+    deadline = threading.Event()
+    for _ in range(100):
+        if logger.stats()["worker_errors"]:
+            break
+        deadline.wait(0.01)
+    logger.log_request(1, 's1', None, None, [('a', 'h2', 0.1, 1)])
+    for _ in range(100):
+        if written["cell_usage"]:
+            break
+        deadline.wait(0.01)
+    logger.shutdown()
+
+    assert logger.stats()["worker_errors"] == 1
+    assert [row[2] for row in written["cell_usage"]] == ['h2']
+
+
+def test_counters_are_consistent_under_concurrency(written):
+    logger = _stalled(UsageLogger(FakeDb(), max_queue=100000, policy='drop'))
+
+    def produce():
+        for _ in range(2000):
+            logger.log_request(1, 's1', None, None, [])
+
+    threads = [threading.Thread(target=produce) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert logger.stats()["enqueued"] == 16000
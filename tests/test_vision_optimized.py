@@ -0,0 +1,90 @@
+import os
+import importlib.util
+import threading
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+CELLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cells")
+CENTRES = [(60, 60), (200, 150)]
+
+
+@pytest.fixture
+def vision():
+    spec = importlib.util.spec_from_file_location('vision_optimized_under_test', os.path.join(CELLS_DIR, 'vision_optimized.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _frame(channels=3):
+    gray = np.zeros((240, 320), dtype=np.uint8)
+    for centre in CENTRES:
+        cv2.circle(gray, centre, 20, 255, -1)
+    return np.repeat(gray[..., None], channels, axis=2) if channels else gray
+
+
+def _centres(result):
+    return sorted((round(k["x"]), round(k["y"])) for k in result["keypoints"])
+
+
+def test_detects_blobs_in_rgb_gray_and_list_images(vision):
+    for image in (_frame(), _frame(0), _frame().tolist()):
+        result = vision.process({"image": image})
+        assert result["objects"] == 2
+        assert _centres(result) == CENTRES
+
+
+def test_roi_results_are_in_full_image_coordinates(vision):
+    result = vision.process({"image": _frame(), "roi": [150, 100, 120, 120]})
+    assert _centres(result) == [CENTRES[1]]
+
+
+def test_downscale_results_are_in_full_image_coordinates(vision):
+    result = vision.process({"image": _frame(), "downscale": 0.5})
+    assert result["objects"] == 2
+    for (x, y), centre in zip(_centres(result), CENTRES):
+        assert abs(x - centre[0]) <= 2 and abs(y - centre[1]) <= 2
+    assert abs(result["keypoints"][0]["size"] - 40) < 4
+
+
+def test_min_area_filters_small_blobs(vision):
+    assert vision.process({"image": _frame(), "min_area": 5000})["objects"] == 0
+
+
+def test_timings_cover_every_stage(vision):
+    result = vision.process({"image": _frame(), "downscale": 0.5})
+    assert list(result["timings_ms"]) == ["decode", "grayscale", "downscale", "canny", "blob_detect"]
+    assert result["processing_time_ms"] >= sum(result["timings_ms"].values()) - 0.01
+
+
+@pytest.mark.parametrize("data, error", [
+    ({"downscale": 0}, ValueError),
+    ({"downscale": 2}, ValueError),
+    ({"roi": [400, 400, 10, 10]}, ValueError),
+    ({"canny": [1]}, ValueError),
+])
+def test_invalid_options_are_rejected(vision, data, error):
+    with pytest.raises(error):
+        vision.process(dict(data, image=_frame()))
+
+
+def test_missing_image(vision):
+    assert vision.process({}) == {"error": "No image data"}
+    assert vision.process({"image": []}) == {"error": "No image data"}
+
+
+def test_detectors_are_cached_per_thread_and_bounded(vision):
+    first = vision._detector(100.0, None)
+    assert vision._detector(100.0, None) is first
+    for area in range(vision._MAX_DETECTORS + 5):
+        vision._detector(float(area + 1), None)
+    assert len(vision._local.detectors) == vision._MAX_DETECTORS
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(vision._detector(100.0, None)))
+    thread.start()
+    thread.join()
+    assert other[0] is not first
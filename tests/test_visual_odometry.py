@@ -0,0 +1,116 @@
+import os
+import importlib.util
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+CELLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cells")
+
+
+@pytest.fixture
+def vo():
+    spec = importlib.util.spec_from_file_location('visual_odometry_under_test', os.path.join(CELLS_DIR, 'visual_odometry.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _scene(size=(240, 320)):
+    rng = np.random.default_rng(0)
+    texture = cv2.GaussianBlur(rng.integers(0, 256, (size[0] + 80, size[1] + 80), dtype=np.uint8), (5, 5), 0)
+    return cv2.normalize(texture, None, 0, 255, cv2.NORM_MINMAX)
+
+
+def _view(scene, dx=0.0, dy=0.0, angle=0.0, size=(240, 320)):
+    """The camera image after the content moved by (dx, dy) and rotated by `angle` about the centre"""
+    h, w = size
+    centre = ((w - 1) / 2 + 40, (h - 1) / 2 + 40)
+    matrix = cv2.getRotationMatrix2D(centre, angle, 1.0)
+    matrix[:, 2] += (dx, dy)
+    moved = cv2.warpAffine(scene, matrix, (scene.shape[1], scene.shape[0]), flags=cv2.INTER_LINEAR)
+    return moved[40:40 + h, 40:40 + w]
+
+
+def _call(vo, session='s1', **data):
+    return vo.process(dict(data, _user_context={'user_id': 1, 'session_id': session}))
+
+
+def test_first_frame_initializes_then_motion_is_tracked(vo):
+    scene = _scene()
+    first = _call(vo, image=_view(scene))
+    assert first["initialized"] and first["features"] > 0
+
+    second = _call(vo, image=_view(scene, dx=4, dy=-3))
+    assert second["frame"] == 2
+    assert second["delta_x"] == pytest.approx(4, abs=0.3) and second["delta_y"] == pytest.approx(-3, abs=0.3)
+
+    third = _call(vo, image=_view(scene, dx=8, dy=-6))
+    assert third["pose"]["x"] == pytest.approx(8, abs=0.5) and third["pose"]["y"] == pytest.approx(-6, abs=0.5)
+
+
+def test_rotation_about_the_centre_reports_no_translation(vo):
+    scene = _scene()
+    result = vo.process({"prev_image": _view(scene), "image": _view(scene, angle=3)})
+    # getRotationMatrix2D turns counter-clockwise on screen: -3 degrees in image coordinates
+    assert result["rotation_deg"] == pytest.approx(-3, abs=0.3)
+    assert abs(result["delta_x"]) < 0.5 and abs(result["delta_y"]) < 0.5
+
+
+def test_sessions_and_streams_are_separate(vo):
+    scene = _scene()
+    _call(vo, 's1', image=_view(scene))
+    assert _call(vo, 's2', image=_view(scene, dx=4))["initialized"]
+    assert _call(vo, 's1', stream_id='left', image=_view(scene, dx=4))["initialized"]
+    assert _call(vo, 's1', image=_view(scene, dx=4))["delta_x"] == pytest.approx(4, abs=0.3)
+
+
+def test_reset_and_size_change_start_over(vo):
+    scene = _scene()
+    _call(vo, image=_view(scene))
+    assert _call(vo, image=_view(scene, dx=2), reset=True)["initialized"]
+    assert _call(vo, image=_view(scene, size=(120, 160), dx=2))["initialized"]
+
+
+def test_prev_image_is_stateless(vo):
+    scene = _scene()
+    result = _call(vo, prev_image=_view(scene), image=_view(scene, dx=-5))
+    assert result["delta_x"] == pytest.approx(-5, abs=0.3)
+    assert not vo._TRACKS
+
+
+def test_farneback_mode(vo):
+    scene = _scene()
+    result = vo.process({"mode": "farneback", "prev_image": _view(scene), "image": _view(scene, dx=3, dy=2)})
+    assert result["delta_x"] == pytest.approx(3, abs=0.5) and result["delta_y"] == pytest.approx(2, abs=0.5)
+
+
+def test_a_featureless_frame_reports_no_motion(vo):
+    flat = np.full((120, 160), 128, dtype=np.uint8)
+    result = vo.process({"prev_image": flat, "image": flat})
+    assert result["tracked"] == 0 and result["delta_x"] == 0.0
+
+
+@pytest.mark.parametrize("data, error", [
+    ({"mode": "sift", "image": np.zeros((8, 8), np.uint8)}, ValueError),
+    ({}, KeyError),
+    ({"image": np.zeros((8, 8, 3, 1), np.uint8)}, ValueError),
+    ({"image": np.zeros((8, 8), np.uint8), "prev_image": np.zeros((4, 4), np.uint8)}, ValueError),
+])
+def test_invalid_inputs(vo, data, error):
+    with pytest.raises(error):
+        _call(vo, **data)
+
+
+def test_tracks_are_bounded_and_expire(vo, monkeypatch):
+    monkeypatch.setattr(vo, 'MAX_TRACKS', 2)
+    frame = _view(_scene())
+    for session in ('s1', 's2', 's1', 's3'):
+        _call(vo, session, image=frame)
+    assert [key[1] for key in vo._TRACKS] == ['s1', 's3']
+
+    key = next(iter(vo._TRACKS))
+    track, last_used = vo._TRACKS[key]
+    vo._TRACKS[key] = (track, last_used - vo.TRACK_TTL - 1)
+    assert _call(vo, 's1', image=frame)["initialized"]
@@ -0,0 +1,303 @@
+import os
+import glob
+import json
+import time
+import queue
+import tempfile
+import threading
+
+from psycopg2.extras import execute_values
+
+POLICIES = ('drop', 'block', 'spill')
+
+
+class UsageLogger:
+    """
+    Asynchronous, batched writer for cell_usage and user_sessions.
+
+    Request handlers call log_request(), which only enqueues a record. A
+    per-worker background thread drains the queue and writes each batch with
+    two multi-row statements (one INSERT into cell_usage, one upsert into
+    user_sessions), so database latency is no longer part of the response.
+
+    When the queue is full the backpressure policy decides what happens:
+      drop  - discard the record and count it
+      block - wait up to `block_timeout` seconds for room, then drop
+      spill - append the record to a per-process JSONL file that the worker
+              replays once the queue has drained
+    """
+
+    def __init__(self, get_db, max_queue=None, batch_size=None, flush_interval=None,
+                 policy=None, block_timeout=None, spill_dir=None):
+        self.get_db = get_db
+        self.max_queue = int(max_queue or os.getenv('USAGE_LOG_QUEUE_SIZE', 10000))
+        self.batch_size = int(batch_size or os.getenv('USAGE_LOG_BATCH_SIZE', 500))
+        self.flush_interval = float(
+            flush_interval if flush_interval is not None
+            else os.getenv('USAGE_LOG_FLUSH_INTERVAL', 1)
+        )
+        self.policy = policy or os.getenv('USAGE_LOG_POLICY', 'drop')
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown usage log policy '{self.policy}', expected one of {POLICIES}")
+        self.block_timeout = float(
+            block_timeout if block_timeout is not None
+            else os.getenv('USAGE_LOG_BLOCK_TIMEOUT', 0.05)
+        )
+        self.spill_dir = spill_dir or os.getenv('USAGE_LOG_SPILL_DIR', tempfile.gettempdir())
+        self._spill_lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pid = None
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self.counters = {
+            "enqueued": 0, "dropped": 0, "spilled": 0, "replayed": 0,
+            "batches": 0, "usage_rows": 0, "session_rows": 0, "write_errors": 0,
+            "malformed": 0, "worker_errors": 0
+        }
+
+    def _count(self, name, n=1):
+        # Updated from request threads and the worker alike
+        with self._counters_lock:
+            self.counters[name] += n
+
+    # Producer side
+    def log_request(self, user_id, session_id, ip_address, user_agent, executions):
+        """
+        Queue the usage of one request.
+        executions: [(cell_name, input_hash, execution_time, batch_size), ...]
+        input_hash may be a zero-argument callable; it is resolved on the
+        worker thread, keeping fingerprinting off the request path.
+        """
+        self._ensure_worker()
+        record = {
+            "user_id": user_id,
+            "session_id": session_id,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "executions": list(executions),
+            "ts": time.time()
+        }
+        try:
+            if self.policy == 'block':
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+            self._count("enqueued")
+        except queue.Full:
+            if self.policy == 'spill':
+                self._spill([record])
+            else:
+                self._count("dropped")
+
+    def _ensure_worker(self):
+        # Started lazily so each forked worker owns its queue and thread
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            threading.Thread(target=self._run, name='usage-logger', daemon=True).start()
+
+    # Consumer side
+    def _run(self):
+        # Whatever earlier workers left behind, whatever the current policy
+        try:
+            self._replay_spill()
+        except Exception as e:
+            self._count("worker_errors")
+            print(f"Usage log spill replay failed: {str(e)}")
+        while not self._stop.is_set():
+            try:
+                batch = self._next_batch(self.flush_interval)
+                if batch:
+                    self._write(batch)
+                elif self.policy == 'spill':
+                    self._replay_spill()
+            except Exception as e:
+                # Never let one bad iteration end logging for the process
+                self._count("worker_errors")
+                print(f"Usage logger error: {str(e)}")
+                time.sleep(min(self.flush_interval, 1))
+
+    def _next_batch(self, timeout):
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        usage_rows = []
+        sessions = {}
+        for record in batch:
+            try:
+                rows = [
+                    (record["user_id"], cell_name, _resolve(input_hash),
+                     record["session_id"], exec_time, batch_size, record["ts"])
+                    for cell_name, input_hash, exec_time, batch_size in map(_execution, record["executions"])
+                ]
+            except Exception as e:
+                # A malformed record (or a failing fingerprint) is dropped on its own
+                self._count("malformed")
+                print(f"Skipping malformed usage record: {str(e)}")
+                continue
+            usage_rows.extend(rows)
+            # ON CONFLICT can't touch the same row twice in one statement
+            previous = sessions.get(record["session_id"])
+            if previous is None or previous[4] < record["ts"]:
+                sessions[record["session_id"]] = (
+                    record["session_id"], record["user_id"],
+                    record["ip_address"], record["user_agent"], record["ts"]
+                )
+
+        try:
+            with self.get_db() as conn:
+                with conn.cursor() as cur:
+                    if usage_rows:
+                        execute_values(cur, """
+                            INSERT INTO cell_usage
+                            (user_id, cell_name, input_hash, session_id, execution_time, batch_size, timestamp)
+                            VALUES %s
+                        """, usage_rows,
+                            template="(%s, %s, %s, %s, %s, %s, to_timestamp(%s)::timestamp)",
+                            page_size=self.batch_size)
+
+                    execute_values(cur, """
+                        INSERT INTO user_sessions
+                        (session_id, user_id, ip_address, user_agent, last_active)
+                        VALUES %s
+                        ON CONFLICT (session_id)
+                        DO UPDATE SET last_active = GREATEST(user_sessions.last_active, EXCLUDED.last_active)
+                    """, sorted(sessions.values()),
+                        template="(%s, %s, %s, %s, to_timestamp(%s)::timestamp)",
+                        page_size=self.batch_size)
+
+                    conn.commit()
+        except Exception as e:
+            self._count("write_errors")
+            print(f"Usage log write failed for {len(batch)} records: {str(e)}")
+            if self.policy == 'spill':
+                self._spill(batch)
+            else:
+                self._count("dropped", len(batch))
+            return False
+
+        self._count("batches")
+        self._count("usage_rows", len(usage_rows))
+        self._count("session_rows", len(sessions))
+        return True
+
+    # Spill file handling
+    def _spill_path(self, pid=None):
+        return os.path.join(self.spill_dir, f"usage-spill-{pid or os.getpid()}.jsonl")
+
+    def _spill(self, records):
+        try:
+            with self._spill_lock:
+                with open(self._spill_path(), 'a') as f:
+                    for record in records:
+                        record["executions"] = [
+                            (cell_name, _resolve(input_hash), exec_time, batch_size)
+                            for cell_name, input_hash, exec_time, batch_size in map(_execution, record["executions"])
+                        ]
+                        f.write(json.dumps(record) + "\n")
+            self._count("spilled", len(records))
+        except OSError as e:
+            self._count("dropped", len(records))
+            print(f"Usage log spill failed: {str(e)}")
+
+    def _spill_files(self):
+        """(path, owning pid) for spill files, and for replays a dead worker left half done"""
+        for path in glob.glob(os.path.join(self.spill_dir, "usage-spill-*.jsonl")):
+            yield path, int(path.rsplit('-', 1)[1].split('.')[0])
+        for path in glob.glob(os.path.join(self.spill_dir, "usage-spill-*.jsonl.*.replay")):
+            yield path, int(path.rsplit('.', 2)[1])
+
+    def _replay_spill(self):
+        for path, pid in list(self._spill_files()):
+            if pid != os.getpid() and _pid_alive(pid):
+                continue  # Still owned by a live worker
+
+            # Claim the file atomically; later spills start a fresh one
+            base = path.split('.jsonl', 1)[0] + '.jsonl'
+            claimed = f"{base}.{os.getpid()}.replay"
+            with self._spill_lock:
+                try:
+                    os.rename(path, claimed)
+                except OSError:
+                    continue
+
+            records = []
+            with open(claimed) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # e.g. a line cut short by a crash mid-write
+                        self._count("malformed")
+            ok = True
+            for i in range(0, len(records), self.batch_size):
+                ok = self._write(records[i:i + self.batch_size]) and ok
+            if ok:
+                self._count("replayed", len(records))
+            os.remove(claimed)
+
+    # Shutdown
+    def shutdown(self, timeout=5.0):
+        """Stop the worker and write whatever is still queued"""
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            batch = self._next_batch(0)
+            if not batch:
+                break
+            self._write(batch)
+        if not self._queue.empty():
+            leftover = self._next_batch(0)
+            while leftover:
+                if self.policy == 'spill':
+                    self._spill(leftover)
+                else:
+                    self._count("dropped", len(leftover))
+                leftover = self._next_batch(0)
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self.counters)
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self.max_queue,
+            "policy": self.policy,
+            **counters
+        }
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _execution(entry):
+    # Spill files written before batch sizes were logged hold 3-tuples
+    if len(entry) == 3:
+        return (*entry, None)
+    return entry
+
+
+def _resolve(input_hash):
+    return input_hash() if callable(input_hash) else input_hash